@@ -36,6 +36,28 @@ echo "📁 Current directory: $(pwd)"
 # Add src to Python path so relative imports work
 export PYTHONPATH="/app:/app/src:$PYTHONPATH"
 
+# Start the shared embedding server so the init script and every Streamlit
+# process use one resident copy of the embedding model
+echo "🧠 Starting embedding server..."
+export RAG_EMBEDDING_SERVER="${RAG_EMBEDDING_SERVER:-/tmp/rag-embedding-server-$(id -u)/server.sock}"
+python src/embedding_server.py &
+EMBEDDING_SERVER_PID=$!
+
+# Wait for the model to load and the socket to appear, otherwise the init
+# script would load a second copy of the model in-process
+echo "⏳ Waiting for embedding server..."
+while [ ! -S "$RAG_EMBEDDING_SERVER" ]; do
+    if ! kill -0 "$EMBEDDING_SERVER_PID" 2>/dev/null; then
+        echo "⚠️  Embedding server exited! Continuing with in-process embeddings..."
+        break
+    fi
+    sleep 2
+    echo "   Still waiting for embedding server..."
+done
+if [ -S "$RAG_EMBEDDING_SERVER" ]; then
+    echo "✅ Embedding server is ready!"
+fi
+
 # Pre-initialize vector database (skip if script doesn't exist)
 if [ -f "scripts/initialize_vectordb.py" ]; then
     echo "🗄️  Initializing vector database..."
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Answer a questionnaire of questions in bulk.
+
+Reads questions from a CSV file (a "question" column, optionally "id" and
+any other columns, which are copied to the output) or a JSONL file of
+objects. Writes one row per question with the answer, its sources and
+chunk counts to a CSV or JSONL output, depending on the output extension.
+
+All questions are embedded in one call and retrieved with one matrix query.
+Distinct (question, chunk) pairs are graded once, in one call per question
+with RAG_GRADING_MODE=batch and one call per pair otherwise, with at most
+--concurrency grading and generation calls in flight. Rows are appended as answers
+complete and checkpointed every --batch-size questions. Running the same
+command again resumes where an interrupted run stopped, e.g.:
+
+    python scripts/batch_qa.py questionnaire.csv answers.csv --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+# Add both the project root and src directory to Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+sys.path.append(os.path.join(project_root, 'src'))
+
+
+def main():
+    from config import (
+        get_embeddings,
+        get_llm,
+        LLM_MAX_CONCURRENCY,
+        CONTEXT_MAX_TOKENS,
+        CONTEXT_TOKENIZER,
+        GRADING_MODE,
+        RETRIEVAL_K,
+        SIMILARITY_ACCEPT_THRESHOLD,
+        SIMILARITY_REJECT_THRESHOLD,
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Questions as .csv or .jsonl")
+    parser.add_argument("output", help="Answers as .csv or .jsonl")
+    parser.add_argument("--batch-size", type=int, default=32, help="Questions answered between checkpoints")
+    parser.add_argument("--concurrency", type=int, default=LLM_MAX_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--k", type=int, default=RETRIEVAL_K, help="Chunks retrieved per question")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and overwrite the output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    from agents.batch_qa import BatchQuestionAnswerer, ResultWriter, read_questions
+    from agents.chains import create_rag_chain
+    from agents.context import ContextBuilder, create_token_counter
+    from agents.graders import create_batch_document_grader, create_document_grader
+    from data_preprocess.document_loader import setup_retriever_tool
+    from main import load_vectorstore
+
+    rows = read_questions(args.input)
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    writer = ResultWriter(args.output, columns, restart=args.restart)
+
+    embeddings = get_embeddings()
+    llm = get_llm()
+    retriever, _ = setup_retriever_tool(load_vectorstore(embeddings))
+    answerer = BatchQuestionAnswerer(
+        retriever,
+        embeddings,
+        create_document_grader(llm),
+        create_rag_chain(llm),
+        ContextBuilder(create_token_counter(llm, CONTEXT_TOKENIZER), CONTEXT_MAX_TOKENS),
+        k=args.k,
+        accept_threshold=SIMILARITY_ACCEPT_THRESHOLD,
+        reject_threshold=SIMILARITY_REJECT_THRESHOLD,
+        max_concurrency=args.concurrency,
+        batch_grader=create_batch_document_grader(llm) if GRADING_MODE == "batch" else None,
+    )
+
+    started = time.perf_counter()
+    try:
+        stats = asyncio.run(answerer.arun(rows, writer, batch_size=args.batch_size))
+    finally:
+        writer.close()
+    wall_seconds = time.perf_counter() - started
+    print(
+        json.dumps(
+            {
+                **stats,
+                "wall_s": round(wall_seconds, 3),
+                "questions_per_s": round(stats["answered"] / wall_seconds, 3) if wall_seconds else None,
+            },
+            indent=2,
+        )
+    )
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
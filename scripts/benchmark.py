@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Retrieval and answer quality benchmark with latency tracking.
+
+Runs a versioned question set (benchmarks/questions) through a freshly built
+index and the full workflow. Reports recall@k, MRR, grader precision,
+per-node p50/p95 latency and ingestion throughput, and writes them to a JSON
+file that can be compared with earlier runs (--compare).
+
+By default the chat model is the deterministic offline stub
+(RAG_LLM_BACKEND=stub), and the index is built in a scratch directory, so
+runs need neither Ollama nor an existing database.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add both the project root and src directory to Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+sys.path.append(os.path.join(project_root, 'src'))
+
+import numpy as np
+
+DEFAULT_QUESTIONS = os.path.join(project_root, "benchmarks", "questions", "nist_v1.json")
+RESULTS_DIR = os.path.join(project_root, "benchmarks", "results")
+RECALL_KS = (1, 3, 5, 10)
+
+# Compared metrics: quality regresses when it drops, timings when they grow
+QUALITY_METRICS = ("mrr", "grader_precision", "answered_rate")
+TIMING_METRICS = ("p50", "p95")
+
+
+def _locations(doc):
+    """(source file, page) of a chunk and of every near-duplicate collapsed into it"""
+    metadata = doc.metadata
+    entries = [metadata] + json.loads(metadata.get("duplicates") or "[]")
+    return {
+        (os.path.basename(str(entry.get("source", ""))).lower(), entry.get("page"))
+        for entry in entries
+    }
+
+
+def _expected_locations(question):
+    return {
+        (expected["source"].lower(), page)
+        for expected in question["expected"]
+        for page in expected["pages"]
+    }
+
+
+def _is_relevant(doc, expected):
+    return bool(_locations(doc) & expected)
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    return {
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p95": round(float(np.percentile(values, 95)), 4),
+        "mean": round(float(np.mean(values)), 4),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception as e:
+        return None
+
+
+def prepare_workdir(workdir):
+    """Run from ``workdir`` so the index and caches stay out of the real data directory"""
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    documents = os.path.join(workdir, "data", "documents")
+    if not os.path.exists(documents):
+        os.symlink(os.path.join(project_root, "data", "documents"), documents)
+    os.environ["RAG_CHROMA_DIR"] = os.path.join(workdir, "data", "chroma_db")
+    os.chdir(workdir)
+
+
+def run_ingestion(paths):
+    """Build (or sync) the index and measure ingestion throughput"""
+    from pypdf import PdfReader
+
+    from config import get_embeddings, get_chroma_persist_directory, STREAMING_INGEST
+    from data_preprocess.document_loader import (
+        load_documents,
+        split_documents,
+        create_vectorstore,
+        ingest_streaming,
+    )
+
+    cold = not os.listdir(get_chroma_persist_directory())
+    embeddings = get_embeddings()
+    started = time.perf_counter()
+    if STREAMING_INGEST:
+        vectorstore = ingest_streaming(paths, embeddings)
+    else:
+        doc_splits = split_documents(load_documents(paths))
+        vectorstore = create_vectorstore(doc_splits, embeddings)
+    seconds = time.perf_counter() - started
+
+    pages = sum(len(PdfReader(path).pages) for path in paths)
+    chunks = vectorstore._collection.count()
+    return vectorstore, {
+        "cold": cold,
+        "files": len(paths),
+        "pages": pages,
+        "chunks": chunks,
+        "seconds": round(seconds, 3),
+        "pages_per_s": round(pages / seconds, 2) if seconds else None,
+        "chunks_per_s": round(chunks / seconds, 2) if seconds else None,
+    }
+
+
+def evaluate_retrieval(retriever, questions, max_k):
+    """Rank-based metrics of the retriever alone, before grading"""
+    from agents.nodes import _retrieve_with_scores
+
+    per_question = []
+    for question in questions:
+        expected = _expected_locations(question)
+        started = time.perf_counter()
+        documents, _ = _retrieve_with_scores(retriever, question["question"], k=max_k)
+        latency = time.perf_counter() - started
+
+        first_hit = next((rank for rank, doc in enumerate(documents, 1) if _is_relevant(doc, expected)), None)
+        recall = {}
+        for k in RECALL_KS:
+            found = set().union(*(_locations(doc) for doc in documents[:k])) if documents[:k] else set()
+            recall[f"recall@{k}"] = round(len(found & expected) / len(expected), 4)
+        per_question.append(
+            {
+                "id": question["id"],
+                "first_relevant_rank": first_hit,
+                "reciprocal_rank": round(1.0 / first_hit, 4) if first_hit else 0.0,
+                "retrieval_latency_s": round(latency, 4),
+                **recall,
+            }
+        )
+
+    summary = {
+        key: round(float(np.mean([q[key] for q in per_question])), 4)
+        for key in [f"recall@{k}" for k in RECALL_KS]
+    }
+    summary["mrr"] = round(float(np.mean([q["reciprocal_rank"] for q in per_question])), 4)
+    summary["latency"] = _percentiles([q["retrieval_latency_s"] for q in per_question])
+    return summary, per_question
+
+
+def evaluate_workflow(app, questions, warmup):
+    """Grader precision and per-node latency of full workflow runs"""
+    for _ in range(warmup):
+        app.invoke({"question": questions[0]["question"]})
+
+    per_question = []
+    for question in questions:
+        expected = _expected_locations(question)
+        result = app.invoke({"question": question["question"]})
+        profile = result.get("profile") or {}
+        kept = result.get("documents") or []
+        relevant = sum(1 for doc in kept if _is_relevant(doc, expected))
+        per_question.append(
+            {
+                "id": question["id"],
+                "latency_s": profile.get("latency_s"),
+                "nodes": profile.get("nodes", {}),
+                "kept": len(kept),
+                "kept_relevant": relevant,
+                "grader_calls": profile.get("grader_calls", 0),
+                "retrieval_attempts": profile.get("retrieval_attempts", 0),
+                "prompt_tokens": profile.get("prompt_tokens", 0),
+                "completion_tokens": profile.get("completion_tokens", 0),
+                "answered": bool(kept),
+            }
+        )
+
+    kept_total = sum(q["kept"] for q in per_question)
+    node_names = sorted({name for q in per_question for name in q["nodes"]})
+    summary = {
+        # Share of chunks passed to generation that come from an expected page
+        "grader_precision": round(sum(q["kept_relevant"] for q in per_question) / kept_total, 4) if kept_total else None,
+        "answered_rate": round(sum(q["answered"] for q in per_question) / len(per_question), 4),
+        "grader_calls_per_question": round(float(np.mean([q["grader_calls"] for q in per_question])), 3),
+        "prompt_tokens_per_question": round(float(np.mean([q["prompt_tokens"] for q in per_question])), 1),
+        "latency": {
+            "total": _percentiles([q["latency_s"] for q in per_question]),
+            "nodes": {
+                name: _percentiles([q["nodes"][name] for q in per_question if name in q["nodes"]])
+                for name in node_names
+            },
+        },
+    }
+    return summary, per_question
+
+
+def _configuration():
+    import config
+    from data_preprocess.document_loader import CHUNK_SIZE, CHUNK_OVERLAP
+
+    return {
+        "llm_backend": config.LLM_BACKEND,
+        "embedding_backend": config.EMBEDDING_BACKEND,
+        "embedding_model": (
+            f"hashing-{config.HASHING_EMBEDDING_DIM}"
+            if config.EMBEDDING_BACKEND == "hashing"
+            else config.EMBEDDING_MODEL_NAME
+        ),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "vectorstore_backend": config.VECTORSTORE_BACKEND,
+        "vector_quantization": config.VECTOR_QUANTIZATION,
+        "vector_ivf_lists": config.VECTOR_IVF_LISTS,
+        "retrieval_mode": config.RETRIEVAL_MODE,
+        "retrieval_k": config.RETRIEVAL_K,
+        "hybrid_fetch_k": config.HYBRID_FETCH_K,
+        "grading_mode": config.GRADING_MODE,
+        "rerank_mode": config.RERANK_MODE,
+        "adaptive_max_retries": config.ADAPTIVE_MAX_RETRIES,
+        "context_max_tokens": config.CONTEXT_MAX_TOKENS,
+        "dedup": config.DEDUP_ENABLED,
+        "streaming_ingest": config.STREAMING_INGEST,
+    }
+
+
+def flatten_metrics(results):
+    """Comparable numeric metrics of a results file, keyed by dotted name"""
+    flat = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, item)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix] = value
+
+    for section in ("ingestion", "retrieval", "workflow", "startup"):
+        walk(section, results.get(section) or {})
+    return flat
+
+
+def compare(results, baseline, tolerance=0.02, latency_tolerance=0.2, min_latency_delta=0.01):
+    """Print metric deltas against ``baseline`` and return the regressed metrics.
+
+    Quality metrics regress when they drop by more than ``tolerance``; timings
+    when they grow by more than ``latency_tolerance`` (relative) and
+    ``min_latency_delta`` seconds, so millisecond noise is not flagged.
+    """
+    current, previous = flatten_metrics(results), flatten_metrics(baseline)
+    regressions = []
+    print(f"{'metric':<45} {'baseline':>10} {'current':>10} {'delta':>10}")
+    for name in sorted(set(current) & set(previous)):
+        old, new = previous[name], current[name]
+        last = name.split(".")[-1]
+        if last in QUALITY_METRICS or last.startswith("recall@"):
+            regressed = old - new > tolerance
+        elif last in TIMING_METRICS or name in ("ingestion.seconds", "startup.total"):
+            regressed = new - old > max(old * latency_tolerance, min_latency_delta)
+        else:
+            regressed = False
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<45} {old:>10.4g} {new:>10.4g} {new - old:>+10.4g}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="Question set JSON file")
+    parser.add_argument("--label", default=None, help="Name of this run, used in the output file name")
+    parser.add_argument("--output", default=None, help="Results JSON path (default: benchmarks/results/...)")
+    parser.add_argument("--llm", default="stub", choices=["stub", "ollama"], help="Chat model backend")
+    parser.add_argument("--workdir", default=None, help="Keep the index here to reuse it across runs")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured workflow runs before timing")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    with open(args.questions) as f:
+        question_set = json.load(f)
+    questions = question_set["questions"]
+    label = args.label or time.strftime("%Y%m%d-%H%M%S")
+    output = os.path.abspath(
+        args.output
+        or os.path.join(RESULTS_DIR, f"{question_set['name']}-v{question_set['version']}-{label}.json")
+    )
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    # Must be set before config is imported
+    os.environ["RAG_LLM_BACKEND"] = args.llm
+    os.environ.setdefault("RAG_ANSWER_CACHE", "0")
+    os.environ.setdefault("RAG_METRICS_LOG_QUERIES", "0")
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="rag-benchmark-")
+    prepare_workdir(workdir)
+
+    from main import DOCUMENT_PATHS, setup_rag_system
+    from data_preprocess.document_loader import setup_retriever_tool
+
+    paths = [path for path in DOCUMENT_PATHS if os.path.exists(path)]
+    vectorstore, ingestion = run_ingestion(paths)
+
+    startup = {}
+    app = setup_rag_system(timings=startup)
+    retriever, _ = setup_retriever_tool(vectorstore)
+
+    retrieval, retrieval_questions = evaluate_retrieval(retriever, questions, max(RECALL_KS))
+    workflow, workflow_questions = evaluate_workflow(app, questions, args.warmup)
+
+    by_id = {q["id"]: q for q in workflow_questions}
+    results = {
+        "schema": 1,
+        "label": label,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "question_set": {"name": question_set["name"], "version": question_set["version"], "count": len(questions)},
+        "config": _configuration(),
+        "ingestion": ingestion,
+        "startup": startup,
+        "retrieval": retrieval,
+        "workflow": workflow,
+        "questions": [{**q, **by_id[q["id"]]} for q in retrieval_questions],
+    }
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({key: results[key] for key in ("ingestion", "retrieval", "workflow")}, indent=2))
+    print(f"Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get("question_set") != results["question_set"]:
+            print("Warning: baseline used a different question set")
+        regressions = compare(results, baseline)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
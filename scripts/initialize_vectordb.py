@@ -4,6 +4,7 @@ Standalone script to pre-initialize the vector database during container startup
 This ensures the vector DB is ready before the Streamlit app starts.
 """
 
+import logging
 import os
 import sys
 # Add both the project root and src directory to Python path
@@ -11,11 +12,12 @@ project_root = os.path.join(os.path.dirname(__file__), '..')
 sys.path.append(project_root)
 sys.path.append(os.path.join(project_root, 'src'))
 
-from config import get_embeddings
+from config import get_embeddings, STREAMING_INGEST
 from data_preprocess.document_loader import (
     load_documents,
     split_documents,
     create_vectorstore,
+    ingest_streaming,
 )
 
 
@@ -43,9 +45,12 @@ def initialize_vector_database():
             return False
 
         # Load and process documents
-        docs_list = load_documents(existing_paths)
-        doc_splits = split_documents(docs_list)
-        vectorstore = create_vectorstore(doc_splits, embeddings)
+        if STREAMING_INGEST:
+            vectorstore = ingest_streaming(existing_paths, embeddings)
+        else:
+            docs_list = load_documents(existing_paths)
+            doc_splits = split_documents(docs_list)
+            vectorstore = create_vectorstore(doc_splits, embeddings)
 
         # Verify the vector database
         try:
@@ -61,26 +66,10 @@ def initialize_vector_database():
 
 def main():
     """Main function to run vector database initialization"""
-    # Check if vector database already exists and has data  
-    from config import get_chroma_persist_directory
-    persist_directory = get_chroma_persist_directory()
-    if os.path.exists(persist_directory):
-        try:
-            from langchain_community.vectorstores import Chroma
-
-            embeddings = get_embeddings()
-            vectorstore = Chroma(
-                collection_name="rag-chroma-optimized",
-                embedding_function=embeddings,
-                persist_directory=persist_directory,
-            )
-
-            if vectorstore._collection.count() > 0:
-                return True
-        except Exception as e:
-            pass
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
 
-    # Initialize vector database
+    # Always sync: unchanged PDFs are served from the per-file caches and only
+    # new or changed files are re-parsed, re-split and re-embedded
     success = initialize_vector_database()
 
     if success:
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Load generator for the compiled workflow.
+
+Drives N concurrent sessions through the workflow built by
+setup_rag_system(), in one process and on one event loop, the way the API
+serves requests. Each session streams its questions back to back, with
+optional think time between them. The script reports throughput plus
+latency and time-to-first-token percentiles.
+
+Run it with the offline backends to size capacity without Ollama or model
+weights, e.g.:
+
+    RAG_LLM_BACKEND=stub RAG_STUB_LLM_LATENCY_MS=300 RAG_STUB_LLM_TOKENS_PER_S=30 \\
+    RAG_EMBEDDING_BACKEND=hashing RAG_CHROMA_DIR=data/chroma_db_hashing \\
+    python scripts/load_test.py --sessions 16 --questions-per-session 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+# Add both the project root and src directory to Python path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(project_root)
+sys.path.append(os.path.join(project_root, 'src'))
+
+import numpy as np
+
+DEFAULT_QUESTIONS = os.path.join(project_root, "benchmarks", "questions", "nist_v1.json")
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    return {f"p{q}": round(float(np.percentile(values, q)), 4) for q in (50, 95, 99)}
+
+
+async def run_session(app, session, questions, count, think_ms, records):
+    """Ask ``count`` questions in turn, starting at a session-specific offset"""
+    for i in range(count):
+        question = questions[(session + i) % len(questions)]
+        started = time.perf_counter()
+        first_token = None
+        result = {}
+        error = None
+        try:
+            async for mode, chunk in app.astream({"question": question}, stream_mode=["custom", "values"]):
+                if mode == "custom" and "token" in chunk and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif mode == "values":
+                    result = chunk
+        except Exception as e:
+            error = str(e)
+        records.append(
+            {
+                "session": session,
+                "latency_s": time.perf_counter() - started,
+                "ttft_s": first_token,
+                "error": error,
+                "profile": result.get("profile") or {},
+            }
+        )
+        if think_ms:
+            await asyncio.sleep(think_ms / 1000.0)
+
+
+async def run_load(app, questions, sessions, per_session, think_ms):
+    records = []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(run_session(app, session, questions, per_session, think_ms, records) for session in range(sessions))
+    )
+    return records, time.perf_counter() - started
+
+
+def summarize(records, wall_seconds, sessions):
+    completed = [r for r in records if not r["error"]]
+    profiles = [r["profile"] for r in completed if r["profile"]]
+    node_names = sorted({name for profile in profiles for name in profile.get("nodes", {})})
+    return {
+        "sessions": sessions,
+        "requests": len(records),
+        "errors": len(records) - len(completed),
+        "wall_s": round(wall_seconds, 3),
+        "throughput_qps": round(len(completed) / wall_seconds, 3) if wall_seconds else None,
+        "latency_s": _percentiles([r["latency_s"] for r in completed]),
+        "ttft_s": _percentiles([r["ttft_s"] for r in completed if r["ttft_s"] is not None]),
+        "cache_hit_rate": round(sum(p.get("cache_hit", False) for p in profiles) / len(profiles), 4) if profiles else None,
+        "grader_calls": sum(p.get("grader_calls", 0) for p in profiles),
+        "nodes_s": {
+            name: _percentiles([p["nodes"][name] for p in profiles if name in p.get("nodes", {})])
+            for name in node_names
+        },
+        "first_errors": sorted({r["error"] for r in records if r["error"]})[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent sessions")
+    parser.add_argument("--questions-per-session", type=int, default=10)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="Question set JSON file")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between a session's questions")
+    parser.add_argument("--micro-batching", action="store_true", help="Micro-batch embeddings and grading as the API does")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the semantic answer cache enabled")
+    parser.add_argument("--output", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    # Must be set before config is imported
+    if not args.answer_cache:
+        os.environ["RAG_ANSWER_CACHE"] = "0"
+    os.environ.setdefault("RAG_METRICS_LOG_QUERIES", "0")
+
+    from config import LLM_BACKEND, EMBEDDING_BACKEND, LLM_MAX_CONCURRENCY, GRADING_MODE
+    from main import setup_rag_system
+
+    with open(args.questions) as f:
+        questions = [q["question"] for q in json.load(f)["questions"]]
+
+    startup = {}
+    app = setup_rag_system(micro_batching=args.micro_batching, timings=startup)
+
+    # One unmeasured question loads every lazily initialized model
+    asyncio.run(app.ainvoke({"question": questions[0]}))
+
+    records, wall_seconds = asyncio.run(
+        run_load(app, questions, args.sessions, args.questions_per_session, args.think_ms)
+    )
+    report = {
+        "config": {
+            "llm_backend": LLM_BACKEND,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "llm_max_concurrency": LLM_MAX_CONCURRENCY,
+            "grading_mode": GRADING_MODE,
+            "micro_batching": args.micro_batching,
+            "answer_cache": args.answer_cache,
+            "think_ms": args.think_ms,
+        },
+        "startup": startup,
+        **summarize(records, wall_seconds, args.sessions),
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
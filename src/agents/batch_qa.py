@@ -0,0 +1,351 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+
+from langchain_core.documents import Document
+
+from agents.concurrency import ConcurrencyLimiter
+from agents.context import source_label
+from agents.nodes import chunk_key, is_relevant, scores_for
+from data_preprocess.hybrid_retriever import distance_to_similarity
+
+logger = logging.getLogger(__name__)
+
+ANSWER_FIELDS = ["answer", "sources", "retrieved_chunks", "relevant_chunks"]
+
+NO_CONTEXT_ANSWER = "question was not at all relevant"
+
+
+def read_questions(path):
+    """Rows of a CSV file with a "question" column, or of a JSONL file of objects.
+
+    Every row gets a string "id": its own "id" value if present, otherwise
+    its 1-based row number. IDs must be unique, since resuming skips by ID.
+    """
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    seen = set()
+    for number, row in enumerate(rows, start=1):
+        if not str(row.get("question") or "").strip():
+            raise ValueError(f"{path}: row {number} has no question")
+        row["id"] = str(row.get("id") or number)
+        if row["id"] in seen:
+            raise ValueError(f"{path}: duplicate id {row['id']!r}")
+        seen.add(row["id"])
+    return rows
+
+
+def retrieve_batch(retriever, questions, query_embeddings, k):
+    """Retrieve for many questions with one matrix query against the collection.
+
+    Hybrid retrievers also fuse in their BM25 results. A chunk retrieved for
+    several questions is a single Document object shared by their results.
+
+    Returns:
+        One (documents, similarities) pair per question
+    """
+    if hasattr(retriever, "retrieve_batch_with_scores"):
+        return retriever.retrieve_batch_with_scores(questions, query_embeddings, k=k)
+
+    vectorstore = retriever.vectorstore
+    dense = vectorstore._collection.query(
+        query_embeddings=list(query_embeddings),
+        n_results=k,
+        include=["documents", "metadatas", "distances"],
+    )
+    docs_by_id = {}
+    results = []
+    for ids, texts, metadatas, distances in zip(
+        dense["ids"], dense["documents"], dense["metadatas"], dense["distances"]
+    ):
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            if doc_id not in docs_by_id:
+                docs_by_id[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+        results.append(
+            ([docs_by_id[doc_id] for doc_id in ids], [distance_to_similarity(vectorstore, d) for d in distances])
+        )
+    return results
+
+
+class ResultWriter:
+    """Appends answered rows to a CSV or JSONL file with a resumable checkpoint.
+
+    ``<output>.checkpoint.json`` records the IDs written so far and the
+    output size after the last checkpoint. On resume the output is truncated
+    to that size, dropping rows written after it, and those IDs are skipped.
+    An output that is missing or shorter than the checkpoint cannot be
+    resumed and needs ``restart``.
+    """
+
+    def __init__(self, path, columns, restart=False):
+        self.path = path
+        self.checkpoint_file = path + ".checkpoint.json"
+        self.is_csv = path.endswith(".csv")
+        self.columns = columns + [field for field in ANSWER_FIELDS if field not in columns]
+        self.done = set()
+
+        checkpoint = None
+        if not restart and os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file) as f:
+                checkpoint = json.load(f)
+            size = os.path.getsize(path) if os.path.exists(path) else None
+            if size is None or size < checkpoint["output_bytes"]:
+                raise ValueError(
+                    f"{path} is missing or shorter than its checkpoint ({checkpoint['output_bytes']} bytes); "
+                    "pass restart to start over"
+                )
+        elif not restart and os.path.exists(path) and os.path.getsize(path):
+            raise FileExistsError(f"{path} exists without a checkpoint; pass restart to overwrite it")
+
+        self._file = open(path, "a+" if checkpoint else "w", newline="", encoding="utf-8")
+        if checkpoint:
+            self._file.truncate(checkpoint["output_bytes"])
+            self._file.seek(checkpoint["output_bytes"])
+            self.done = set(checkpoint["done"])
+        self._csv = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction="ignore") if self.is_csv else None
+        if self._csv and not checkpoint:
+            self._csv.writeheader()
+        self._unsaved = []
+
+    def write(self, row):
+        if self._csv:
+            self._csv.writerow(
+                {**row, "sources": "; ".join(source["label"] for source in row["sources"])}
+            )
+        else:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._unsaved.append(row["id"])
+
+    def checkpoint(self):
+        """Make the rows written so far durable and record them as done"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(self._unsaved)
+        self._unsaved = []
+        tmp_file = self.checkpoint_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"output_bytes": self._file.tell(), "done": sorted(self.done)}, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def close(self):
+        self._file.close()
+
+
+class BatchQuestionAnswerer:
+    """Answers a list of questions as one throughput-oriented job.
+
+    Unlike the interactive workflow, work is shared across questions: all
+    questions are embedded in one call and retrieved with one matrix query,
+    each distinct chunk is held once, and each distinct (question, chunk)
+    pair is graded once (pairs only repeat when a question text does).
+    Pairs whose similarity clears ``accept_threshold`` or
+    ``reject_threshold`` skip the LLM grader. With a ``batch_grader`` (as
+    with GRADING_MODE=batch) each question's remaining chunks are graded in
+    one call, otherwise every pair gets a ``retrieval_grader`` call. Grading
+    and answer generation run as concurrent tasks capped by
+    ``max_concurrency``, and a question is answered as soon as its own pairs
+    are graded. There is no query rewriting or widened retrieval.
+    """
+
+    def __init__(
+        self,
+        retriever,
+        embeddings,
+        retrieval_grader,
+        rag_chain,
+        context_builder,
+        k=4,
+        accept_threshold=None,
+        reject_threshold=None,
+        max_concurrency=4,
+        batch_grader=None,
+    ):
+        self.retriever = retriever
+        self.embeddings = embeddings
+        self.retrieval_grader = retrieval_grader
+        self.batch_grader = batch_grader
+        self.rag_chain = rag_chain
+        self.context_builder = context_builder
+        self.k = k
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        # (question, chunk key) -> verdict task or future, shared by every batch of a run
+        self._pairs = {}
+        self.stats = {
+            "questions": 0,
+            "answered": 0,
+            "failed": 0,
+            "retrieved_chunks": 0,
+            "unique_chunks": 0,
+            "pairs": 0,
+            "prefiltered_pairs": 0,
+            "unique_pairs": 0,
+            "grader_calls": 0,
+        }
+
+    def _embed_questions(self, questions):
+        # Questions are queries: they must not land in the document embedding cache
+        if hasattr(self.embeddings, "embed_queries"):
+            return self.embeddings.embed_queries(questions)
+        return [self.embeddings.embed_query(question) for question in questions]
+
+    def retrieve(self, questions):
+        """Embed every question as a query, then run one batched search"""
+        started = time.perf_counter()
+        vectors = self._embed_questions(questions)
+        embedded = time.perf_counter()
+        results = retrieve_batch(self.retriever, questions, vectors, self.k)
+        logger.info(
+            "Embedded %d questions in %.2fs and retrieved in %.2fs",
+            len(questions), embedded - started, time.perf_counter() - embedded,
+        )
+        return results
+
+    def _decide(self, score):
+        if score is None:
+            return None
+        if self.accept_threshold is not None and score >= self.accept_threshold:
+            return True
+        if self.reject_threshold is not None and score <= self.reject_threshold:
+            return False
+        return None
+
+    async def _grade(self, question, doc):
+        async with self.limiter:
+            try:
+                score = await self.retrieval_grader.ainvoke({"question": question, "document": doc})
+                return is_relevant(score, doc)
+            except Exception as e:
+                # On error, include the document to be safe
+                logger.warning("Grading failed, keeping the document: %s", e)
+                return True
+            finally:
+                self.stats["grader_calls"] += 1
+
+    async def _grade_question(self, question, pending):
+        """Grade one question's ``(document, future)`` pairs in a single batch grader call.
+
+        Documents the model left without a verdict are graded one by one.
+        """
+        documents = [doc for doc, _ in pending]
+        try:
+            async with self.limiter:
+                try:
+                    result = await self.batch_grader.ainvoke({"question": question, "documents": documents})
+                    by_index = {verdict.index: verdict for verdict in getattr(result, "verdicts", None) or []}
+                except Exception as e:
+                    logger.warning("Batch grading failed, grading one by one: %s", e)
+                    by_index = {}
+                finally:
+                    self.stats["grader_calls"] += 1
+
+            missing = [i for i in range(len(pending)) if i not in by_index]
+            fallback = dict(zip(missing, await asyncio.gather(*(self._grade(question, documents[i]) for i in missing))))
+            for i, (doc, future) in enumerate(pending):
+                future.set_result(is_relevant(by_index[i], doc) if i in by_index else fallback[i])
+        finally:
+            # Never leave an answer waiting; keep the document, as on grading errors
+            for _, future in pending:
+                if not future.done():
+                    future.set_result(True)
+
+    async def _answer(self, row, documents, scores, verdicts):
+        verdicts = [await verdict if asyncio.isfuture(verdict) else verdict for verdict in verdicts]
+        relevant = [doc for doc, verdict in zip(documents, verdicts) if verdict]
+        relevant_scores = scores_for(documents, scores, relevant)
+
+        if relevant:
+            context, relevant, _ = self.context_builder.build(relevant, relevant_scores)
+            async with self.limiter:
+                generation = await self.rag_chain.ainvoke({"context": context, "question": row["question"]})
+        else:
+            generation = NO_CONTEXT_ANSWER
+
+        return {
+            **row,
+            "answer": generation,
+            "sources": [
+                {
+                    "label": source_label(doc),
+                    "source": doc.metadata.get("source"),
+                    "page": doc.metadata.get("page"),
+                    "chunk_id": doc.metadata.get("chunk_id"),
+                }
+                for doc in relevant
+            ],
+            "retrieved_chunks": len(documents),
+            "relevant_chunks": len(relevant),
+        }
+
+    async def answer_rows(self, rows, retrieved, writer):
+        """Grade and answer ``rows``, writing each row to ``writer`` as it completes"""
+        pairs_before = len(self._pairs)
+        loop = asyncio.get_running_loop()
+        answers = []
+        grading = []
+        for row, (documents, scores) in zip(rows, retrieved):
+            question = row["question"]
+            verdicts = []
+            pending = []
+            for doc, score in zip(documents, scores or [None] * len(documents)):
+                verdict = self._decide(score)
+                if verdict is not None:
+                    self.stats["prefiltered_pairs"] += 1
+                else:
+                    key = (question, chunk_key(doc))
+                    if key not in self._pairs:
+                        if self.batch_grader is not None:
+                            self._pairs[key] = loop.create_future()
+                            pending.append((doc, self._pairs[key]))
+                        else:
+                            self._pairs[key] = asyncio.ensure_future(self._grade(question, doc))
+                    verdict = self._pairs[key]
+                verdicts.append(verdict)
+            if pending:
+                grading.append(asyncio.ensure_future(self._grade_question(question, pending)))
+            self.stats["pairs"] += len(documents)
+            answers.append(self._answer(row, documents, scores, verdicts))
+        self.stats["unique_pairs"] += len(self._pairs) - pairs_before
+
+        for answer in asyncio.as_completed(answers):
+            try:
+                result = await answer
+            except Exception as e:
+                # Not checkpointed, so a resumed run retries the question
+                logger.warning("Answering failed: %s", e)
+                self.stats["failed"] += 1
+                continue
+            writer.write(result)
+            self.stats["answered"] += 1
+        await asyncio.gather(*grading)
+
+    async def arun(self, rows, writer, batch_size=32):
+        """Answer every row not yet done in ``writer``, checkpointing every ``batch_size`` rows"""
+        pending = [row for row in rows if row["id"] not in writer.done]
+        self.stats["questions"] = len(pending)
+        if len(pending) < len(rows):
+            logger.info("Resuming: %d of %d questions already answered", len(rows) - len(pending), len(rows))
+        if not pending:
+            return self.stats
+
+        retrieved = await asyncio.to_thread(self.retrieve, [row["question"] for row in pending])
+        self.stats["retrieved_chunks"] = sum(len(documents) for documents, _ in retrieved)
+        self.stats["unique_chunks"] = len({chunk_key(doc) for documents, _ in retrieved for doc in documents})
+
+        started = time.perf_counter()
+        for start in range(0, len(pending), batch_size):
+            await self.answer_rows(pending[start : start + batch_size], retrieved[start : start + batch_size], writer)
+            writer.checkpoint()
+            done = min(start + batch_size, len(pending))
+            elapsed = time.perf_counter() - started
+            logger.info("Answered %d/%d questions (%.2f questions/s)", done, len(pending), done / elapsed if elapsed else 0.0)
+        return self.stats
@@ -0,0 +1,132 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
+
+
+class MicroBatcher:
+    """Groups calls from concurrent requests into batches for one backend call.
+
+    A background thread takes the first waiting item, collects more for up to
+    ``max_wait_ms`` or until ``max_batch_size`` items are waiting, and then
+    calls ``batch_fn`` once with the whole batch. Items with the same ``key_fn``
+    value share a single slot in the batch. Callers block on ``__call__`` or
+    await ``acall``, so the batcher serves threads and coroutines alike.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=10, key_fn=None):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.key_fn = key_fn
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    async def acall(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+
+            # Identical items are computed once and fanned back out
+            slots = {}
+            unique_items = []
+            for item, future in batch:
+                key = self.key_fn(item) if self.key_fn else id(item)
+                if key not in slots:
+                    slots[key] = []
+                    unique_items.append(item)
+                slots[key].append(future)
+
+            try:
+                results = self.batch_fn(unique_items)
+            except Exception as e:
+                results = [e] * len(unique_items)
+
+            for futures, result in zip(slots.values(), results):
+                for future in futures:
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+
+
+class MicroBatchedEmbeddings(Embeddings):
+    """Embeddings whose query calls from concurrent requests are encoded together."""
+
+    def __init__(self, embeddings, max_batch_size=32, max_wait_ms=10):
+        self.embeddings = embeddings
+        embed_queries = getattr(embeddings, "embed_queries", embeddings.embed_documents)
+        self._batcher = MicroBatcher(embed_queries, max_batch_size, max_wait_ms, key_fn=lambda text: text)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._batcher(text)
+
+    async def aembed_query(self, text):
+        return await self._batcher.acall(text)
+
+    def __getattr__(self, name):
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+
+def micro_batched_grader(grader, max_batch_size=32, max_wait_ms=10, max_concurrency=4, limiter=None):
+    """Wrap a per-document grader so concurrent requests share one .batch() call.
+
+    Identical (question, document) pairs from different requests are graded
+    once. With a ConcurrencyLimiter each grading call inside the batch holds
+    a slot, while requests waiting in the batcher hold none.
+    """
+    if limiter is not None:
+        grader = limiter.wrap(grader)
+
+    def grade_batch(inputs):
+        return grader.batch(inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+
+    def key(inputs):
+        document = inputs["document"]
+        return inputs["question"], getattr(document, "page_content", str(document))
+
+    batcher = MicroBatcher(grade_batch, max_batch_size, max_wait_ms, key_fn=key)
+
+    def invoke(inputs):
+        return batcher(inputs)
+
+    async def ainvoke(inputs):
+        return await batcher.acall(inputs)
+
+    batched = RunnableLambda(invoke, afunc=ainvoke, name="micro_batched_grader")
+    # Tells limiter.wrap() not to hold a slot around the batcher itself
+    batched.concurrency_limiter = limiter
+    return batched
@@ -0,0 +1,280 @@
+import asyncio
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _normalize_question(question):
+    return " ".join(question.lower().split())
+
+
+class SemanticAnswerCache:
+    """Disk-backed answer cache keyed by question embedding.
+
+    A lookup hits when a cached question is textually identical or its
+    embedding has a cosine similarity of at least ``similarity_threshold`` with
+    the new question. Entries are evicted least-recently-used once
+    ``max_entries`` is reached and expire after ``ttl_seconds``. The whole cache
+    is dropped whenever ``fingerprint_fn`` reports that the underlying vector
+    collection changed.
+
+    Stores are written to ``cache_file`` in the background, ``save_delay``
+    seconds after the first unsaved change, so a burst of answers costs one
+    write; ``flush()`` writes immediately. The file is not shared safely:
+    several processes using the same ``cache_file`` (e.g. API workers) each
+    keep their own entries, and every save overwrites the others' entries.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        cache_file="data/cache/answer_cache.pkl",
+        similarity_threshold=0.95,
+        max_entries=256,
+        ttl_seconds=24 * 3600,
+        fingerprint_fn=None,
+        save_delay=1.0,
+    ):
+        self.embeddings = embeddings
+        self.cache_file = cache_file
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.fingerprint_fn = fingerprint_fn
+        self.save_delay = save_delay
+        self._lock = threading.Lock()
+        # Serializes writers so an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._fingerprint = None
+        self._entries = OrderedDict()
+        self._load()
+
+    def _current_fingerprint(self):
+        if self.fingerprint_fn is None:
+            return None
+        try:
+            return self.fingerprint_fn()
+        except Exception as e:
+            return None
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "rb") as f:
+                data = pickle.load(f)
+            self._fingerprint = data["fingerprint"]
+            self._entries = data["entries"]
+        except Exception as e:
+            self._entries = OrderedDict()
+
+    def _save(self, data):
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                pickle.dump(data, f)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            pass
+
+    def _schedule_save(self):
+        """Saves after ``save_delay`` unless a save is already pending; needs ``_lock``."""
+        if self._save_timer is None:
+            self._save_timer = threading.Timer(self.save_delay, self.flush)
+            self._save_timer.start()
+
+    def flush(self):
+        """Writes the current entries to ``cache_file``."""
+        with self._save_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                data = {"fingerprint": self._fingerprint, "entries": OrderedDict(self._entries)}
+            self._save(data)
+
+    def _validate(self):
+        """Drops everything if the collection changed, and expired entries otherwise."""
+        fingerprint = self._current_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._entries.clear()
+            self._fingerprint = fingerprint
+            return
+
+        if self.ttl_seconds:
+            cutoff = time.time() - self.ttl_seconds
+            for key in [k for k, entry in self._entries.items() if entry["created"] < cutoff]:
+                del self._entries[key]
+
+    def _hit(self, key):
+        self._entries.move_to_end(key)
+        return dict(self._entries[key]["result"])
+
+    def lookup(self, question):
+        """Returns the cached result for a matching question, or None."""
+        key = _normalize_question(question)
+        with self._lock:
+            self._validate()
+            if not self._entries:
+                return None
+            if key in self._entries:
+                return self._hit(key)
+
+        # Embedded without the lock so concurrent lookups can be batched
+        query = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        with self._lock:
+            if not self._entries:
+                return None
+            keys = list(self._entries)
+            matrix = np.stack([self._entries[k]["vector"] for k in keys])
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            similarities = matrix @ query / np.where(norms == 0, 1.0, norms)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            return self._hit(keys[best])
+
+    def store(self, question, result):
+        """Caches the generation and documents of a finished workflow run."""
+        key = _normalize_question(question)
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        with self._lock:
+            self._validate()
+            self._entries[key] = {
+                "vector": vector,
+                "created": time.time(),
+                "result": {
+                    "generation": result.get("generation"),
+                    "documents": result.get("documents", []),
+                },
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._schedule_save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.flush()
+
+
+class CachedWorkflow:
+    """Wraps a compiled workflow so cache hits skip the whole graph.
+
+    Only answers grounded in at least one document are cached. Every other
+    attribute is delegated to the wrapped workflow.
+    """
+
+    def __init__(self, app, cache):
+        self.app = app
+        self.cache = cache
+
+    def invoke(self, inputs, config=None, **kwargs):
+        question = inputs["question"]
+        try:
+            cached = self.cache.lookup(question)
+        except Exception as e:
+            cached = None
+        if cached is not None:
+            return {**cached, "question": question, "cache_hit": True}
+
+        result = self.app.invoke(inputs, config, **kwargs)
+        if result.get("generation") and result.get("documents"):
+            try:
+                self.cache.store(question, result)
+            except Exception as e:
+                pass
+        return result
+
+    def stream(self, inputs, config=None, stream_mode="values", **kwargs):
+        """Streams the workflow, replaying a cache hit as a single token event."""
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def emit(mode, chunk):
+            return chunk if isinstance(stream_mode, str) else (mode, chunk)
+
+        question = inputs["question"]
+        try:
+            cached = self.cache.lookup(question)
+        except Exception as e:
+            cached = None
+        if cached is not None:
+            result = {**cached, "question": question, "cache_hit": True}
+            if "custom" in modes:
+                yield emit("custom", {"token": result["generation"]})
+            if "values" in modes:
+                yield emit("values", result)
+            return
+
+        result = None
+        for event in self.app.stream(inputs, config, stream_mode=stream_mode, **kwargs):
+            mode, chunk = (stream_mode, event) if isinstance(stream_mode, str) else event
+            if mode == "values":
+                result = chunk
+            yield event
+
+        if result and result.get("generation") and result.get("documents"):
+            try:
+                self.cache.store(question, result)
+            except Exception as e:
+                pass
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        question = inputs["question"]
+        try:
+            cached = await asyncio.to_thread(self.cache.lookup, question)
+        except Exception as e:
+            cached = None
+        if cached is not None:
+            return {**cached, "question": question, "cache_hit": True}
+
+        result = await self.app.ainvoke(inputs, config, **kwargs)
+        if result.get("generation") and result.get("documents"):
+            try:
+                await asyncio.to_thread(self.cache.store, question, result)
+            except Exception as e:
+                pass
+        return result
+
+    async def astream(self, inputs, config=None, stream_mode="values", **kwargs):
+        """Async variant of stream."""
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def emit(mode, chunk):
+            return chunk if isinstance(stream_mode, str) else (mode, chunk)
+
+        question = inputs["question"]
+        try:
+            cached = await asyncio.to_thread(self.cache.lookup, question)
+        except Exception as e:
+            cached = None
+        if cached is not None:
+            result = {**cached, "question": question, "cache_hit": True}
+            if "custom" in modes:
+                yield emit("custom", {"token": result["generation"]})
+            if "values" in modes:
+                yield emit("values", result)
+            return
+
+        result = None
+        async for event in self.app.astream(inputs, config, stream_mode=stream_mode, **kwargs):
+            mode, chunk = (stream_mode, event) if isinstance(stream_mode, str) else event
+            if mode == "values":
+                result = chunk
+            yield event
+
+        if result and result.get("generation") and result.get("documents"):
+            try:
+                await asyncio.to_thread(self.cache.store, question, result)
+            except Exception as e:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self.app, name)
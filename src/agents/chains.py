@@ -1,6 +1,5 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain import hub
 
 
 def create_rag_chain(llm):
@@ -11,7 +10,9 @@ def create_rag_chain(llm):
 
     Returns:
         A chain that takes a dictionary with 'question' and 'context' keys
-        and returns a string answer based on the provided context
+        ('context' being the packed string from ContextBuilder)
+        and returns a string answer based on the provided context. Calling
+        .stream() on it yields the answer as string chunks, token by token
     """
 
     rag_prompt = ChatPromptTemplate.from_messages(
@@ -28,3 +29,32 @@ Answer:""",
     )
 
     return rag_prompt | llm | StrOutputParser()
+
+
+def create_question_rewriter(llm):
+    """Creates a chain that rewrites a question into a better search query.
+
+    Used when retrieval found too few relevant chunks for the original wording.
+
+    Args:
+        llm: A language model instance
+
+    Returns:
+        A chain that takes a dictionary with a 'question' key and returns the
+        rewritten query as a string
+    """
+
+    rewrite_prompt = ChatPromptTemplate.from_messages(
+        [
+            (
+                "human",
+                """Rewrite this question as a short search query for cybersecurity documents (NIST frameworks, controls and incident response guides). Use the terms those documents would use. Return only the query.
+
+Question: {question}
+
+Query:""",
+            )
+        ]
+    )
+
+    return rewrite_prompt | llm | StrOutputParser()
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.runnables import RunnableLambda
+
+
+class ConcurrencyLimiter:
+    """Caps the number of in-flight calls to a shared backend such as Ollama.
+
+    Usable as a context manager from threads (``with limiter:``) and from
+    coroutines (``async with limiter:``). Both share one process-wide
+    semaphore, so the cap holds across threads, sessions and event loops
+    (e.g. one ``asyncio.run`` per question). Coroutines that have to wait
+    block in a small dedicated thread pool rather than in the event loop.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        # Waiting acquires queue here instead of tying up the default executor
+        self._waiters = ThreadPoolExecutor(max_workers=limit, thread_name_prefix="limiter")
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        if self._semaphore.acquire(blocking=False):
+            return self
+        acquire = asyncio.get_running_loop().run_in_executor(self._waiters, self._semaphore.acquire)
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # The slot is still taken once the waiting thread gets it
+            acquire.add_done_callback(lambda _: self._semaphore.release())
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+    def wrap(self, runnable):
+        """Return a runnable that holds a slot for every invoke/ainvoke of ``runnable``
+
+        A runnable whose ``concurrency_limiter`` is this limiter already
+        holds it around its own LLM calls and is returned unchanged.
+        """
+        if getattr(runnable, "concurrency_limiter", None) is self:
+            return runnable
+
+        def invoke(inputs, config):
+            with self:
+                return runnable.invoke(inputs, config)
+
+        async def ainvoke(inputs, config):
+            async with self:
+                return await runnable.ainvoke(inputs, config)
+
+        wrapped = RunnableLambda(invoke, afunc=ainvoke, name=runnable.get_name())
+        wrapped.concurrency_limiter = self
+        return wrapped
@@ -0,0 +1,131 @@
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def create_token_counter(llm=None, tokenizer=None, chars_per_token=4.0, safety_margin=1.2):
+    """Returns a function counting prompt tokens for ``llm``.
+
+    Tokens are only counted exactly with a tokenizer that was configured
+    explicitly: ``tokenizer`` (a Hugging Face tokenizer name) or the
+    ``custom_get_token_ids`` set on ``llm``. The inherited ``get_num_tokens``
+    is never used, because langchain-core implements it for models such as
+    ChatOllama by downloading a GPT-2 tokenizer. Otherwise tokens are
+    estimated at ``chars_per_token`` characters each, padded by
+    ``safety_margin`` so the context budget is not overrun.
+    """
+    if tokenizer:
+        try:
+            from transformers import AutoTokenizer
+
+            encoder = AutoTokenizer.from_pretrained(tokenizer)
+            return lambda text: len(encoder.encode(text, add_special_tokens=False))
+        except Exception as e:
+            logger.warning("Could not load tokenizer %s, estimating tokens instead: %s", tokenizer, e)
+    elif getattr(llm, "custom_get_token_ids", None) is not None:
+        return lambda text: len(llm.custom_get_token_ids(text))
+    return lambda text: math.ceil(len(text) * safety_margin / chars_per_token)
+
+
+def _overlap_words(left, right, max_words):
+    """Number of words at the end of ``left`` repeated at the start of ``right``"""
+    for size in range(min(max_words, len(left), len(right)), 0, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+
+def source_label(doc):
+    """Short citation for a chunk, e.g. "sp800-53.pdf p.12"."""
+    metadata = doc.metadata
+    source = os.path.basename(metadata.get("source", "unknown"))
+    page = metadata.get("page_label", metadata.get("page"))
+    return f"{source} p.{page}" if page is not None else source
+
+
+class ContextBuilder:
+    """Packs retrieved chunks into a compact, token-budgeted prompt context.
+
+    Chunks are taken in relevance order, text shared with an already packed
+    chunk from the same source (the splitter's overlap) is dropped, and
+    packing stops once ``max_tokens`` is reached; the chunk that crosses the
+    budget is cut at a word boundary. Each chunk is rendered as a numbered
+    block headed by its file and page instead of the Document repr.
+    """
+
+    def __init__(self, count_tokens, max_tokens=2000, max_overlap_words=80, min_chunk_tokens=32):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.max_overlap_words = max_overlap_words
+        self.min_chunk_tokens = min_chunk_tokens
+
+    def _trim_overlap(self, words, source, packed):
+        for other_source, other_words in packed:
+            if other_source != source:
+                continue
+            head = _overlap_words(other_words, words, self.max_overlap_words)
+            if head:
+                words = words[head:]
+            tail = _overlap_words(words, other_words, self.max_overlap_words)
+            if tail:
+                words = words[:-tail]
+        return words
+
+    def _truncate(self, header, words, budget):
+        """Longest word prefix whose block fits in ``budget`` tokens"""
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(f"{header}\n{' '.join(words[:middle])} ...") <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return words[:low]
+
+    def build(self, documents, scores=None):
+        """Build the context string for the given chunks.
+
+        Args:
+            documents: Retrieved (and graded) chunks
+            scores: Optional relevance scores aligned with ``documents``;
+                without them the retrieval order is kept
+
+        Returns:
+            Tuple of (context string, documents included, tokens used)
+        """
+        order = list(range(len(documents)))
+        if scores and len(scores) == len(documents) and all(score is not None for score in scores):
+            order.sort(key=lambda i: -scores[i])
+
+        blocks = []
+        used = []
+        packed = []
+        tokens = 0
+        for i in order:
+            doc = documents[i]
+            source = doc.metadata.get("source")
+            words = self._trim_overlap(doc.page_content.split(), source, packed)
+            if not words:
+                continue
+
+            header = f"[{len(blocks) + 1}] {source_label(doc)}"
+            block = f"{header}\n{' '.join(words)}"
+            block_tokens = self.count_tokens(block)
+            remaining = self.max_tokens - tokens
+            if block_tokens > remaining:
+                if remaining < self.min_chunk_tokens:
+                    break
+                words = self._truncate(header, words, remaining)
+                if not words:
+                    break
+                block = f"{header}\n{' '.join(words)} ..."
+                block_tokens = self.count_tokens(block)
+
+            blocks.append(block)
+            used.append(doc)
+            packed.append((source, words))
+            tokens += block_tokens
+
+        return "\n\n".join(blocks), used, tokens
@@ -1,4 +1,7 @@
+from typing import List
+
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnablePassthrough
 from pydantic import BaseModel, Field
 
 
@@ -10,6 +13,23 @@ class GradeDocuments(BaseModel):
     )
 
 
+class DocumentVerdict(BaseModel):
+    """Relevance verdict for a single document inside a batched grading call."""
+
+    index: int = Field(description="Number of the document in the numbered list")
+    binary_score: str = Field(
+        description="Document is relevant to the question, 'yes' or 'no'"
+    )
+
+
+class BatchGradeDocuments(BaseModel):
+    """A model for grading several documents against a question in one call."""
+
+    verdicts: List[DocumentVerdict] = Field(
+        description="One verdict per numbered document, in the same order"
+    )
+
+
 def create_document_grader(llm):
     """Creates a document grader that uses a language model to determine the relevance of documents to a user's question.
 
@@ -39,3 +59,45 @@ You MUST respond with exactly "yes" or "no" in the binary_score field."""
         ]
     )
     return documents_grade_prompt | structured_llm_documents_grader
+
+
+def format_numbered_documents(documents):
+    """Render documents as a numbered list for the batched grading prompt."""
+    return "\n\n".join(
+        f"[{i}] {getattr(doc, 'page_content', doc)}" for i, doc in enumerate(documents)
+    )
+
+
+def create_batch_document_grader(llm):
+    """Creates a grader that scores all retrieved documents in a single LLM call.
+
+    Args:
+        llm: A language model instance that supports structured output
+
+    Returns:
+        A grader chain that takes a dictionary with 'documents' (a list of
+        Document objects) and 'question' keys and returns a BatchGradeDocuments
+        object with one verdict per document index
+    """
+    structured_llm_batch_grader = llm.with_structured_output(BatchGradeDocuments)
+
+    batch_grader_system_prompt = """You are a document relevance grader for cybersecurity questions.
+Your task: For EACH numbered document, determine if it contains information relevant to answering the user's question.
+Return exactly one verdict per document, using the document's number as index and "yes" or "no" as binary_score."""
+
+    batch_grade_prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", batch_grader_system_prompt),
+            (
+                "human",
+                "Retrieved documents: \\n\\n {documents} \\n\\n User question: {question}",
+            ),
+        ]
+    )
+    return (
+        RunnablePassthrough.assign(
+            documents=lambda x: format_numbered_documents(x["documents"])
+        )
+        | batch_grade_prompt
+        | structured_llm_batch_grader
+    )
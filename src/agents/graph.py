@@ -1,24 +1,58 @@
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import END, StateGraph, START
 from agents.nodes import AgentState
 
+def _node(nodes, name):
+    """Pairs a node function with its async variant, if any, so the graph supports invoke and ainvoke."""
+    if f"a{name}" in nodes:
+        return RunnableLambda(nodes[name], afunc=nodes[f"a{name}"], name=name)
+    return nodes[name]
+
 def create_workflow(nodes):
     """Creates a LangGraph workflow for the RAG pipeline.
     
     Args:
         nodes: Dictionary containing the workflow node functions (retrieve, grade_documents, generate)
+            and optionally their async variants (aretrieve, agrade_documents, agenerate). If it
+            holds widen_retrieval and route_after_grading, grading loops back through a wider
+            retrieval while too few documents pass. If it holds rerank, retrieved documents
+            are re-ranked before grading; without grade_documents the re-ranker grades alone
         
     Returns:
-        Compiled workflow graph that processes questions through retrieval, grading, and generation
+        Compiled workflow graph that processes questions through retrieval, grading, and generation.
+        It runs the async node variants under ainvoke/astream.
     """
     workflow = StateGraph(AgentState)
     
-    workflow.add_node("Docs_Vector_Retrieve", nodes["retrieve"])
-    workflow.add_node("Grading_Generated_Documents", nodes["grade_documents"])
-    workflow.add_node("Content_Generator", nodes["generate"])
+    workflow.add_node("Docs_Vector_Retrieve", _node(nodes, "retrieve"))
+    workflow.add_node("Content_Generator", _node(nodes, "generate"))
+
+    # Retrieved documents go through the re-ranker, if any, then the grader
+    after_retrieve = "Grading_Generated_Documents"
+    grading = "Grading_Generated_Documents"
+    if "rerank" in nodes:
+        workflow.add_node("Rerank_Documents", _node(nodes, "rerank"))
+        after_retrieve = "Rerank_Documents"
+        if "grade_documents" not in nodes:
+            grading = "Rerank_Documents"
+    if "grade_documents" in nodes:
+        workflow.add_node("Grading_Generated_Documents", _node(nodes, "grade_documents"))
+        if after_retrieve != grading:
+            workflow.add_edge(after_retrieve, grading)
 
     workflow.add_edge(START, "Docs_Vector_Retrieve")
-    workflow.add_edge("Docs_Vector_Retrieve", "Grading_Generated_Documents")
-    workflow.add_edge("Grading_Generated_Documents", "Content_Generator")
+    workflow.add_edge("Docs_Vector_Retrieve", after_retrieve)
+    if "widen_retrieval" in nodes:
+        # Too few relevant chunks: retrieve wider and grade the new ones
+        workflow.add_node("Widen_Docs_Retrieve", _node(nodes, "widen_retrieval"))
+        workflow.add_conditional_edges(
+            grading,
+            nodes["route_after_grading"],
+            {"widen": "Widen_Docs_Retrieve", "generate": "Content_Generator"},
+        )
+        workflow.add_edge("Widen_Docs_Retrieve", after_retrieve)
+    else:
+        workflow.add_edge(grading, "Content_Generator")
     workflow.add_edge("Content_Generator", END)
 
-    return workflow.compile()
\ No newline at end of file
+    return workflow.compile()
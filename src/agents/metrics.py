@@ -0,0 +1,278 @@
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+# name: (type, help, histogram buckets)
+METRIC_DEFINITIONS = {
+    "rag_queries_total": ("counter", "Questions answered", None),
+    "rag_query_latency_seconds": ("histogram", "End-to-end question latency", LATENCY_BUCKETS),
+    "rag_cache_hits_total": ("counter", "Questions answered from the semantic answer cache", None),
+    "rag_node_latency_seconds": ("histogram", "Latency of each workflow node", LATENCY_BUCKETS),
+    "rag_node_errors_total": ("counter", "Workflow node runs that raised", None),
+    "rag_grader_calls_total": ("counter", "LLM grading requests", None),
+    "rag_documents_graded_total": ("counter", "Chunks graded, by how the verdict was reached", None),
+    "rag_tokens_total": ("counter", "Estimated prompt and completion tokens of generation", None),
+    "rag_retrieval_similarity": ("histogram", "Similarity of retrieved chunks to the question", SCORE_BUCKETS),
+}
+
+# Nodes whose output scores are vector search similarities
+RETRIEVAL_NODES = ("retrieve", "widen_retrieval")
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms rendered in the Prometheus text format.
+
+    Metric names must be declared in METRIC_DEFINITIONS; samples are keyed by
+    their label values.
+    """
+
+    def __init__(self, definitions=METRIC_DEFINITIONS):
+        self.definitions = definitions
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = self.definitions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts, total = self._histograms.get(key, ([0] * (len(buckets) + 1), 0.0))
+            counts[bisect.bisect_left(buckets, value)] += 1
+            self._histograms[key] = (counts, total + value)
+
+    def render(self):
+        """Current values in the Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text, buckets) in self.definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (sample, labels), value in sorted(counters.items()):
+                    if sample == name:
+                        lines.append(f"{name}{_label_text(labels)} {value}")
+                continue
+            for (sample, labels), (counts, total) in sorted(histograms.items()):
+                if sample != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_label_text(labels)} {total}")
+                lines.append(f"{name}_count{_label_text(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by the workflow, the API and the metrics server
+METRICS = MetricsRegistry()
+
+
+def instrument_nodes(nodes, registry=METRICS):
+    """Wrap workflow nodes so every run is timed.
+
+    Each node's latency is recorded in ``registry`` and added to the run's
+    ``node_timings`` state entry (summed when a node runs more than once);
+    retrieval nodes also record the similarity of the chunks they return.
+    Edge functions such as route_after_grading are left unwrapped.
+
+    Returns:
+        A new nodes dictionary for create_workflow
+    """
+
+    def record(name, state, update, elapsed):
+        registry.observe("rag_node_latency_seconds", elapsed, node=name)
+        if name in RETRIEVAL_NODES:
+            for score in update.get("scores") or []:
+                if score is not None:
+                    registry.observe("rag_retrieval_similarity", score)
+        timings = dict(state.get("node_timings") or {})
+        timings[name] = round(timings.get(name, 0.0) + elapsed, 4)
+        return {**update, "node_timings": timings}
+
+    def timed(name, func):
+        @functools.wraps(func)
+        def wrapper(state, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                update = func(state, *args, **kwargs)
+            except Exception as e:
+                registry.inc("rag_node_errors_total", node=name)
+                raise
+            return record(name, state, update, time.perf_counter() - started)
+
+        return wrapper
+
+    def atimed(name, func):
+        @functools.wraps(func)
+        async def wrapper(state, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                update = await func(state, *args, **kwargs)
+            except Exception as e:
+                registry.inc("rag_node_errors_total", node=name)
+                raise
+            return record(name, state, update, time.perf_counter() - started)
+
+        return wrapper
+
+    instrumented = dict(nodes)
+    for name, func in nodes.items():
+        if f"a{name}" in nodes:
+            instrumented[name] = timed(name, func)
+            instrumented[f"a{name}"] = atimed(name, nodes[f"a{name}"])
+    return instrumented
+
+
+def query_profile(result, latency):
+    """Per-question profile of a finished workflow run, as logged and shown in the UI"""
+    stats = result.get("grading_stats") or {}
+    usage = result.get("token_usage") or {}
+    return {
+        "latency_s": round(latency, 4),
+        "cache_hit": bool(result.get("cache_hit")),
+        "nodes": result.get("node_timings") or {},
+        "grader_calls": stats.get("grader_calls", 0),
+        "auto_accepted": stats.get("auto_accepted", 0),
+        "auto_rejected": stats.get("auto_rejected", 0),
+        "llm_graded": stats.get("llm_graded", 0),
+        "retrieval_attempts": stats.get("retrieval_attempts", 0),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "documents": len(result.get("documents") or []),
+        "scores": [round(score, 4) for score in result.get("scores") or [] if score is not None],
+    }
+
+
+class ProfiledWorkflow:
+    """Wraps a (possibly cached) workflow to record per-question metrics.
+
+    Each finished question updates ``registry`` and, with ``log_queries``, is
+    logged as one JSON line; the profile is returned in the result under
+    ``profile``. Every other attribute is delegated to the wrapped workflow.
+    """
+
+    def __init__(self, app, registry=METRICS, log_queries=True):
+        self.app = app
+        self.registry = registry
+        self.log_queries = log_queries
+
+    def _finish(self, result, started):
+        profile = query_profile(result, time.perf_counter() - started)
+        registry = self.registry
+        registry.inc("rag_queries_total")
+        registry.observe("rag_query_latency_seconds", profile["latency_s"])
+        if profile["cache_hit"]:
+            registry.inc("rag_cache_hits_total")
+        registry.inc("rag_grader_calls_total", profile["grader_calls"])
+        for verdict in ("auto_accepted", "auto_rejected", "llm_graded"):
+            registry.inc("rag_documents_graded_total", profile[verdict], decision=verdict)
+        registry.inc("rag_tokens_total", profile["prompt_tokens"], kind="prompt")
+        registry.inc("rag_tokens_total", profile["completion_tokens"], kind="completion")
+        if self.log_queries:
+            logger.info(json.dumps({"event": "rag_query", **profile}))
+        return profile
+
+    def invoke(self, inputs, config=None, **kwargs):
+        started = time.perf_counter()
+        result = self.app.invoke(inputs, config, **kwargs)
+        return {**result, "profile": self._finish(result, started)}
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        started = time.perf_counter()
+        result = await self.app.ainvoke(inputs, config, **kwargs)
+        return {**result, "profile": self._finish(result, started)}
+
+    def stream(self, inputs, config=None, stream_mode="values", **kwargs):
+        """Streams the workflow, then repeats the final state with its profile.
+
+        The final state is captured through "values" events, which are only
+        passed on if the caller asked for them.
+        """
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def emit(mode, chunk):
+            return chunk if isinstance(stream_mode, str) else (mode, chunk)
+
+        started = time.perf_counter()
+        result = None
+        for mode, chunk in self.app.stream(inputs, config, stream_mode=list({*modes, "values"}), **kwargs):
+            if mode == "values":
+                result = chunk
+            if mode in modes:
+                yield emit(mode, chunk)
+
+        if result is not None:
+            result = {**result, "profile": self._finish(result, started)}
+            if "values" in modes:
+                yield emit("values", result)
+
+    async def astream(self, inputs, config=None, stream_mode="values", **kwargs):
+        """Async variant of stream."""
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def emit(mode, chunk):
+            return chunk if isinstance(stream_mode, str) else (mode, chunk)
+
+        started = time.perf_counter()
+        result = None
+        async for mode, chunk in self.app.astream(inputs, config, stream_mode=list({*modes, "values"}), **kwargs):
+            if mode == "values":
+                result = chunk
+            if mode in modes:
+                yield emit(mode, chunk)
+
+        if result is not None:
+            result = {**result, "profile": self._finish(result, started)}
+            if "values" in modes:
+                yield emit("values", result)
+
+    def __getattr__(self, name):
+        return getattr(self.app, name)
+
+
+def start_metrics_server(port, host="0.0.0.0", registry=METRICS):
+    """Serve ``registry`` at http://host:port/metrics from a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Metrics available at http://%s:%d/metrics", host, port)
+    return server
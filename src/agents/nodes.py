@@ -1,29 +1,177 @@
+import asyncio
+import logging
+from contextlib import nullcontext
 from typing import List, TypedDict
 
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
+
+from agents.context import ContextBuilder, create_token_counter
+from data_preprocess.hybrid_retriever import distance_to_similarity
+
+logger = logging.getLogger(__name__)
+
 class AgentState(TypedDict):
     """State object for the RAG workflow containing question, documents, and generated answer."""
     question: str
     generation: str
     documents: List[str]
+    scores: List[float]
+    grading_stats: dict
+    context_tokens: int
+    retrieval_attempt: int
+    seen_chunks: List[str]
+    kept_documents: List[str]
+    kept_scores: List[float]
+    score_source: str
+    token_usage: dict
+    node_timings: dict
+
+def is_relevant(score, doc):
+    """Interprets a grader verdict, being permissive for NIST framework content."""
+    grade = score.binary_score if hasattr(score, 'binary_score') else str(score)
+
+    # Handle various response formats - be more permissive for NIST documents
+    grade_str = str(grade).lower().strip()
+    return (
+        'yes' in grade_str or 
+        grade_str.startswith('y') or
+        'nist' in doc.page_content.lower() and 'cybersecurity framework' in doc.page_content.lower()
+    )
+
+def chunk_key(doc):
+    """Identifies a chunk across retrievals and questions"""
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+def scores_for(documents, scores, subset):
+    """Scores of ``subset`` (documents picked from ``documents``), in subset order"""
+    if not scores or len(scores) != len(documents):
+        return None
+    by_id = {id(doc): score for doc, score in zip(documents, scores)}
+    return [by_id.get(id(doc)) for doc in subset]
+
+
+def _retrieve_with_scores(retriever, question, k=None):
+    """Runs the retriever's similarity search, keeping Chroma's distances as scores.
+
+    ``k`` overrides the retriever's number of results. Falls back to a plain
+    retrieval without scores for retrievers that do not expose a vectorstore
+    with similarity search.
+    """
+    if hasattr(retriever, "retrieve_with_scores"):
+        return retriever.retrieve_with_scores(question, k=k)
+
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None or getattr(retriever, "search_type", None) != "similarity":
+        return retriever.get_relevant_documents(question), None
 
-def create_workflow_nodes(retriever, retrieval_grader, rag_chain):
+    k = k or retriever.search_kwargs.get("k", 4)
+    if getattr(vectorstore, "_collection", None) is None:
+        # Non-Chroma stores already report a normalized relevance score
+        try:
+            results = vectorstore.similarity_search_with_relevance_scores(question, k=k)
+        except NotImplementedError:
+            return retriever.get_relevant_documents(question), None
+        return [doc for doc, _ in results], [score for _, score in results]
+
+    results = vectorstore.similarity_search_with_score(question, k=k)
+    documents = [doc for doc, _ in results]
+    scores = [distance_to_similarity(vectorstore, distance) for _, distance in results]
+    return documents, scores
+
+def create_workflow_nodes(
+    retriever,
+    retrieval_grader,
+    rag_chain,
+    batch_grader=None,
+    grading_mode="batch",
+    grader_max_concurrency=4,
+    accept_threshold=None,
+    reject_threshold=None,
+    llm_limiter=None,
+    context_builder=None,
+    retrieval_k=4,
+    confident_k=None,
+    confident_score=None,
+    min_relevant=1,
+    max_retries=0,
+    widen_strategies=("expand", "rewrite"),
+    expand_factor=3,
+    question_rewriter=None,
+    reranker=None,
+    rerank_mode="prestage",
+    rerank_threshold=0.5,
+    rerank_top_n=None,
+    rerank_accept_threshold=None,
+    rerank_reject_threshold=None,
+):
     """Creates the workflow nodes for a RAG pipeline.
     
     Args:
         retriever: Document retriever for finding relevant documents
         retrieval_grader: Grader for filtering relevant documents
         rag_chain: Chain for generating answers from context
+        batch_grader: Optional grader that scores all documents in one call
+        grading_mode: "batch" (single call via batch_grader, falling back to
+            parallel), "parallel" (one call per document via .batch()) or
+            "sequential" (one call per document, one after another)
+        grader_max_concurrency: Maximum concurrent grader calls when fanning out
+        accept_threshold: Cosine similarity at or above which a document is
+            accepted without an LLM grading call (None disables)
+        reject_threshold: Cosine similarity at or below which a document is
+            rejected without an LLM grading call (None disables)
+        llm_limiter: Optional ConcurrencyLimiter shared by every LLM call
+        context_builder: ContextBuilder that packs the graded documents into
+            the prompt context (defaults to a 2000-token budget)
+        retrieval_k: Number of chunks the retriever returns by default
+        confident_k: Keep only this many chunks when the best similarity is
+            at least ``confident_score`` (None disables)
+        confident_score: Similarity above which retrieval is considered confident
+        min_relevant: Fewer graded-relevant chunks than this trigger a wider
+            retrieval, up to ``max_retries`` times (0 keeps the linear graph)
+        widen_strategies: Strategy per retry: "expand" (``expand_factor``
+            times more chunks), "mmr" (diverse chunks via max marginal
+            relevance) or "rewrite" (LLM-rewritten query, expanded)
+        expand_factor: Multiplier of ``retrieval_k`` when widening
+        question_rewriter: Chain rewriting a question into a search query,
+            required by the "rewrite" strategy
+        reranker: Optional CrossEncoderReranker scoring retrieved documents in
+            one batch before grading
+        rerank_mode: "prestage" (cross-encoder scores drive the grading
+            pre-filter, ambiguous documents still go to the LLM grader) or
+            "replace" (documents scoring at least ``rerank_threshold``, at
+            most ``rerank_top_n`` of them, pass without any LLM grading)
+        rerank_threshold: Minimum cross-encoder score kept in "replace" mode
+        rerank_top_n: Maximum documents kept in "replace" mode (None keeps all)
+        rerank_accept_threshold: Cross-encoder score at or above which a
+            document is accepted without an LLM call in "prestage" mode
+        rerank_reject_threshold: Cross-encoder score at or below which a
+            document is rejected without an LLM call in "prestage" mode
         
     Returns:
-        Dictionary containing retrieve, grade_documents, and generate node functions
+        Dictionary containing retrieve, grade_documents, and generate node
+        functions, plus their async variants (aretrieve, agrade_documents,
+        agenerate). With ``max_retries`` set it also holds widen_retrieval,
+        awiden_retrieval and the route_after_grading edge function. With a
+        reranker it holds rerank and arerank; in "replace" mode these take
+        the place of grade_documents and agrade_documents
     """
     
+    if context_builder is None:
+        context_builder = ContextBuilder(create_token_counter())
+
+    if llm_limiter is not None:
+        retrieval_grader = llm_limiter.wrap(retrieval_grader)
+        if batch_grader is not None:
+            batch_grader = llm_limiter.wrap(batch_grader)
+
     def retrieve(state: AgentState):
         """Retrieves relevant documents for the given question."""
         question = state['question']
         
+        scores = None
         try:
-            documents = retriever.get_relevant_documents(question)
+            documents, scores = _retrieve_with_scores(retriever, question)
             
             if not documents:
                 # Try a simple similarity search to debug
@@ -33,52 +181,420 @@ def create_workflow_nodes(retriever, retrieval_grader, rag_chain):
                     pass
                     
         except Exception as e:
+            logger.warning("Retrieval failed: %s", e)
             documents = []
+
+        # A confident match needs fewer chunks graded and packed
+        known_scores = [score for score in scores or [] if score is not None]
+        if confident_k and confident_score is not None and known_scores and max(known_scores) >= confident_score:
+            documents = documents[:confident_k]
+            scores = scores[:confident_k]
             
-        return {"documents": documents, "question": question}
+        return {
+            "documents": documents,
+            "question": question,
+            "scores": scores,
+            "retrieval_attempt": 0,
+            "seen_chunks": [chunk_key(doc) for doc in documents],
+            "kept_documents": [],
+            "kept_scores": [],
+            "score_source": "similarity",
+        }
+
+    async def aretrieve(state: AgentState):
+        """Async variant of retrieve; the vector search runs in a worker thread."""
+        return await asyncio.to_thread(retrieve, state)
+
+    def grade_sequential(question, documents):
+        """Grades documents one call at a time; errors keep the document.
+
+        Like every grading strategy, returns the verdicts and the number of
+        LLM requests made.
+        """
+        verdicts = []
+        for doc in documents:
+            try:
+                score = retrieval_grader.invoke({"question": question, "document": doc})
+                verdicts.append(is_relevant(score, doc))
+            except Exception as e:
+                # On error, include the document to be safe
+                logger.warning("Grading failed, keeping the document: %s", e)
+                verdicts.append(True)
+        return verdicts, len(documents)
+
+    async def agrade_sequential(question, documents):
+        verdicts = []
+        for doc in documents:
+            try:
+                score = await retrieval_grader.ainvoke({"question": question, "document": doc})
+                verdicts.append(is_relevant(score, doc))
+            except Exception as e:
+                logger.warning("Grading failed, keeping the document: %s", e)
+                verdicts.append(True)
+        return verdicts, len(documents)
+
+    def _parallel_verdicts(scores, documents):
+        # On error, include the document to be safe
+        for score in scores:
+            if isinstance(score, Exception):
+                logger.warning("Grading failed, keeping the document: %s", score)
+        verdicts = [
+            True if isinstance(score, Exception) else is_relevant(score, doc)
+            for score, doc in zip(scores, documents)
+        ]
+        return verdicts, len(documents)
+
+    def grade_parallel(question, documents):
+        """Grades documents with concurrent per-document calls via .batch()."""
+        scores = retrieval_grader.batch(
+            [{"question": question, "document": doc} for doc in documents],
+            config={"max_concurrency": grader_max_concurrency},
+            return_exceptions=True,
+        )
+        return _parallel_verdicts(scores, documents)
+
+    async def agrade_parallel(question, documents):
+        scores = await retrieval_grader.abatch(
+            [{"question": question, "document": doc} for doc in documents],
+            config={"max_concurrency": grader_max_concurrency},
+            return_exceptions=True,
+        )
+        return _parallel_verdicts(scores, documents)
+
+    def _batched_verdicts(result, documents):
+        by_index = {v.index: v for v in getattr(result, "verdicts", None) or []}
+        return [
+            is_relevant(by_index[i], doc) if i in by_index else None
+            for i, doc in enumerate(documents)
+        ]
+
+    def grade_batched(question, documents):
+        """Grades all documents in one structured-output call.
+
+        Documents the model left without a verdict (or the whole set, if the
+        backend cannot produce multi-document output) are re-graded via fan-out.
+        """
+        try:
+            result = batch_grader.invoke({"question": question, "documents": documents})
+        except Exception as e:
+            logger.warning("Batch grading failed, grading one by one: %s", e)
+            result = None
+
+        verdicts = _batched_verdicts(result, documents)
+        missing = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        calls = 1
+        if missing:
+            fallback, fallback_calls = grade_parallel(question, [documents[i] for i in missing])
+            calls += fallback_calls
+            for i, verdict in zip(missing, fallback):
+                verdicts[i] = verdict
+        return verdicts, calls
+
+    async def agrade_batched(question, documents):
+        try:
+            result = await batch_grader.ainvoke({"question": question, "documents": documents})
+        except Exception as e:
+            logger.warning("Batch grading failed, grading one by one: %s", e)
+            result = None
+
+        verdicts = _batched_verdicts(result, documents)
+        missing = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        calls = 1
+        if missing:
+            fallback, fallback_calls = await agrade_parallel(question, [documents[i] for i in missing])
+            calls += fallback_calls
+            for i, verdict in zip(missing, fallback):
+                verdicts[i] = verdict
+        return verdicts, calls
+
+    def prefilter(documents, scores, score_source="similarity"):
+        """Decides clear-cut documents from their similarity or re-ranking scores.
+
+        Returns a list with True (auto-accept), False (auto-reject) or None
+        (ambiguous, needs the LLM grader) for each document.
+        """
+        if not scores or len(scores) != len(documents):
+            return [None] * len(documents)
+
+        accept, reject = accept_threshold, reject_threshold
+        if score_source == "rerank":
+            accept, reject = rerank_accept_threshold, rerank_reject_threshold
+
+        decisions = []
+        for score in scores:
+            if score is None:
+                decisions.append(None)
+            elif accept is not None and score >= accept:
+                decisions.append(True)
+            elif reject is not None and score <= reject:
+                decisions.append(False)
+            else:
+                decisions.append(None)
+        return decisions
+
+    def select_grader(is_async):
+        """Picks the LLM grading strategy for the configured mode."""
+        if grading_mode == "batch" and batch_grader is not None:
+            return agrade_batched if is_async else grade_batched
+        if grading_mode in ("batch", "parallel"):
+            return agrade_parallel if is_async else grade_parallel
+        return agrade_sequential if is_async else grade_sequential
+
+    def apply_verdicts(state, verdicts, pending, llm_verdicts, grader_calls=0):
+        """Merges pre-filter and LLM verdicts into the node's state update."""
+        documents = state['documents']
+        scores = state.get('scores')
+
+        for i, verdict in zip(pending, llm_verdicts):
+            verdicts[i] = verdict
+
+        filtered_docs = [doc for doc, keep in zip(documents, verdicts) if keep]
+        if scores and len(scores) == len(documents):
+            scores = [score for score, keep in zip(scores, verdicts) if keep]
+        grading_stats = {
+            "auto_accepted": sum(1 for i, v in enumerate(verdicts) if v and i not in pending),
+            "auto_rejected": sum(1 for i, v in enumerate(verdicts) if not v and i not in pending),
+            "llm_graded": len(pending),
+            "llm_calls_saved": len(documents) - len(pending),
+            "grader_calls": grader_calls,
+        }
+
+        # After a widened retrieval, keep the chunks accepted on earlier attempts
+        kept = state.get('kept_documents') or []
+        if kept:
+            kept_scores = state.get('kept_scores')
+            if kept_scores and len(kept_scores) == len(kept) and scores and len(scores) == len(filtered_docs):
+                scores = kept_scores + scores
+            else:
+                scores = None
+            filtered_docs = kept + filtered_docs
+        if state.get('retrieval_attempt'):
+            previous = state.get('grading_stats') or {}
+            grading_stats = {key: value + previous.get(key, 0) for key, value in grading_stats.items()}
+        grading_stats["retrieval_attempts"] = state.get('retrieval_attempt', 0) + 1
+        
+        return {
+            "documents": filtered_docs,
+            "question": state['question'],
+            "scores": scores,
+            "grading_stats": grading_stats,
+            "kept_documents": [],
+            "kept_scores": [],
+        }
 
     def grade_documents(state: AgentState):
         """Grades and filters documents based on relevance to the question."""
         question = state['question']
         documents = state['documents']
 
-        filtered_docs = []
-        for i, doc in enumerate(documents):
+        verdicts = prefilter(documents, state.get('scores'), state.get('score_source', "similarity"))
+        pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        pending_docs = [documents[i] for i in pending]
+
+        llm_verdicts, calls = select_grader(False)(question, pending_docs) if pending_docs else ([], 0)
+        return apply_verdicts(state, verdicts, pending, llm_verdicts, calls)
+
+    async def agrade_documents(state: AgentState):
+        """Async variant of grade_documents."""
+        question = state['question']
+        documents = state['documents']
+
+        verdicts = prefilter(documents, state.get('scores'), state.get('score_source', "similarity"))
+        pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+        pending_docs = [documents[i] for i in pending]
+
+        llm_verdicts, calls = await select_grader(True)(question, pending_docs) if pending_docs else ([], 0)
+        return apply_verdicts(state, verdicts, pending, llm_verdicts, calls)
+
+    def rerank(state: AgentState):
+        """Scores all documents against the question in one cross-encoder batch.
+
+        Documents are reordered best first and the cross-encoder scores replace
+        the similarity scores. In "replace" mode they also decide relevance.
+        """
+        question = state['question']
+        documents = state['documents']
+        try:
+            scores = reranker.score(question, documents)
+        except Exception as e:
+            logger.warning("Re-ranking failed: %s", e)
+            if rerank_mode == "replace":
+                # On error, include the documents to be safe
+                return apply_verdicts(state, [True] * len(documents), [], [])
+            return {"score_source": state.get('score_source', "similarity")}
+
+        order = sorted(range(len(documents)), key=lambda i: -scores[i])
+        update = {
+            "documents": [documents[i] for i in order],
+            "scores": [scores[i] for i in order],
+            "score_source": "rerank",
+        }
+        if rerank_mode != "replace":
+            return update
+
+        verdicts = [
+            score >= rerank_threshold and (rerank_top_n is None or rank < rerank_top_n)
+            for rank, score in enumerate(update["scores"])
+        ]
+        return {**update, **apply_verdicts({**state, **update}, verdicts, [], [])}
+
+    async def arerank(state: AgentState):
+        """Async variant of rerank; the model runs in a worker thread."""
+        return await asyncio.to_thread(rerank, state)
+
+    def route_after_grading(state: AgentState):
+        """Widens retrieval while too few chunks passed grading and retries remain."""
+        if len(state['documents']) >= min_relevant or state.get('retrieval_attempt', 0) >= max_retries:
+            return "generate"
+        return "widen"
+
+    def widen_strategy(state):
+        attempt = state.get('retrieval_attempt', 0) + 1
+        strategy = widen_strategies[min(attempt, len(widen_strategies)) - 1]
+        if strategy == "rewrite" and question_rewriter is None:
+            strategy = "expand"
+        return attempt, strategy
+
+    def widened_update(state, attempt, strategy, query):
+        """Retrieves a wider candidate set, dropping chunks graded before."""
+        k = retrieval_k * expand_factor
+        try:
+            if strategy == "mmr":
+                documents = retriever.vectorstore.max_marginal_relevance_search(query, k=k, fetch_k=4 * k)
+                scores = None
+            else:
+                documents, scores = _retrieve_with_scores(retriever, query, k=k)
+        except Exception as e:
+            logger.warning("Widened retrieval (%s) failed: %s", strategy, e)
+            documents, scores = [], None
+
+        seen = set(state.get('seen_chunks') or [])
+        fresh = [i for i, doc in enumerate(documents) if chunk_key(doc) not in seen]
+        return {
+            "documents": [documents[i] for i in fresh],
+            "scores": [scores[i] for i in fresh] if scores else None,
+            "retrieval_attempt": attempt,
+            "seen_chunks": list(seen) + [chunk_key(documents[i]) for i in fresh],
+            "kept_documents": state['documents'],
+            "kept_scores": state.get('scores') or [],
+            "score_source": "similarity",
+        }
+
+    def widen_retrieval(state: AgentState):
+        """Retries retrieval with a larger k, MMR or a rewritten query."""
+        attempt, strategy = widen_strategy(state)
+        query = state['question']
+        if strategy == "rewrite":
             try:
-                score = retrieval_grader.invoke({"question": question, "document": doc})
-                grade = score.binary_score if hasattr(score, 'binary_score') else str(score)
-
-                # Handle various response formats - be more permissive for NIST documents
-                grade_str = str(grade).lower().strip()
-                is_relevant = (
-                    'yes' in grade_str or 
-                    grade_str.startswith('y') or
-                    'nist' in doc.page_content.lower() and 'cybersecurity framework' in doc.page_content.lower()
-                )
-                
-                if is_relevant:
-                    filtered_docs.append(doc)
+                with llm_limiter or nullcontext():
+                    query = question_rewriter.invoke({"question": query}).strip() or query
             except Exception as e:
-                # On error, include the document to be safe
-                filtered_docs.append(doc)
-        
-        return {"documents": filtered_docs, "question": question}
+                logger.warning("Question rewrite failed, keeping the question: %s", e)
+        return widened_update(state, attempt, strategy, query)
+
+    async def awiden_retrieval(state: AgentState):
+        """Async variant of widen_retrieval."""
+        attempt, strategy = widen_strategy(state)
+        query = state['question']
+        if strategy == "rewrite":
+            try:
+                async with llm_limiter or nullcontext():
+                    query = (await question_rewriter.ainvoke({"question": query})).strip() or query
+            except Exception as e:
+                logger.warning("Question rewrite failed, keeping the question: %s", e)
+        return await asyncio.to_thread(widened_update, state, attempt, strategy, query)
+
+    def token_usage(question, generation, context_tokens):
+        if not context_tokens:
+            return {"prompt_tokens": 0, "completion_tokens": 0}
+        count_tokens = context_builder.count_tokens
+        return {
+            "prompt_tokens": context_tokens + count_tokens(question),
+            "completion_tokens": count_tokens(generation),
+        }
+
+    def generate(state: AgentState, config: RunnableConfig):
+        """Generates an answer using the filtered documents as context.
 
-    def generate(state: AgentState):
-        """Generates an answer using the filtered documents as context."""
+        Tokens are streamed as they arrive and emitted as ``{"token": ...}``
+        events on the graph's "custom" stream mode. Only the documents that fit
+        in the context budget are kept in the state, so sources match the prompt.
+        ``token_usage`` holds the prompt (context and question) and completion
+        token counts, estimated with the context builder's counter.
+        """
         question = state["question"]
         documents = state["documents"]
+        scores = state.get("scores")
+        context_tokens = 0
 
         # Check if we have any relevant documents
         if not documents or len(documents) == 0:
             generation = "question was not at all relevant"
         else:
-            generation = rag_chain.invoke({"context": documents, "question": question})
+            context, documents, context_tokens = context_builder.build(documents, scores)
+            scores = scores_for(state["documents"], scores, documents)
+            writer = get_stream_writer()
+            generation = ""
+            with llm_limiter or nullcontext():
+                for token in rag_chain.stream({"context": context, "question": question}, config):
+                    generation += token
+                    writer({"token": token})
         
-        return {"documents": documents, "question": question, "generation": generation}
+        return {
+            "documents": documents,
+            "scores": scores,
+            "question": question,
+            "generation": generation,
+            "context_tokens": context_tokens,
+            "token_usage": token_usage(question, generation, context_tokens),
+        }
+
+    async def agenerate(state: AgentState, config: RunnableConfig):
+        """Async variant of generate."""
+        question = state["question"]
+        documents = state["documents"]
+        scores = state.get("scores")
+        context_tokens = 0
+
+        if not documents or len(documents) == 0:
+            generation = "question was not at all relevant"
+        else:
+            context, documents, context_tokens = context_builder.build(documents, scores)
+            scores = scores_for(state["documents"], scores, documents)
+            writer = get_stream_writer()
+            generation = ""
+            async with llm_limiter or nullcontext():
+                async for token in rag_chain.astream({"context": context, "question": question}, config):
+                    generation += token
+                    writer({"token": token})
+
+        return {
+            "documents": documents,
+            "scores": scores,
+            "question": question,
+            "generation": generation,
+            "context_tokens": context_tokens,
+            "token_usage": token_usage(question, generation, context_tokens),
+        }
 
-    return {
+    nodes = {
         "retrieve": retrieve,
         "grade_documents": grade_documents,
-        "generate": generate
-    }
\ No newline at end of file
+        "generate": generate,
+        "aretrieve": aretrieve,
+        "agrade_documents": agrade_documents,
+        "agenerate": agenerate,
+    }
+    if max_retries > 0:
+        nodes.update(
+            {
+                "widen_retrieval": widen_retrieval,
+                "awiden_retrieval": awiden_retrieval,
+                "route_after_grading": route_after_grading,
+            }
+        )
+    if reranker is not None:
+        nodes.update({"rerank": rerank, "arerank": arerank})
+        if rerank_mode == "replace":
+            del nodes["grade_documents"], nodes["agrade_documents"]
+    return nodes
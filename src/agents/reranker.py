@@ -0,0 +1,35 @@
+import threading
+
+
+class CrossEncoderReranker:
+    """Scores (question, chunk) pairs with a small local cross-encoder.
+
+    The sentence-transformers model is loaded on first use and every call
+    scores all chunks in one batched forward pass on the CPU. Scores are
+    relevance probabilities in [0, 1] (the model's default sigmoid activation
+    for single-label cross-encoders).
+    """
+
+    def __init__(self, model_name="cross-encoder/ms-marco-MiniLM-L-6-v2", batch_size=32, max_length=512):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self._model
+
+    def score(self, question, documents):
+        """Returns one relevance score per document, in input order"""
+        if not documents:
+            return []
+        pairs = [(question, doc.page_content) for doc in documents]
+        scores = self._get_model().predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return [float(score) for score in scores]
@@ -0,0 +1,172 @@
+import asyncio
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "how", "in", "is", "it", "of", "on", "or", "should", "that", "the", "their", "this",
+    "to", "what", "when", "which", "who", "why", "with",
+}
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+# Approximate output tokens of one structured grading verdict
+_VERDICT_TOKENS = 8
+
+
+def content_words(text):
+    return [word for word in _WORD.findall(text.lower()) if word not in _STOPWORDS and len(word) > 2]
+
+
+def term_overlap(question, text):
+    """Fraction of the question's content words that occur in ``text``"""
+    terms = set(content_words(question))
+    if not terms:
+        return 0.0
+    return len(terms & set(content_words(text))) / len(terms)
+
+
+def _prompt_text(value):
+    if hasattr(value, "to_string"):
+        return value.to_string()
+    if isinstance(value, list):
+        return "\n".join(str(getattr(message, "content", message)) for message in value)
+    return str(value)
+
+
+def _section(text, start, end=None):
+    pattern = re.escape(start) + (r"(.*?)" + re.escape(end) if end else r"(.*)")
+    match = re.search(pattern, text, re.S)
+    return match.group(1).replace("\\n", " ").strip() if match else ""
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic offline stand-in for the Ollama chat model.
+
+    It needs no server or weights, so the full workflow can run in sandboxes
+    and CI. Relevance grading is decided by the overlap between the question's
+    content words and the document (``relevance_threshold``). Answers are the
+    context sentences that best match the question. Rewritten queries are the
+    question's content words.
+
+    ``latency_ms`` is waited before the first token and ``tokens_per_s``
+    paces the output (0 disables either), so load tests see the call
+    durations of a real backend. Async calls wait without holding a thread.
+    """
+
+    relevance_threshold: float = 0.5
+    answer_sentences: int = 2
+    latency_ms: float = 0.0
+    tokens_per_s: float = 0.0
+
+    def _token_delay(self):
+        return 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+
+    def _call_delay(self, tokens):
+        return self.latency_ms / 1000.0 + tokens * self._token_delay()
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _respond(self, text):
+        if "Context:" in text:
+            question = _section(text, "answer this question:", "Context:")
+            context = _section(text, "Context:", "Answer:")
+            sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", context) if len(s.split()) > 3]
+            best = sorted(sentences, key=lambda s: -term_overlap(question, s))[: self.answer_sentences]
+            # Keep the picked sentences in context order
+            return " ".join(s for s in sentences if s in best) or "I don't have the retrieved context to answer."
+        question = _section(text, "Question:", "Query:") or text
+        return " ".join(content_words(question))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        answer = self._respond(_prompt_text(messages))
+        time.sleep(self._call_delay(len(answer.split())))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        answer = self._respond(_prompt_text(messages))
+        await asyncio.sleep(self._call_delay(len(answer.split())))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_ms / 1000.0)
+        for token in re.findall(r"\S+\s*", self._respond(_prompt_text(messages))):
+            time.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        for token in re.findall(r"\S+\s*", self._respond(_prompt_text(messages))):
+            await asyncio.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def grade(self, schema, prompt):
+        """Structured grading verdict for the grader prompts in agents.graders"""
+        text = _prompt_text(prompt)
+        question = _section(text, "User question:")
+
+        def verdict(document):
+            return "yes" if term_overlap(question, document) >= self.relevance_threshold else "no"
+
+        if "verdicts" in schema.model_fields:
+            body = _section(text, "Retrieved documents:", "User question:")
+            documents = re.split(r"\[\d+\] ", body)[1:]
+            verdict_schema = schema.model_fields["verdicts"].annotation.__args__[0]
+            return schema(
+                verdicts=[verdict_schema(index=i, binary_score=verdict(doc)) for i, doc in enumerate(documents)]
+            )
+        return schema(binary_score=verdict(_section(text, "Retrieved document:", "User question:")))
+
+    def _verdict_count(self, result):
+        return len(getattr(result, "verdicts", None) or [result])
+
+    def with_structured_output(self, schema, **kwargs):
+        def invoke(prompt):
+            result = self.grade(schema, prompt)
+            time.sleep(self._call_delay(_VERDICT_TOKENS * self._verdict_count(result)))
+            return result
+
+        async def ainvoke(prompt):
+            result = self.grade(schema, prompt)
+            await asyncio.sleep(self._call_delay(_VERDICT_TOKENS * self._verdict_count(result)))
+            return result
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"Stub{schema.__name__}")
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from agents.metrics import METRICS
+from config import API_HOST, API_PORT, API_MAX_INFLIGHT, API_MAX_QUEUE
+
+
+class QueryRequest(BaseModel):
+    question: str
+
+
+class AdmissionController:
+    """Bounds concurrent workflow runs and the number of requests waiting for one.
+
+    Up to ``max_inflight`` requests run at once and up to ``max_queue`` more
+    wait for a slot. Anything beyond that is rejected immediately, so overload
+    shows up as fast 503s instead of ever-growing latency.
+    """
+
+    def __init__(self, max_inflight, max_queue):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = None
+
+    def try_enter(self):
+        """Reserve a place in line, or return False when the queue is full"""
+        if self.active + self.waiting >= self.max_inflight + self.max_queue:
+            return False
+        self.waiting += 1
+        return True
+
+    async def acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Streaming response that frees its admission slot however it ends.
+
+    The slot is released here rather than in the body generator, whose
+    ``finally`` never runs if the client disconnects before the first chunk.
+    """
+
+    def __init__(self, content, admission, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.admission.release()
+
+
+def _format_sources(documents):
+    sources = []
+    for doc in documents or []:
+        metadata = getattr(doc, "metadata", {}) or {}
+        sources.append(
+            {
+                "content": doc.page_content,
+                "source": metadata.get("source", "Unknown source"),
+                "title": metadata.get("title", "Untitled"),
+                "page": metadata.get("page", "Unknown page"),
+                # Near-duplicate chunks collapsed into this one at ingest
+                "also_in": [
+                    {"source": entry.get("source"), "page": entry.get("page")}
+                    for entry in json.loads(metadata.get("duplicates") or "[]")
+                ],
+            }
+        )
+    return sources
+
+
+def _format_result(result, started):
+    return {
+        "answer": result.get("generation", ""),
+        "sources": _format_sources(result.get("documents")),
+        "cache_hit": bool(result.get("cache_hit")),
+        "grading_stats": result.get("grading_stats"),
+        "context_tokens": result.get("context_tokens"),
+        "profile": result.get("profile"),
+        "latency_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def create_api(rag_app, max_inflight=API_MAX_INFLIGHT, max_queue=API_MAX_QUEUE):
+    """Create the HTTP API around an already compiled workflow.
+
+    Args:
+        rag_app: Compiled workflow (optionally wrapped in CachedWorkflow)
+        max_inflight: Workflow runs executing at the same time
+        max_queue: Requests allowed to wait for a free slot before new ones
+            are rejected with 503
+
+    Returns:
+        FastAPI application
+    """
+    api = FastAPI(title="Cybersecurity RAG Agent")
+    admission = AdmissionController(max_inflight, max_queue)
+
+    def admit():
+        if not admission.try_enter():
+            raise HTTPException(
+                status_code=503,
+                detail="Server is at capacity, retry shortly",
+                headers={"Retry-After": "1"},
+            )
+
+    @api.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "active": admission.active,
+            "waiting": admission.waiting,
+            "max_inflight": admission.max_inflight,
+            "max_queue": admission.max_queue,
+        }
+
+    @api.get("/metrics")
+    async def metrics():
+        """Prometheus metrics of every question answered by this process"""
+        return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+    @api.post("/query")
+    async def query(request: QueryRequest):
+        admit()
+        started = time.perf_counter()
+        await admission.acquire()
+        try:
+            result = await rag_app.ainvoke({"question": request.question})
+        finally:
+            admission.release()
+        return _format_result(result, started)
+
+    @api.post("/query/stream")
+    async def query_stream(request: QueryRequest):
+        """Streams newline-delimited JSON: token lines, then one final result line"""
+        admit()
+        started = time.perf_counter()
+        await admission.acquire()
+
+        async def events():
+            result = {}
+            try:
+                async for mode, chunk in rag_app.astream(
+                    {"question": request.question}, stream_mode=["custom", "values"]
+                ):
+                    if mode == "custom" and "token" in chunk:
+                        yield json.dumps({"token": chunk["token"]}) + "\n"
+                    elif mode == "values":
+                        result = chunk
+                yield json.dumps({"final": _format_result(result, started)}) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+
+        return _AdmittedStreamingResponse(events(), admission, media_type="application/x-ndjson")
+
+    return api
+
+
+def main():
+    import uvicorn
+
+    from main import setup_rag_system
+
+    # The workflow (models, vector store, caches) is loaded once and shared
+    # by every request; concurrent requests are micro-batched
+    rag_app = setup_rag_system(micro_batching=True)
+    uvicorn.run(create_api(rag_app), host=API_HOST, port=API_PORT)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import streamlit as st
+import json
 import os
 import time
 from main import setup_rag_system
@@ -11,6 +12,49 @@ st.set_page_config(
 )
 
 
+def format_also_in(duplicates):
+    """Citation line for near-duplicate chunks collapsed into this one at ingest"""
+    if not duplicates:
+        return ""
+    entries = json.loads(duplicates) if isinstance(duplicates, str) else duplicates
+    locations = [
+        f"{entry.get('source', 'Unknown source').replace('documents/', '')} (Page {entry.get('page', '?')})"
+        for entry in entries
+    ]
+    return "📎 **Also in:** " + ", ".join(locations)
+
+
+# Sidebar labels for the workflow nodes, in pipeline order
+NODE_LABELS = {
+    "retrieve": "Retrieval",
+    "rerank": "Re-ranking",
+    "grade_documents": "Grading",
+    "widen_retrieval": "Widened retrieval",
+    "generate": "Generation",
+}
+
+
+def render_query_profile(profile):
+    """Sidebar breakdown of where the time of one question went"""
+    st.header("⏱️ Last Query")
+    if profile.get("cache_hit"):
+        st.caption(f"Answered from cache in {profile['latency_s']:.2f}s")
+        return
+
+    nodes = profile.get("nodes", {})
+    rows = [(NODE_LABELS[name], nodes[name]) for name in NODE_LABELS if name in nodes]
+    rows.append(("Total", profile["latency_s"]))
+    st.markdown("\n".join(f"- **{label}:** {seconds:.2f}s" for label, seconds in rows))
+    st.caption(
+        f"{profile['grader_calls']} grader calls · "
+        f"{profile['auto_accepted'] + profile['auto_rejected']} chunks pre-filtered · "
+        f"{profile['retrieval_attempts']} retrieval attempts"
+    )
+    st.caption(f"~{profile['prompt_tokens']} prompt / ~{profile['completion_tokens']} completion tokens")
+    if profile.get("scores"):
+        st.caption("Chunk scores: " + ", ".join(f"{score:.2f}" for score in profile["scores"]))
+
+
 @st.cache_resource
 def initialize_rag_system():
     """Initialize the RAG system once and cache it"""
@@ -18,7 +62,7 @@ def initialize_rag_system():
         # Check if vector database exists
         import os
 
-        from config import get_chroma_persist_directory
+        from config import get_chroma_persist_directory, METRICS_PORT
         persist_directory = get_chroma_persist_directory()
         if not os.path.exists(persist_directory):
             st.error(
@@ -26,6 +70,10 @@ def initialize_rag_system():
             )
             return None
 
+        if METRICS_PORT:
+            from agents.metrics import start_metrics_server
+            start_metrics_server(METRICS_PORT)
+
         return setup_rag_system()
     except Exception as e:
         st.error(f"Failed to initialize RAG system: {str(e)}")
@@ -120,6 +168,16 @@ def main():
                             st.rerun()
         
         st.markdown("---")
+
+        # Timing breakdown of the latest answer in this conversation
+        current_messages = st.session_state.conversations[st.session_state.current_session_id]["messages"]
+        last_profile = next(
+            (msg["profile"] for msg in reversed(current_messages) if msg.get("profile")), None
+        )
+        if last_profile:
+            render_query_profile(last_profile)
+            st.markdown("---")
+
         st.header("About")
         st.markdown(
             """
@@ -161,6 +219,19 @@ def main():
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
+            if message.get("cached"):
+                st.caption("⚡ Answered from cache")
+
+            if "metrics" in message:
+                metrics = message["metrics"]
+                timings = []
+                if "ttft_s" in metrics:
+                    timings.append(f"first token {metrics['ttft_s']}s")
+                timings.append(f"total {metrics['total_s']}s")
+                if metrics.get("context_tokens"):
+                    timings.append(f"context {metrics['context_tokens']} tokens")
+                st.caption("⏱️ " + " · ".join(timings))
+
             if "sources" in message:
                 with st.expander(
                     f"📚 Sources ({len(message['sources'])} documents)", expanded=False
@@ -172,6 +243,7 @@ def main():
                             title = source.get("title", "Untitled")
                             page = source.get("page", "Unknown page")
                             content_preview = source.get("content", "")
+                            also_in = format_also_in(source.get("duplicates"))
                         else:
                             # Legacy format support
                             metadata = (
@@ -180,6 +252,7 @@ def main():
                             source_file = metadata.get("source", "Unknown source")
                             title = metadata.get("title", "Untitled")
                             page = metadata.get("page", "Unknown page")
+                            also_in = format_also_in(metadata.get("duplicates"))
                             content_preview = (
                                 source.page_content[:200] + "..."
                                 if len(source.page_content) > 200
@@ -198,6 +271,8 @@ def main():
                         
                         📁 **File:** {source_file} (Page {page})
                         
+                        {also_in}
+                        
                         {content_preview}
                         """
                         )
@@ -230,38 +305,57 @@ def main():
             full_response = ""
 
             try:
+                # Stream tokens from the Content_Generator node as they arrive
+                inputs = {"question": prompt}
+                result = {}
+                start_time = time.time()
+                first_token_time = None
+
+                # Sync path: the cached models' async clients are bound to the
+                # event loop that created them, so no per-message loop is used.
+                # LLM calls from threads share the process-wide concurrency limit
                 with st.spinner("Thinking..."):
-                    # Invoke the RAG system
-                    inputs = {"question": prompt}
-                    result = st.session_state.rag_app.invoke(inputs)
-
-                    # Process the answer
-                    if "generation" in result and result["generation"]:
-                        answer_content = str(result["generation"]).strip()
-
-                        if (
-                            answer_content.strip() == "question was not at all relevant"
-                            or "I don't have the retrieved context" in answer_content
-                        ):
-                            answer = "⚠️ The question doesn't appear to be related to the cybersecurity documents in our knowledge base. Please ask questions about NIST cybersecurity frameworks, security controls, or incident handling."
-                        elif (
-                            not result.get("documents") or len(result["documents"]) == 0
-                        ):
-                            answer = "⚠️ No relevant documents were found for your question. Please try rephrasing or ask questions about NIST cybersecurity frameworks, security controls, or incident handling."
-                        else:
-                            answer = answer_content
+                    for mode, chunk in st.session_state.rag_app.stream(
+                        inputs, stream_mode=["custom", "values"]
+                    ):
+                        if mode == "values":
+                            result = chunk
+                        elif mode == "custom" and "token" in chunk:
+                            if first_token_time is None:
+                                first_token_time = time.time()
+                            full_response += chunk["token"]
+                            message_placeholder.markdown(full_response + "▌")
+
+                total_time = time.time() - start_time
+
+                # Process the answer
+                if "generation" in result and result["generation"]:
+                    answer_content = str(result["generation"]).strip()
+
+                    if (
+                        answer_content.strip() == "question was not at all relevant"
+                        or "I don't have the retrieved context" in answer_content
+                    ):
+                        answer = "⚠️ The question doesn't appear to be related to the cybersecurity documents in our knowledge base. Please ask questions about NIST cybersecurity frameworks, security controls, or incident handling."
+                    elif (
+                        not result.get("documents") or len(result["documents"]) == 0
+                    ):
+                        answer = "⚠️ No relevant documents were found for your question. Please try rephrasing or ask questions about NIST cybersecurity frameworks, security controls, or incident handling."
                     else:
-                        answer = "I couldn't generate a response. Please try rephrasing your question."
-
-                # Simulate streaming by displaying response character by character
-                for i in range(len(answer)):
-                    full_response += answer[i]
-                    message_placeholder.markdown(full_response + "▌")
-                    time.sleep(0.02)  # Adjust speed of streaming
+                        answer = answer_content
+                else:
+                    answer = "I couldn't generate a response. Please try rephrasing your question."
 
                 # Final response without cursor
+                full_response = answer
                 message_placeholder.markdown(full_response)
 
+                metrics = {"total_s": round(total_time, 2)}
+                if first_token_time is not None:
+                    metrics["ttft_s"] = round(first_token_time - start_time, 2)
+                if result.get("context_tokens"):
+                    metrics["context_tokens"] = result["context_tokens"]
+
                 # Render sources if available
                 sources = result.get("documents", [])
                 if sources:
@@ -273,6 +367,7 @@ def main():
                             source_file = metadata.get("source", "Unknown source")
                             title = metadata.get("title", "Untitled")
                             page = metadata.get("page", "Unknown page")
+                            also_in = format_also_in(metadata.get("duplicates"))
 
                             if source_file.startswith("documents/"):
                                 source_file = source_file.replace("documents/", "")
@@ -289,6 +384,8 @@ def main():
                             
                             📁 **File:** {source_file} (Page {page})
                             
+                            {also_in}
+                            
                             {content_preview}
                             """
                             )
@@ -301,6 +398,11 @@ def main():
                     "content": full_response,
                     "timestamp": time.time(),
                 }
+                if result.get("cache_hit"):
+                    assistant_message["cached"] = True
+                assistant_message["metrics"] = metrics
+                if result.get("profile"):
+                    assistant_message["profile"] = result["profile"]
 
                 # Store sources more efficiently - only essential metadata
                 if sources:
@@ -312,6 +414,7 @@ def main():
                             "source": doc.metadata.get("source", "Unknown"),
                             "title": doc.metadata.get("title", "Untitled"),
                             "page": doc.metadata.get("page", "Unknown"),
+                            "duplicates": doc.metadata.get("duplicates", ""),
                         }
                         for doc in sources
                     ]
@@ -1,10 +1,16 @@
 import os
-from langchain_ollama import ChatOllama
-from langchain_huggingface import HuggingFaceEmbeddings
+import tempfile
+from functools import lru_cache
 
 # Centralized path configuration to prevent multiple chroma_db folders
 def get_chroma_persist_directory():
     """Get the absolute path for ChromaDB persistence directory"""
+    if os.getenv("RAG_CHROMA_DIR"):
+        # Explicit location, e.g. a scratch index for benchmarks
+        persist_dir = os.path.abspath(os.environ["RAG_CHROMA_DIR"])
+        os.makedirs(persist_dir, exist_ok=True)
+        return persist_dir
+
     # Always resolve relative to /app in Docker container
     if os.path.exists('/app'):
         # Running in Docker container
@@ -17,8 +23,179 @@ def get_chroma_persist_directory():
     os.makedirs(persist_dir, exist_ok=True)
     return persist_dir
 
-def get_embeddings():
-    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+# Document grading strategy: "batch" scores all retrieved chunks in one
+# structured-output call, "parallel" fans out one call per chunk via .batch(),
+# "sequential" grades chunks one after another.
+GRADING_MODE = os.getenv("RAG_GRADING_MODE", "batch")
+GRADER_MAX_CONCURRENCY = int(os.getenv("RAG_GRADER_MAX_CONCURRENCY", "4"))
+
+# Maximum in-flight LLM calls (grading and generation) to the Ollama backend,
+# shared by every session served from this process
+LLM_MAX_CONCURRENCY = int(os.getenv("RAG_LLM_MAX_CONCURRENCY", "4"))
+
+# Token budget for the retrieved context in the generation prompt
+CONTEXT_MAX_TOKENS = int(os.getenv("RAG_CONTEXT_MAX_TOKENS", "2000"))
+# Hugging Face tokenizer used to count context tokens; empty = padded estimate
+CONTEXT_TOKENIZER = os.getenv("RAG_CONTEXT_TOKENIZER", "")
+
+# HTTP query service: admission limits and micro-batching of concurrent requests
+API_HOST = os.getenv("RAG_API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("RAG_API_PORT", "8000"))
+API_MAX_INFLIGHT = int(os.getenv("RAG_API_MAX_INFLIGHT", "16"))
+API_MAX_QUEUE = int(os.getenv("RAG_API_MAX_QUEUE", "64"))
+# Applies to query embeddings, and to grading only in parallel/sequential mode
+MICRO_BATCH_MAX_SIZE = int(os.getenv("RAG_MICRO_BATCH_MAX_SIZE", "32"))
+MICRO_BATCH_MAX_WAIT_MS = int(os.getenv("RAG_MICRO_BATCH_MAX_WAIT_MS", "10"))
+
+# Similarity pre-filter: chunks whose cosine similarity to the question is at or
+# above the accept threshold (or at or below the reject threshold) skip the LLM
+# grader. Both sides are off by default: useful values depend on the embedding
+# model and corpus, so calibrate them against the grader's verdicts first.
+def _optional_float(name, default):
+    value = os.getenv(name, default)
+    return float(value) if value else None
+
+SIMILARITY_ACCEPT_THRESHOLD = _optional_float("RAG_SIMILARITY_ACCEPT_THRESHOLD", "")
+SIMILARITY_REJECT_THRESHOLD = _optional_float("RAG_SIMILARITY_REJECT_THRESHOLD", "")
+
+# Adaptive retrieval: keep only ADAPTIVE_CONFIDENT_K chunks when the best match
+# is at least ADAPTIVE_CONFIDENT_SCORE similar; when fewer than
+# ADAPTIVE_MIN_RELEVANT chunks pass grading, retry up to ADAPTIVE_MAX_RETRIES
+# times with the next strategy (expand, mmr or rewrite) and grade the new chunks
+ADAPTIVE_CONFIDENT_K = int(os.getenv("RAG_ADAPTIVE_CONFIDENT_K", "2"))
+ADAPTIVE_CONFIDENT_SCORE = _optional_float("RAG_ADAPTIVE_CONFIDENT_SCORE", "0.85")
+ADAPTIVE_MIN_RELEVANT = int(os.getenv("RAG_ADAPTIVE_MIN_RELEVANT", "1"))
+ADAPTIVE_MAX_RETRIES = int(os.getenv("RAG_ADAPTIVE_MAX_RETRIES", "2"))
+ADAPTIVE_STRATEGIES = tuple(os.getenv("RAG_ADAPTIVE_STRATEGIES", "expand,rewrite").split(","))
+ADAPTIVE_EXPAND_FACTOR = int(os.getenv("RAG_ADAPTIVE_EXPAND_FACTOR", "3"))
+
+# Cross-encoder re-ranking: off | prestage (scores drive the grading pre-filter,
+# ambiguous chunks still go to the LLM grader) | replace (chunks scoring at least
+# RERANK_THRESHOLD, at most RERANK_TOP_N of them, skip LLM grading entirely)
+RERANK_MODE = os.getenv("RAG_RERANK_MODE", "off")
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_THRESHOLD = float(os.getenv("RAG_RERANK_THRESHOLD", "0.5"))
+RERANK_TOP_N = int(os.getenv("RAG_RERANK_TOP_N", "0")) or None
+RERANK_ACCEPT_THRESHOLD = _optional_float("RAG_RERANK_ACCEPT_THRESHOLD", "0.9")
+RERANK_REJECT_THRESHOLD = _optional_float("RAG_RERANK_REJECT_THRESHOLD", "0.05")
+
+# Query profiling: log one JSON line per question, and serve Prometheus metrics
+# from the Streamlit process on METRICS_PORT (0 disables; the API serves /metrics)
+METRICS_LOG_QUERIES = os.getenv("RAG_METRICS_LOG_QUERIES", "1") == "1"
+METRICS_PORT = int(os.getenv("RAG_METRICS_PORT", "0"))
+
+# Semantic answer cache in front of the compiled workflow
+ANSWER_CACHE_ENABLED = os.getenv("RAG_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "256"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("RAG_ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Worker processes used to parse PDFs during ingestion
+LOADER_WORKERS = int(os.getenv("RAG_LOADER_WORKERS", str(os.cpu_count() or 1)))
+
+# Chunks embedded and inserted per batch, and sentence-transformers encoding
+# processes used while building the vector store
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+EMBED_WORKERS = int(os.getenv("RAG_EMBED_WORKERS", "1"))
+
+# Stream PDFs page by page into the vector store instead of building the full
+# page and chunk lists (and their chunk store caches) in memory
+STREAMING_INGEST = os.getenv("RAG_STREAMING_INGEST", "0") == "1"
+
+# Collapse near-duplicate chunks (MinHash/LSH over word shingles) at ingest,
+# keeping one canonical chunk that lists every duplicate's source and page.
+# Opt-in: it shrinks the bundled NIST corpus by under 1%
+DEDUP_ENABLED = os.getenv("RAG_DEDUP", "0") == "1"
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Chat model backend: "ollama" (llama3.2) or "stub", a deterministic offline
+# model for benchmarks and tests (see src/agents/stub_llm.py)
+LLM_BACKEND = os.getenv("RAG_LLM_BACKEND", "ollama")
+
+# Stub chat model timing: delay before the first token and streaming speed, so
+# load tests see realistic call durations (0 means instant)
+STUB_LLM_LATENCY_MS = float(os.getenv("RAG_STUB_LLM_LATENCY_MS", "0"))
+STUB_LLM_TOKENS_PER_S = float(os.getenv("RAG_STUB_LLM_TOKENS_PER_S", "0"))
+
+# Embedding backend: "huggingface" (EMBEDDING_MODEL_NAME) or "hashing", a
+# deterministic feature-hashing embedder without model weights. Chunks are then
+# split by characters instead of model tokens. Keep each backend's index in its
+# own RAG_CHROMA_DIR.
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "huggingface")
+HASHING_EMBEDDING_DIM = int(os.getenv("RAG_HASHING_EMBEDDING_DIM", "384"))
+
+# Persistent embedding cache keyed by (model name, normalized text hash)
+EMBEDDING_CACHE_ENABLED = os.getenv("RAG_EMBEDDING_CACHE", "1") == "1"
+
+# Retrieval: "hybrid" fuses dense Chroma search with a BM25 index over the same
+# chunks (reciprocal rank fusion), "dense" uses similarity search only
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_K = int(os.getenv("RAG_RETRIEVAL_K", "4"))
+HYBRID_FETCH_K = int(os.getenv("RAG_HYBRID_FETCH_K", "20"))
+
+def get_bm25_index_path():
+    """BM25 index lives next to the Chroma files so both share one volume"""
+    return os.path.join(get_chroma_persist_directory(), "bm25_index.npz")
+
+# Vector index backend: "chroma", or "numpy" for a memory-mapped matrix searched
+# in-process with exact (or IVF) dot products. Switching backends re-embeds.
+VECTORSTORE_BACKEND = os.getenv("RAG_VECTORSTORE_BACKEND", "chroma")
+VECTOR_QUANTIZATION = os.getenv("RAG_VECTOR_QUANTIZATION", "float32")  # float32, float16 or int8
+VECTOR_IVF_LISTS = int(os.getenv("RAG_VECTOR_IVF_LISTS", "0"))  # 0 = exact search
+VECTOR_IVF_PROBE = int(os.getenv("RAG_VECTOR_IVF_PROBE", "8"))
+
+def get_numpy_index_path():
+    """The NumPy vector index also lives on the Chroma volume"""
+    return os.path.join(get_chroma_persist_directory(), "numpy_index")
+
+# Shared embedding server (see src/embedding_server.py): a Unix socket path in
+# a private (0700) directory, or host:port. Clients fall back to in-process
+# encoding when it is not running; set to an empty string to always encode
+# in-process. Without an authkey a Unix socket uses a random key the server
+# writes next to it; TCP requires RAG_EMBEDDING_SERVER_AUTHKEY.
+EMBEDDING_SERVER_ADDRESS = os.getenv(
+    "RAG_EMBEDDING_SERVER",
+    os.path.join(tempfile.gettempdir(), f"rag-embedding-server-{os.getuid()}", "server.sock"),
+)
+EMBEDDING_SERVER_AUTHKEY = os.getenv("RAG_EMBEDDING_SERVER_AUTHKEY", "")
+
+def load_embedding_model():
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+@lru_cache(maxsize=None)
+def get_embeddings(lazy=True):
+    """Embeddings for indexing and queries, shared by every caller in the process.
+
+    With ``lazy`` the sentence-transformers model is only imported and loaded
+    on the first text that actually needs encoding (cache hits never do).
+    When an embedding server is configured, texts are encoded there and the
+    local model is only loaded if the server is unreachable.
+    The hashing backend is cheap enough to use directly.
+    """
+    if EMBEDDING_BACKEND == "hashing":
+        from data_preprocess.hashing_embeddings import HashingEmbeddings
+        return HashingEmbeddings(HASHING_EMBEDDING_DIM)
+    if lazy:
+        from data_preprocess.lazy_embeddings import LazyEmbeddings
+        embeddings = LazyEmbeddings(load_embedding_model, EMBEDDING_MODEL_NAME)
+    else:
+        embeddings = load_embedding_model()
+    if EMBEDDING_SERVER_ADDRESS:
+        from embedding_server import EmbeddingServerClient
+        embeddings = EmbeddingServerClient(
+            EMBEDDING_SERVER_ADDRESS, EMBEDDING_SERVER_AUTHKEY, fallback=embeddings
+        )
+    if EMBEDDING_CACHE_ENABLED:
+        from data_preprocess.embedding_cache import CachedEmbeddings
+        embeddings = CachedEmbeddings(embeddings, EMBEDDING_MODEL_NAME)
+    return embeddings
 
 def get_llm():
+    if LLM_BACKEND == "stub":
+        from agents.stub_llm import StubChatModel
+        return StubChatModel(latency_ms=STUB_LLM_LATENCY_MS, tokens_per_s=STUB_LLM_TOKENS_PER_S)
+    from langchain_ollama import ChatOllama
     return ChatOllama(model="llama3.2")
\ No newline at end of file
@@ -0,0 +1,139 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# NIST control identifiers such as "AC-2", "AC-2(3)" or "IR-4 (1)"
+_CONTROL_ID = re.compile(r"\b([a-z]{2,3})-(\d{1,2})(?:\s?\((\d{1,2})\))?")
+_WORD = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it of on or that the this "
+    "to was were what when which who why will with".split()
+)
+
+
+def tokenize(text):
+    """Lowercased word tokens plus whole control identifiers.
+
+    "AC-2(3)" yields "ac-2(3)" and its base control "ac-2" in addition to the
+    plain words, so exact identifier queries rank the right chunks first.
+    """
+    text = text.lower()
+    tokens = [word for word in _WORD.findall(text) if word not in _STOPWORDS]
+    for family, number, enhancement in _CONTROL_ID.findall(text):
+        base = f"{family}-{int(number)}"
+        tokens.append(base)
+        if enhancement:
+            tokens.append(f"{base}({int(enhancement)})")
+    return tokens
+
+
+def _pack(strings):
+    return np.frombuffer("\n".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack(blob):
+    text = blob.tobytes().decode("utf-8")
+    return text.split("\n") if text else []
+
+
+class BM25Index:
+    """Compact in-process BM25 inverted index over chunk IDs.
+
+    Postings are stored as flat numpy arrays (document numbers and term
+    frequencies, sliced by per-term offsets) and saved as a single .npz file.
+    ``fingerprint`` records which collection contents the index was built from.
+    """
+
+    def __init__(self, ids, terms, offsets, postings_docs, postings_tfs, doc_lengths, k1=1.5, b=0.75):
+        self.ids = ids
+        self.fingerprint = None
+        self.term_index = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_tfs = postings_tfs
+        self.doc_lengths = doc_lengths
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, chunks):
+        """Build an index from an iterable of (chunk ID, chunk text) pairs"""
+        ids = []
+        doc_lengths = []
+        postings = defaultdict(list)
+        for doc_number, (chunk_id, text) in enumerate(chunks):
+            counts = Counter(tokenize(text))
+            ids.append(chunk_id)
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((doc_number, min(tf, 65535)))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        postings_docs = np.fromiter(
+            (doc for term in terms for doc, _ in postings[term]), dtype=np.int32, count=int(offsets[-1])
+        )
+        postings_tfs = np.fromiter(
+            (tf for term in terms for _, tf in postings[term]), dtype=np.uint16, count=int(offsets[-1])
+        )
+        return cls(ids, terms, offsets, postings_docs, postings_tfs, np.asarray(doc_lengths, dtype=np.int32))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            ids=_pack(self.ids),
+            terms=_pack(self.terms),
+            offsets=self.offsets,
+            postings_docs=self.postings_docs,
+            postings_tfs=self.postings_tfs,
+            doc_lengths=self.doc_lengths,
+            fingerprint=_pack([self.fingerprint or ""]),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(
+                _unpack(data["ids"]),
+                _unpack(data["terms"]),
+                data["offsets"],
+                data["postings_docs"],
+                data["postings_tfs"],
+                data["doc_lengths"],
+            )
+            index.fingerprint = (_unpack(data["fingerprint"]) or [None])[0] or None
+        return index
+
+    def search(self, query, k=20):
+        """Return up to k (chunk ID, BM25 score) pairs, best first"""
+        if not self.ids:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / (self.avg_length or 1.0))
+        for term in set(tokenize(query)):
+            i = self.term_index.get(term)
+            if i is None:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            docs = self.postings_docs[start:end]
+            tfs = self.postings_tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (len(self.ids) - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + length_norm[docs])
+
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+            top = top[np.argsort(-scores[top])]
+        else:
+            top = np.argsort(-scores)
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
@@ -0,0 +1,234 @@
+import json
+import os
+import re
+from bisect import bisect_right
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Trailing integer of values such as chunk IDs ("<hash>:<signature>:<index>")
+_TRAILING_INT = re.compile(r"^(.*?)(\d+)$", re.S)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def column_values(docs, key):
+    """Metadata ``key`` of every document in ``docs`` (None where absent).
+
+    Chunk stores and chunk sequences read the column directly, without
+    building ``Document`` objects.
+    """
+    if hasattr(docs, "column"):
+        return docs.column(key)
+    return [doc.metadata.get(key) for doc in docs]
+
+
+def document_texts(docs):
+    """Text of every document in ``docs``, read like ``column_values``"""
+    if hasattr(docs, "texts"):
+        return docs.texts()
+    return [doc.page_content for doc in docs]
+
+
+def _encode_column(values):
+    """Column descriptor and array for one metadata key.
+
+    ``values`` holds the key's value per row, with ``None`` where a row lacks
+    the key. Constant columns go to the header, integer columns to an int64
+    array, strings sharing a prefix and ending in a number (chunk IDs) to the
+    prefix plus an int64 array, and anything else to a table of distinct
+    values plus int32 codes (-1 where the key is absent).
+    """
+    present = [value for value in values if value is not None]
+    if len(present) == len(values):
+        if all(value == values[0] and type(value) is type(values[0]) for value in values):
+            return {"kind": "shared", "value": values[0]}, None
+        if all(_is_int(value) for value in values):
+            return {"kind": "int"}, np.asarray(values, dtype=np.int64)
+        if all(isinstance(value, str) for value in values):
+            matches = [_TRAILING_INT.match(value) for value in values]
+            if all(matches) and len({m.group(1) for m in matches}) == 1:
+                numbers = [m.group(2) for m in matches]
+                # Only when the number round-trips, e.g. no leading zeros
+                if all(str(int(n)) == n for n in numbers):
+                    return (
+                        {"kind": "indexed", "prefix": matches[0].group(1)},
+                        np.asarray([int(n) for n in numbers], dtype=np.int64),
+                    )
+
+    table = {}
+    codes = np.full(len(values), -1, dtype=np.int32)
+    distinct = []
+    for row, value in enumerate(values):
+        if value is None:
+            continue
+        key = json.dumps(value, sort_keys=True)
+        if key not in table:
+            table[key] = len(distinct)
+            distinct.append(value)
+        codes[row] = table[key]
+    return {"kind": "table", "values": distinct}, codes
+
+
+class ChunkStore:
+    """Columnar on-disk store of LangChain ``Document`` lists.
+
+    Texts are concatenated into one UTF-8 blob (``<base>.txt``) that is read
+    through a memory map and sliced by byte offsets. Metadata is stored per
+    key as a column in ``<base>.npz``: values shared by every row (source,
+    file hash, PDF info) are kept once, page numbers and chunk indexes as
+    int64 arrays, and other strings as a table of distinct values with int32
+    codes. Loading reads only the arrays, with ``allow_pickle=False``, and
+    ``Document`` objects are built one at a time as they are accessed.
+    """
+
+    def __init__(self, offsets, keys, columns, arrays, blob):
+        self.offsets = offsets
+        self.keys = keys
+        self.columns = columns
+        self.arrays = arrays
+        self._blob = blob
+
+    @staticmethod
+    def write(base, documents):
+        """Save ``documents`` to ``<base>.txt`` and ``<base>.npz``, replacing any existing store"""
+        os.makedirs(os.path.dirname(base) or ".", exist_ok=True)
+        encoded = [doc.page_content.encode("utf-8") for doc in documents]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+
+        keys = []
+        for doc in documents:
+            keys.extend(key for key in doc.metadata if key not in keys)
+        columns = []
+        arrays = {"offsets": offsets}
+        for i, key in enumerate(keys):
+            column, array = _encode_column([doc.metadata.get(key) for doc in documents])
+            columns.append(column)
+            if array is not None:
+                arrays[f"column_{i}"] = array
+
+        header = json.dumps({"version": 1, "keys": keys, "columns": columns})
+        arrays["header"] = np.frombuffer(header.encode("utf-8"), dtype=np.uint8)
+
+        # The blob is replaced first; a store is only valid once its .npz
+        # exists and its offsets match the blob size
+        tmp_blob = base + ".tmp.txt"
+        with open(tmp_blob, "wb") as f:
+            f.writelines(encoded)
+        os.replace(tmp_blob, base + ".txt")
+        tmp_arrays = base + ".tmp.npz"
+        np.savez(tmp_arrays, **arrays)
+        os.replace(tmp_arrays, base + ".npz")
+
+    @classmethod
+    def open(cls, base):
+        """Open the store saved at ``base``, or return None if it is missing or incomplete"""
+        if not (os.path.exists(base + ".npz") and os.path.exists(base + ".txt")):
+            return None
+        try:
+            with np.load(base + ".npz", allow_pickle=False) as data:
+                header = json.loads(data["header"].tobytes().decode("utf-8"))
+                offsets = data["offsets"]
+                arrays = {name: data[name] for name in data.files if name.startswith("column_")}
+            size = os.path.getsize(base + ".txt")
+            if header.get("version") != 1 or int(offsets[-1]) != size:
+                return None
+            # np.memmap cannot map an empty file
+            blob = np.memmap(base + ".txt", dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+        except Exception as e:
+            return None
+        return cls(offsets, header["keys"], header["columns"], arrays, blob)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def text(self, i):
+        return self._blob[self.offsets[i] : self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def texts(self):
+        return [self.text(i) for i in range(len(self))]
+
+    def column(self, key):
+        """Values of metadata ``key`` for every row, None where a row lacks it"""
+        if key not in self.keys:
+            return [None] * len(self)
+        column_number = self.keys.index(key)
+        column = self.columns[column_number]
+        if column["kind"] == "shared":
+            return [column["value"]] * len(self)
+        values = self.arrays[f"column_{column_number}"].tolist()
+        if column["kind"] == "int":
+            return values
+        if column["kind"] == "indexed":
+            return [f"{column['prefix']}{value}" for value in values]
+        return [column["values"][value] if value >= 0 else None for value in values]
+
+    def metadata(self, i):
+        metadata = {}
+        for column_number, (key, column) in enumerate(zip(self.keys, self.columns)):
+            kind = column["kind"]
+            if kind == "shared":
+                metadata[key] = column["value"]
+                continue
+            value = int(self.arrays[f"column_{column_number}"][i])
+            if kind == "int":
+                metadata[key] = value
+            elif kind == "indexed":
+                metadata[key] = f"{column['prefix']}{value}"
+            elif value >= 0:
+                metadata[key] = column["values"][value]
+        return metadata
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ChunkSequence:
+    """Read-only concatenation of chunk stores and ``Document`` lists.
+
+    Lets a pipeline stage hand on cached stores without loading them:
+    ``Document`` objects are only built for the rows that are accessed, and
+    ``column``/``texts`` read every row's metadata key or text directly.
+    """
+
+    def __init__(self, parts=()):
+        self.parts = [part for part in parts if len(part)]
+        self._starts = [0]
+        for part in self.parts:
+            self._starts.append(self._starts[-1] + len(part))
+
+    def __len__(self):
+        return self._starts[-1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        part = bisect_right(self._starts, i) - 1
+        return self.parts[part][i - self._starts[part]]
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+    def texts(self):
+        return [text for part in self.parts for text in document_texts(part)]
+
+    def column(self, key):
+        return [value for part in self.parts for value in column_values(part, key)]
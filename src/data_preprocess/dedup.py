@@ -0,0 +1,118 @@
+import json
+import logging
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime for the universal hash family; shingle hashes are 32-bit so
+# a * hash + b stays below 2**64
+_PRIME = (1 << 31) - 1
+
+# Metadata fields kept for each collapsed duplicate, for citations
+DUPLICATE_FIELDS = ("source", "page", "page_label", "chunk_id")
+
+
+def _shingles(text, size):
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index that maps near-duplicate texts to a canonical key.
+
+    Texts are compared by the Jaccard similarity of their word shingles,
+    estimated from ``num_perm`` MinHash values. LSH buckets over ``bands``
+    bands only propose candidates; a candidate is accepted when its estimated
+    similarity is at least ``threshold``. Only canonical entries are indexed.
+    """
+
+    def __init__(self, threshold=0.85, num_perm=64, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self._signatures = {}
+        self._buckets = {}
+
+    def signature(self, text):
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in _shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        )
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows : (band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def add(self, key, text):
+        """Index ``text`` under ``key`` unless it near-duplicates an indexed text.
+
+        Returns:
+            The canonical key of the matching text, or None if ``text`` is new
+        """
+        signature = self.signature(text)
+        band_keys = self._band_keys(signature)
+
+        best_key, best_similarity = None, self.threshold
+        seen = set()
+        for band_key in band_keys:
+            for candidate in self._buckets.get(band_key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                similarity = float(np.mean(self._signatures[candidate] == signature))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = candidate, similarity
+        if best_key is not None:
+            return best_key
+
+        self._signatures[key] = signature
+        for band_key in band_keys:
+            self._buckets.setdefault(band_key, []).append(key)
+        return None
+
+
+def duplicate_entry(doc):
+    return {field: doc.metadata[field] for field in DUPLICATE_FIELDS if field in doc.metadata}
+
+
+def collapse_near_duplicates(docs, threshold=0.85):
+    """Keep one canonical chunk per group of near-duplicate chunks.
+
+    The first chunk of each group (in input order) is kept. Its ``duplicates``
+    metadata entry lists the source, page and chunk_id of every chunk collapsed
+    into it as a JSON string (Chroma metadata must be scalar), or "" if none.
+
+    Returns:
+        The canonical chunks, in input order
+    """
+    index = NearDuplicateIndex(threshold)
+    kept = []
+    duplicates = {}
+    for position, doc in enumerate(docs):
+        key = doc.metadata.get("chunk_id", position)
+        canonical = index.add(key, doc.page_content)
+        if canonical is None:
+            kept.append(doc)
+            duplicates[key] = []
+        else:
+            duplicates[canonical].append(duplicate_entry(doc))
+
+    for key, doc in zip(duplicates, kept):
+        doc.metadata["duplicates"] = json.dumps(duplicates[key]) if duplicates[key] else ""
+
+    if docs:
+        logger.info(
+            "Near-duplicate collapse: %d chunks -> %d (%.1f%% smaller)",
+            len(docs), len(kept), 100.0 * (len(docs) - len(kept)) / len(docs),
+        )
+    return kept
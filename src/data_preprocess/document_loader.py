@@ -1,146 +1,822 @@
-from langchain_text_splitters import SentenceTransformersTokenTextSplitter
 from langchain_community.vectorstores import Chroma
-from langchain.tools.retriever import create_retriever_tool
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import groupby
 from typing import List
+import hashlib
+import json
+import logging
 import os
 import time
-import pickle
-from data_preprocess.header_footer_cleaner import clean_chunked_documents
+from data_preprocess.header_footer_cleaner import clean_page_headers_footers
+from data_preprocess.embedding_pipeline import embed_and_insert, insert_stream
+from data_preprocess.bm25_index import BM25Index
+from data_preprocess.chunk_store import ChunkSequence, ChunkStore, column_values, document_texts
+from data_preprocess.dedup import NearDuplicateIndex, collapse_near_duplicates, duplicate_entry
+from data_preprocess.hybrid_retriever import HybridRetriever
 
+logger = logging.getLogger(__name__)
 
-def load_documents(paths: List[str]):
-    """Load documents with caching"""
-    cache_file = "data/cache/cached_documents.pkl"
-    
-    # Ensure cache directory exists
-    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
-
-    # Check if cached version exists and is newer than source files
-    if os.path.exists(cache_file):
-        cache_time = os.path.getmtime(cache_file)
-        source_times = [
-            os.path.getmtime(path) for path in paths if os.path.exists(path)
-        ]
 
-        if source_times and max(source_times) < cache_time:
+CACHE_DIR = "data/cache"
+MANIFEST_FILE = os.path.join(CACHE_DIR, "ingest_manifest.json")
+
+# Splitter parameters; part of every chunk ID so a chunking change re-embeds
+CHUNK_SIZE = 400  # Smaller chunks for better precision
+CHUNK_OVERLAP = 25  # Reduced overlap for faster processing
+
+# Pages handed to a PDF parsing worker at a time
+PAGES_PER_TASK = 25
+
+# Chroma rejects very large delete calls
+VECTORSTORE_BATCH_SIZE = 1000
+
+COLLECTION_NAME = "rag-chroma-optimized"
+
+
+def _load_manifest():
+    """Load the per-file ingestion manifest (path -> content hash and stats)"""
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except Exception as e:
+        return {}
+
+
+def _save_manifest(manifest):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_file = MANIFEST_FILE + ".tmp"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, MANIFEST_FILE)
+    except Exception as e:
+        pass
+
+
+def file_content_hash(path, manifest=None):
+    """SHA-256 of a file's bytes, reusing the manifest entry if size and mtime are unchanged"""
+    stat = os.stat(path)
+    entry = (manifest or {}).get(path)
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+        return entry["hash"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    file_hash = digest.hexdigest()
+
+    if manifest is not None:
+        manifest[path] = {"hash": file_hash, "size": stat.st_size, "mtime": stat.st_mtime}
+    return file_hash
+
+
+def _read_chunks(base):
+    """The chunk store at ``base``, read lazily, or None if it has not been written"""
+    return ChunkStore.open(base)
+
+
+def _write_chunks(base, docs):
+    try:
+        ChunkStore.write(base, docs)
+    except Exception as e:
+        logger.warning("Could not write chunk store %s: %s", base, e)
+
+
+def _prune_cache(subdir, manifest):
+    """Remove cached artifacts of file versions no longer in the manifest, and legacy pickles"""
+    live_hashes = {entry["hash"] for entry in manifest.values()}
+    cache_dir = os.path.join(CACHE_DIR, subdir)
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name.endswith(".pkl") or name.split("-", 1)[0].split(".", 1)[0] not in live_hashes:
             try:
-                with open(cache_file, "rb") as f:
-                    return pickle.load(f)
-            except Exception as e:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
                 pass
 
+
+def _pdf_date(value):
+    """Converts a PDF date such as "D:20200922143004-04'00'" to ISO 8601"""
+    try:
+        return datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+    except ValueError:
+        return value
+
+
+def _pdf_metadata(reader, path):
+    """Document-level metadata with the keys and values PyPDFLoader produces.
+
+    Info dictionary keys lose their leading "/" and are lowercased, dates are
+    converted to ISO 8601 and strings are stripped.
+    """
+    metadata = {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+    metadata.update((key.lstrip("/").lower(), value) for key, value in dict(reader.metadata or {}).items())
+    normalized = {}
+    for key, value in metadata.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        if key in ("creationdate", "moddate"):
+            value = _pdf_date(value)
+        elif isinstance(value, str):
+            value = value.strip()
+        normalized[key] = value
+    return {**normalized, "source": path, "total_pages": len(reader.pages)}
+
+
+def _load_page_range(path, start_page, end_page):
+    """Parse pages [start_page, end_page) of a PDF; runs inside a pool worker.
+
+    PyPDFLoader can only parse whole files, so this reads the page range the
+    way its parser does (plain text extraction, stripped), and the pages are
+    identical to ``PyPDFLoader(path).load()[start_page:end_page]``.
+
+    Returns:
+        Tuple of (pages, (wall-clock start, wall-clock end) of the task)
+    """
+    from pypdf import PdfReader
+
+    started = time.time()
+    reader = PdfReader(path)
+    metadata = _pdf_metadata(reader, path)
+    docs = [
+        Document(
+            page_content=reader.pages[page].extract_text(extraction_mode="plain").strip(),
+            metadata={**metadata, "page": page, "page_label": reader.page_labels[page]},
+        )
+        for page in range(start_page, end_page)
+    ]
+    return docs, (started, time.time())
+
+
+def parse_pdfs_parallel(paths, max_workers=None, pages_per_task=PAGES_PER_TASK):
+    """Parse PDFs across a process pool, split by file and page range.
+
+    Args:
+        paths: PDF files to parse
+        max_workers: Number of worker processes; 1 parses in-process
+        pages_per_task: Number of pages handed to a worker at a time
+
+    Returns:
+        Dictionary mapping each path to (pages in page order, wall-clock
+        seconds from its first page range starting to its last one finishing)
+    """
+    from pypdf import PdfReader
+
+    tasks = []
+    for path in paths:
+        page_count = len(PdfReader(path).pages)
+        for start_page in range(0, page_count, pages_per_task):
+            tasks.append((path, start_page, min(start_page + pages_per_task, page_count)))
+
+    pages_by_path = {path: [] for path in paths}
+    spans = {}
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers <= 1 or len(tasks) <= 1:
+        outputs = (_load_page_range(*task) for task in tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)))
+        # map() yields in submission order, keeping pages deterministic
+        outputs = executor.map(_load_page_range, *zip(*tasks))
+
+    try:
+        for (path, _, _), (docs, (started, finished)) in zip(tasks, outputs):
+            pages_by_path[path].extend(docs)
+            first_started, last_finished = spans.get(path, (started, finished))
+            spans[path] = (min(first_started, started), max(last_finished, finished))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {
+        path: (pages, spans[path][1] - spans[path][0] if path in spans else 0.0)
+        for path, pages in pages_by_path.items()
+    }
+
+
+def load_documents(paths: List[str], max_workers=None):
+    """Load documents with per-file caching keyed by content hash.
+
+    Only PDFs that are new or whose bytes changed since the last run are
+    parsed again, in parallel across ``max_workers`` processes (defaults to
+    ``LOADER_WORKERS`` from config). Every page is tagged with a
+    ``content_hash`` metadata entry identifying the file version it came from.
+
+    Returns:
+        A ChunkSequence of the pages; cached files are read lazily from their
+        chunk stores
+    """
+    if max_workers is None:
+        from config import LOADER_WORKERS
+        max_workers = LOADER_WORKERS
+
+    manifest = _load_manifest()
+
     start_time = time.time()
-    docs_list = []
+    docs_by_path = {}
+    to_parse = []
 
     for path in paths:
         if os.path.exists(path):
-            docs = PyPDFLoader(path).load()
-            docs_list.extend(docs)
+            file_hash = file_content_hash(path, manifest)
+            docs = _read_chunks(os.path.join(CACHE_DIR, "pages", file_hash))
+            if docs is None:
+                to_parse.append(path)
+            else:
+                docs_by_path[path] = docs
         else:
             pass
 
-    # Cache the loaded documents
-    try:
-        with open(cache_file, "wb") as f:
-            pickle.dump(docs_list, f)
-    except Exception as e:
-        pass
+    if to_parse:
+        for path, (docs, seconds) in parse_pdfs_parallel(to_parse, max_workers).items():
+            file_hash = manifest[path]["hash"]
+            for doc in docs:
+                doc.metadata["content_hash"] = file_hash
+            _write_chunks(os.path.join(CACHE_DIR, "pages", file_hash), docs)
+            manifest[path]["parse_seconds"] = round(seconds, 3)
+            logger.info("Parsed %s: %d pages in %.2fs", path, len(docs), seconds)
+            docs_by_path[path] = docs
+
+    for path in docs_by_path:
+        manifest[path]["pages"] = len(docs_by_path[path])
+    docs_list = ChunkSequence(docs_by_path[path] for path in paths if path in docs_by_path)
+
+    # Forget files that no longer exist and their cached artifacts
+    manifest = {path: entry for path, entry in manifest.items() if os.path.exists(path)}
+    _save_manifest(manifest)
+    _prune_cache("pages", manifest)
 
     end_time = time.time()
+    logger.info(
+        "Loaded %d pages from %d files (%d parsed) in %.2fs",
+        len(docs_list), len(docs_by_path), len(to_parse), end_time - start_time,
+    )
     return docs_list
 
 
+def _splits_by_characters():
+    # The hashing embedder has no tokenizer; chunks are sized at ~4 characters per token
+    from config import EMBEDDING_BACKEND
+    return EMBEDDING_BACKEND == "hashing"
+
+
+def _text_splitter():
+    if _splits_by_characters():
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        return RecursiveCharacterTextSplitter(chunk_size=4 * CHUNK_SIZE, chunk_overlap=4 * CHUNK_OVERLAP)
+
+    # Imported here so opening an existing index never loads the tokenizer stack
+    from langchain_text_splitters import SentenceTransformersTokenTextSplitter
+
+    return SentenceTransformersTokenTextSplitter(
+        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+    )
+
+
+def _splitter_signature(clean_headers_footers):
+    # "p": headers/footers are removed from whole pages before splitting,
+    # "c": chunks are sized in characters rather than tokens
+    signature = f"{CHUNK_SIZE}-{CHUNK_OVERLAP}-{'p' if clean_headers_footers else 'r'}"
+    return signature + "c" if _splits_by_characters() else signature
+
+
 def split_documents_optimized(docs_list, clean_headers_footers=True):
-    """Optimized document splitting with smaller chunks for better retrieval"""
-    cache_file = "data/cache/cached_document_splits.pkl"
-    
-    # Ensure cache directory exists
-    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    """Optimized document splitting with smaller chunks for better retrieval.
 
-    # Check if cached splits exist
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, "rb") as f:
-                return pickle.load(f)
-        except Exception as e:
-            pass
+    Splits are cached per source file version and splitter configuration, and
+    each chunk gets a stable ``chunk_id`` metadata entry of the form
+    ``<content hash>:<splitter signature>:<chunk index>``.
 
+    Returns:
+        A ChunkSequence of the chunks; pages of files with cached splits are
+        never read
+    """
     start_time = time.time()
+    signature = _splitter_signature(clean_headers_footers)
+    text_splitter = None
 
-    text_splitter = SentenceTransformersTokenTextSplitter(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        chunk_size=400,  # Smaller chunks for better precision
-        chunk_overlap=25,  # Reduced overlap for faster processing
+    # Group pages by the file version they came from, keeping input order
+    groups = {}
+    for row, file_hash in enumerate(column_values(docs_list, "content_hash")):
+        groups.setdefault(file_hash, []).append(row)
+
+    parts = []
+    for file_hash, rows in groups.items():
+        cache_base = os.path.join(CACHE_DIR, "splits", f"{file_hash}-{signature}")
+        splits = _read_chunks(cache_base) if file_hash else None
+
+        if splits is None:
+            if text_splitter is None:
+                text_splitter = _text_splitter()
+            pages = [docs_list[row] for row in rows]
+
+            # Clean page headers and footers if requested, then split
+            if clean_headers_footers:
+                pages = clean_page_headers_footers(pages)
+            splits = text_splitter.split_documents(pages)
+            splits = [split for split in splits if split.page_content.strip()]
+
+            if file_hash:
+                for i, split in enumerate(splits):
+                    split.metadata["chunk_id"] = f"{file_hash[:16]}:{signature}:{i}"
+                _write_chunks(cache_base, splits)
+
+        parts.append(splits)
+    doc_splits = ChunkSequence(parts)
+
+    _prune_cache("splits", _load_manifest())
+
+    end_time = time.time()
+    logger.info(
+        "Split %d pages from %d files into %d chunks in %.2fs",
+        len(docs_list), len(groups), len(doc_splits), end_time - start_time,
+    )
+    return doc_splits
+
+
+def _update_duplicates(collection, duplicates_by_id):
+    """Rewrite the ``duplicates`` metadata of stored chunks where it changed"""
+    chunk_ids = list(duplicates_by_id)
+    for i in range(0, len(chunk_ids), VECTORSTORE_BATCH_SIZE):
+        stored = collection.get(ids=chunk_ids[i : i + VECTORSTORE_BATCH_SIZE], include=["metadatas"])
+        changed = [
+            chunk_id
+            for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])
+            if (metadata or {}).get("duplicates", "") != duplicates_by_id[chunk_id]
+        ]
+        if changed:
+            collection.update(ids=changed, metadatas=[{"duplicates": duplicates_by_id[c]} for c in changed])
+
+
+def _duplicate_dependencies(chunk_ids, duplicates):
+    """Per source path, the file hash prefixes holding canonical copies of its dropped chunks"""
+    depends_on = {}
+    for chunk_id, duplicate_list in zip(chunk_ids, duplicates):
+        if not duplicate_list:
+            continue
+        canonical_file = chunk_id.split(":")[0]
+        for entry in json.loads(duplicate_list):
+            if not entry["chunk_id"].startswith(canonical_file):
+                depends_on.setdefault(entry["source"], set()).add(canonical_file)
+    return depends_on
+
+
+def _sync_vectorstore(vectorstore, valid_docs, embeddings, batch_size, workers):
+    """Make the collection hold exactly the given chunks, keyed by chunk_id.
+
+    Chunks of removed or changed files are deleted and only chunks whose IDs
+    are not yet stored are embedded, batch by batch. IDs, sources and
+    duplicates are read as metadata columns, so chunk stores only build
+    ``Document`` objects for the new chunks.
+    """
+    collection = vectorstore._collection
+    existing_ids = set(collection.get(include=[])["ids"])
+    chunk_ids = column_values(valid_docs, "chunk_id")
+    duplicates = column_values(valid_docs, "duplicates")
+    row_of = {chunk_id: row for row, chunk_id in enumerate(chunk_ids)}
+
+    stale_ids = sorted(existing_ids - row_of.keys())
+    for i in range(0, len(stale_ids), VECTORSTORE_BATCH_SIZE):
+        vectorstore.delete(ids=stale_ids[i : i + VECTORSTORE_BATCH_SIZE])
+
+    new_ids = [chunk_id for chunk_id in row_of if chunk_id not in existing_ids]
+    logger.info(
+        "Syncing collection: %d stale chunks removed, %d new chunks to embed",
+        len(stale_ids), len(new_ids),
+    )
+    embed_and_insert(
+        vectorstore,
+        [valid_docs[row_of[chunk_id]] for chunk_id in new_ids],
+        new_ids,
+        embeddings,
+        batch_size=batch_size,
+        workers=workers,
+    )
+
+    # Chunks already stored may have gained or lost near-duplicates
+    _update_duplicates(
+        collection,
+        {chunk_id: duplicates[row] or "" for chunk_id, row in row_of.items() if chunk_id in existing_ids},
+    )
+
+    _flush_vectorstore(vectorstore)
+
+    # Record which file versions are now fully indexed (chunks stored per file,
+    # after near-duplicate collapse), for open_indexed_vectorstore
+    manifest = _load_manifest()
+    depends_on = _duplicate_dependencies(chunk_ids, duplicates)
+    chunk_counts = {}
+    for chunk_id, source, duplicate_list in zip(chunk_ids, column_values(valid_docs, "source"), duplicates):
+        entries = [{"chunk_id": chunk_id, "source": source}]
+        entries += json.loads(duplicate_list) if duplicate_list else []
+        for i, entry in enumerate(entries):
+            file_prefix, signature, _ = entry["chunk_id"].split(":")
+            key = (entry["source"], file_prefix, signature)
+            chunk_counts[key] = chunk_counts.get(key, 0) + (1 if i == 0 else 0)
+    for (path, file_prefix, signature), count in chunk_counts.items():
+        if path in manifest and manifest[path]["hash"].startswith(file_prefix):
+            manifest[path].update(
+                {"indexed": signature, "chunks": count, "depends_on": sorted(depends_on.get(path, ()))}
+            )
+    _save_manifest(manifest)
+
+    # Keep the sparse index in step with the collection
+    load_or_build_bm25_index(vectorstore)
+    return vectorstore
+
+
+def _open_vectorstore(embeddings, backend=None):
+    """The persistent vectorstore of the configured backend ("chroma" or "numpy")"""
+    from config import (
+        get_chroma_persist_directory,
+        get_numpy_index_path,
+        VECTORSTORE_BACKEND,
+        VECTOR_QUANTIZATION,
+        VECTOR_IVF_LISTS,
+        VECTOR_IVF_PROBE,
+    )
+
+    if (backend or VECTORSTORE_BACKEND) == "numpy":
+        from data_preprocess.numpy_vectorstore import NumpyCollection, NumpyVectorStore
+
+        collection = NumpyCollection(
+            get_numpy_index_path(),
+            name=COLLECTION_NAME,
+            quantization=VECTOR_QUANTIZATION,
+            ivf_lists=VECTOR_IVF_LISTS,
+            ivf_probe=VECTOR_IVF_PROBE,
+        )
+        return NumpyVectorStore(embeddings, collection)
+    return Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=embeddings,
+        persist_directory=get_chroma_persist_directory(),
     )
 
-    doc_splits = text_splitter.split_documents(docs_list)
 
-    # Clean headers and footers if requested
-    if clean_headers_footers:
-        doc_splits = clean_chunked_documents(doc_splits)
+def _flush_vectorstore(vectorstore):
+    # The NumPy index buffers writes in memory; Chroma persists every call
+    flush = getattr(vectorstore._collection, "flush", None)
+    if flush is not None:
+        flush()
+
+
+def open_indexed_vectorstore(paths, embeddings, clean_headers_footers=True):
+    """Open the persisted collection directly if it is known to be up to date.
+
+    Uses only file stats and the ingestion manifest: every existing path must
+    be unchanged (same size and mtime) since it was fully indexed with the
+    current splitter settings, and the collection must hold exactly the
+    recorded number of chunks. Nothing is parsed, split or embedded.
+
+    Returns:
+        The vectorstore, or None if a full sync is needed
+    """
+    manifest = _load_manifest()
+    signature = _splitter_signature(clean_headers_footers)
+    expected_chunks = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        stat = os.stat(path)
+        entry = manifest.get(path)
+        if (
+            not entry
+            or entry.get("size") != stat.st_size
+            or entry.get("mtime") != stat.st_mtime
+            or entry.get("indexed") != signature
+        ):
+            return None
+        expected_chunks += entry.get("chunks", 0)
+
+    if not expected_chunks:
+        return None
 
-    # Cache the splits
     try:
-        with open(cache_file, "wb") as f:
-            pickle.dump(doc_splits, f)
+        vectorstore = _open_vectorstore(embeddings)
+        if vectorstore._collection.count() != expected_chunks:
+            return None
     except Exception as e:
-        pass
+        return None
+    return vectorstore
 
-    end_time = time.time()
-    return doc_splits
 
+def create_vectorstore_persistent(doc_splits, embeddings, batch_size=None, workers=None, backend=None):
+    """Create persistent vector store to avoid reprocessing.
 
-def create_vectorstore_persistent(doc_splits, embeddings):
-    """Create persistent vector store to avoid reprocessing"""
-    # Use centralized path configuration to prevent multiple folders
-    from config import get_chroma_persist_directory
-    persist_directory = get_chroma_persist_directory()
-    collection_name = "rag-chroma-optimized"
+    When every chunk carries a ``chunk_id`` the collection is synchronised
+    incrementally, embedding new chunks in batches of ``batch_size`` with
+    ``workers`` encoding processes (defaults from config). Otherwise an
+    existing non-empty collection is reused as-is. ``backend`` selects
+    "chroma" or the in-process "numpy" index (default from config).
+    """
+    from config import EMBED_BATCH_SIZE, EMBED_WORKERS, DEDUP_ENABLED, DEDUP_THRESHOLD
 
     start_time = time.time()
 
+    # Filter out any empty documents, keeping a lazy sequence when none are
+    doc_splits = doc_splits if doc_splits is not None else []
+    texts = document_texts(doc_splits)
+    valid_docs = doc_splits
+    if not all(text.strip() for text in texts):
+        valid_docs = [doc_splits[row] for row, text in enumerate(texts) if text.strip()]
+    if DEDUP_ENABLED:
+        valid_docs = collapse_near_duplicates(valid_docs, DEDUP_THRESHOLD)
+
+    if valid_docs and all(chunk_id is not None for chunk_id in column_values(valid_docs, "chunk_id")):
+        return _sync_vectorstore(
+            _open_vectorstore(embeddings, backend),
+            valid_docs,
+            embeddings,
+            batch_size or EMBED_BATCH_SIZE,
+            workers or EMBED_WORKERS,
+        )
+
     # Try to load existing vectorstore
-    if os.path.exists(persist_directory):
-        try:
-            vectorstore = Chroma(
-                collection_name=collection_name,
-                embedding_function=embeddings,
-                persist_directory=persist_directory,
-            )
-            # Check if it has documents
-            if vectorstore._collection.count() > 0:
-                return vectorstore
-        except Exception as e:
-            pass
+    try:
+        vectorstore = _open_vectorstore(embeddings, backend)
+        # Check if it has documents
+        if vectorstore._collection.count() > 0:
+            return vectorstore
+    except Exception as e:
+        vectorstore = None
 
     # Validate that we have documents to process
     if not doc_splits:
         raise ValueError("Cannot create vector store: No documents provided for embedding")
     
-    # Filter out any empty documents
-    valid_docs = [doc for doc in doc_splits if doc.page_content.strip()]
-    
     if not valid_docs:
         raise ValueError("Cannot create vector store: All documents are empty after filtering")
     
-    vectorstore = Chroma.from_documents(
-        documents=valid_docs,
-        collection_name=collection_name,
-        embedding=embeddings,
-        persist_directory=persist_directory,
-    )
+    if vectorstore is None:
+        vectorstore = _open_vectorstore(embeddings, backend)
+    vectorstore.add_documents(valid_docs)
+    _flush_vectorstore(vectorstore)
 
     end_time = time.time()
+    logger.info("Embedded and stored %d chunks in %.2fs", len(valid_docs), end_time - start_time)
     return vectorstore
 
 
-def setup_optimized_retriever_tool(vectorstore):
-    """Setup retriever with optimized parameters"""
-    retriever = vectorstore.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": 4},  # Retrieve fewer documents for faster processing
+def iter_pdf_pages(paths, max_workers=None, pages_per_task=PAGES_PER_TASK):
+    """Yield PDF pages file by file, in page order, without materializing the corpus.
+
+    Page ranges are parsed across a process pool with at most two ranges per
+    worker in flight, so memory is bounded by the in-flight ranges.
+    """
+    from pypdf import PdfReader
+
+    def tasks():
+        for path in paths:
+            page_count = len(PdfReader(path).pages)
+            for start_page in range(0, page_count, pages_per_task):
+                yield path, start_page, min(start_page + pages_per_task, page_count)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers <= 1:
+        for task in tasks():
+            yield from _load_page_range(*task)[0]
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for task in tasks():
+            in_flight.append(executor.submit(_load_page_range, *task))
+            if len(in_flight) >= 2 * max_workers:
+                yield from in_flight.popleft().result()[0]
+        while in_flight:
+            yield from in_flight.popleft().result()[0]
+
+
+def iter_file_splits(pages, manifest, clean_headers_footers=True):
+    """Split and clean a page stream one file at a time.
+
+    Yields (path, chunks) per file with the same ``chunk_id`` scheme as
+    split_documents_optimized. Only one file's pages are buffered, since
+    header/footer cleaning needs per-file line frequencies.
+    """
+    signature = _splitter_signature(clean_headers_footers)
+    text_splitter = _text_splitter()
+
+    for path, file_pages in groupby(pages, key=lambda doc: doc.metadata["source"]):
+        file_hash = manifest[path]["hash"]
+        file_pages = list(file_pages)
+        for page in file_pages:
+            page.metadata["content_hash"] = file_hash
+
+        if clean_headers_footers:
+            file_pages = clean_page_headers_footers(file_pages)
+        splits = text_splitter.split_documents(file_pages)
+        splits = [split for split in splits if split.page_content.strip()]
+
+        for i, split in enumerate(splits):
+            split.metadata["chunk_id"] = f"{file_hash[:16]}:{signature}:{i}"
+        yield path, splits
+
+
+def ingest_streaming(paths, embeddings, batch_size=None, workers=None, max_workers=None, clean_headers_footers=True):
+    """Stream PDFs into the vector store: pages -> chunks -> cleaned chunks -> inserts.
+
+    Unlike load_documents/split_documents, nothing is materialized for the
+    whole corpus and no page or split caches are written, so peak memory stays
+    flat as the corpus grows. Files already fully indexed at their current
+    content hash are skipped. Chunks of removed or changed files are deleted
+    once the run completes, and an interrupted run resumes by chunk_id.
+    Near-duplicates of chunks already seen in the run (or stored for skipped
+    files) are not inserted but recorded on their canonical chunk.
+
+    Returns:
+        The synchronised vectorstore
+    """
+    from config import EMBED_BATCH_SIZE, EMBED_WORKERS, LOADER_WORKERS, DEDUP_ENABLED, DEDUP_THRESHOLD
+
+    manifest = _load_manifest()
+    signature = _splitter_signature(clean_headers_footers)
+    vectorstore = _open_vectorstore(embeddings)
+    collection = vectorstore._collection
+
+    # A file is skipped if it is indexed at its current hash with all of its
+    # chunks stored, and every file holding canonical copies of its collapsed
+    # near-duplicates is skipped too (otherwise those copies are replaced)
+    candidates = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        file_hash = file_content_hash(path, manifest)
+        entry = manifest[path]
+        stored = collection.get(where={"content_hash": file_hash}, include=[])["ids"]
+        if entry.get("indexed") == signature and len(stored) == entry.get("chunks", -1):
+            candidates[path] = stored
+    while True:
+        skipped_files = {manifest[path]["hash"][:16] for path in candidates}
+        blocked = [
+            path for path in candidates
+            if not set(manifest[path].get("depends_on", ())) <= skipped_files
+        ]
+        if not blocked:
+            break
+        for path in blocked:
+            del candidates[path]
+    to_parse = [path for path in paths if os.path.exists(path) and path not in candidates]
+
+    wanted_ids = set()
+    near_duplicates = NearDuplicateIndex(DEDUP_THRESHOLD)
+    duplicates = {}
+    for path, chunk_ids in candidates.items():
+        wanted_ids.update(chunk_ids)
+        for i in range(0, len(chunk_ids), VECTORSTORE_BATCH_SIZE):
+            stored = collection.get(ids=chunk_ids[i : i + VECTORSTORE_BATCH_SIZE], include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+                if DEDUP_ENABLED:
+                    near_duplicates.add(chunk_id, text)
+                # Keep duplicates that live in other skipped files
+                duplicates[chunk_id] = [
+                    entry for entry in json.loads((metadata or {}).get("duplicates") or "[]")
+                    if entry["chunk_id"].split(":")[0] in skipped_files
+                ]
+
+    chunk_counts = {}
+    depends_on = {}
+
+    def chunks():
+        pages = iter_pdf_pages(to_parse, max_workers or LOADER_WORKERS)
+        for path, splits in iter_file_splits(pages, manifest, clean_headers_footers):
+            chunk_counts[path] = 0
+            depends_on[path] = set()
+            for split in splits:
+                chunk_id = split.metadata["chunk_id"]
+                canonical = near_duplicates.add(chunk_id, split.page_content) if DEDUP_ENABLED else None
+                if canonical is not None:
+                    duplicates[canonical].append(duplicate_entry(split))
+                    if not canonical.startswith(chunk_id.split(":")[0]):
+                        depends_on[path].add(canonical.split(":")[0])
+                    continue
+                split.metadata["duplicates"] = ""
+                duplicates[chunk_id] = []
+                chunk_counts[path] += 1
+                wanted_ids.add(chunk_id)
+                yield chunk_id, split
+
+    start_time = time.time()
+    inserted = insert_stream(
+        vectorstore, chunks(), embeddings, batch_size=batch_size or EMBED_BATCH_SIZE, workers=workers or EMBED_WORKERS
+    )
+
+    # Only a completed run knows the full set of wanted chunks
+    stale_ids = sorted(set(collection.get(include=[])["ids"]) - wanted_ids)
+    for i in range(0, len(stale_ids), VECTORSTORE_BATCH_SIZE):
+        vectorstore.delete(ids=stale_ids[i : i + VECTORSTORE_BATCH_SIZE])
+    _update_duplicates(
+        collection, {chunk_id: json.dumps(entries) if entries else "" for chunk_id, entries in duplicates.items()}
+    )
+    _flush_vectorstore(vectorstore)
+
+    for path, count in chunk_counts.items():
+        manifest[path].update({"indexed": signature, "chunks": count, "depends_on": sorted(depends_on[path])})
+    manifest = {path: entry for path, entry in manifest.items() if os.path.exists(path)}
+    _save_manifest(manifest)
+
+    if DEDUP_ENABLED and duplicates:
+        collapsed = sum(len(entries) for entries in duplicates.values())
+        logger.info(
+            "Near-duplicate collapse: %d chunks -> %d (%.1f%% smaller)",
+            len(duplicates) + collapsed, len(duplicates), 100.0 * collapsed / (len(duplicates) + collapsed),
+        )
+
+    # Keep the sparse index in step with the collection
+    load_or_build_bm25_index(vectorstore)
+
+    logger.info(
+        "Streamed %d files (%d skipped): %d chunks inserted, %d stale removed in %.2fs",
+        len(to_parse), len(paths) - len(to_parse), inserted, len(stale_ids), time.time() - start_time,
     )
+    return vectorstore
+
+
+def get_collection_fingerprint(vectorstore):
+    """Identify the current contents of the collection so dependent caches can be invalidated"""
+    from config import get_chroma_persist_directory
+
+    collection = vectorstore._collection
+    data_file = getattr(collection, "data_file", None) or os.path.join(get_chroma_persist_directory(), "chroma.sqlite3")
+    modified = os.path.getmtime(data_file) if os.path.exists(data_file) else None
+    return f"{collection.name}:{collection.count()}:{modified}"
+
+
+def _collection_ids_digest(collection):
+    """Digest of the collection's chunk IDs; chunk IDs are content-derived"""
+    ids = sorted(collection.get(include=[])["ids"])
+    return hashlib.sha256("\n".join(ids).encode("utf-8")).hexdigest()
+
+
+def load_or_build_bm25_index(vectorstore):
+    """Load the on-disk BM25 index, rebuilding it if the collection changed"""
+    from config import get_bm25_index_path
+    index_path = get_bm25_index_path()
+    collection = vectorstore._collection
+    digest = _collection_ids_digest(collection)
+
+    if os.path.exists(index_path):
+        try:
+            index = BM25Index.load(index_path)
+            if index.fingerprint == digest:
+                return index
+        except Exception as e:
+            pass
+
+    start_time = time.time()
+
+    def chunks(page_size=VECTORSTORE_BATCH_SIZE):
+        offset = 0
+        while True:
+            page = collection.get(include=["documents"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                return
+            yield from zip(page["ids"], page["documents"])
+            offset += len(page["ids"])
+
+    index = BM25Index.build(chunks())
+    index.fingerprint = digest
+    index.save(index_path)
+
+    logger.info("Built BM25 index over %d chunks in %.2fs", len(index.ids), time.time() - start_time)
+    return index
+
+
+def setup_optimized_retriever_tool(vectorstore):
+    """Setup retriever with optimized parameters.
+
+    With ``RETRIEVAL_MODE`` set to "hybrid" the dense search is fused with a
+    BM25 search over the same chunks, which catches exact control identifiers
+    such as "AC-2(3)" that embeddings miss.
+    """
+    from langchain.tools.retriever import create_retriever_tool
+    from config import RETRIEVAL_MODE, RETRIEVAL_K, HYBRID_FETCH_K
+
+    if RETRIEVAL_MODE == "hybrid":
+        retriever = HybridRetriever(
+            vectorstore=vectorstore,
+            bm25_index=load_or_build_bm25_index(vectorstore),
+            k=RETRIEVAL_K,
+            fetch_k=HYBRID_FETCH_K,
+        )
+    else:
+        retriever = vectorstore.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": RETRIEVAL_K},  # Retrieve fewer documents for faster processing
+        )
 
     retriever_tool = create_retriever_tool(
         retriever,
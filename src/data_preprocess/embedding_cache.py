@@ -0,0 +1,180 @@
+import fcntl
+import hashlib
+import json
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def _text_key(kind, text):
+    """Hash of whitespace-normalized text; documents and queries are kept apart"""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{kind}\0{normalized}".encode("utf-8")).hexdigest()[:32]
+
+
+class CachedEmbeddings(Embeddings):
+    """Disk-backed embedding cache wrapping another embeddings object.
+
+    Document vectors are appended to a raw float32 file that is read through
+    a memory map, and an append-only ``keys.txt`` maps text hashes to rows.
+    There is one cache directory per model, so entries are keyed by (model
+    name, normalized text hash). Appends take a file lock, so several
+    processes can share the cache. A key is only written once its vector is
+    on disk, and rows without a key (from an interrupted append) are dropped.
+
+    Query vectors are kept in memory only, in an LRU of at most
+    ``max_cached_queries`` entries, so questions never grow the disk cache.
+    """
+
+    def __init__(
+        self,
+        underlying_embeddings,
+        model_name,
+        cache_dir="data/cache/embeddings",
+        cache_queries=True,
+        max_cached_queries=1024,
+    ):
+        self.underlying_embeddings = underlying_embeddings
+        self.model_name = model_name
+        self.cache_queries = cache_queries
+        self.max_cached_queries = max_cached_queries
+        self._queries = OrderedDict()
+        self.cache_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self._vectors_file = os.path.join(self.cache_dir, "vectors.f32")
+        self._keys_file = os.path.join(self.cache_dir, "keys.txt")
+        self._meta_file = os.path.join(self.cache_dir, "meta.json")
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._keys_offset = 0
+        self._dim = None
+        self._vectors = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _read_meta(self):
+        if self._dim is None and os.path.exists(self._meta_file):
+            with open(self._meta_file) as f:
+                self._dim = json.load(f)["dim"]
+
+    def _refresh(self):
+        """Pick up rows appended since the last read, including by other processes"""
+        self._read_meta()
+        if not os.path.exists(self._keys_file):
+            return
+        with open(self._keys_file) as f:
+            f.seek(self._keys_offset)
+            for line in iter(f.readline, ""):
+                if not line.endswith("\n"):
+                    break  # Partially written line; read it next time
+                key, row = line.split()
+                self._rows[key] = int(row)
+                self._keys_offset = f.tell()
+
+        # Keys must never point past the vectors actually written
+        if self._dim is not None and self._rows:
+            row_count = self._vector_rows()
+            if max(self._rows.values()) >= row_count:
+                logger.warning("Embedding cache %s has keys without vectors; ignoring them", self.cache_dir)
+                self._rows = {key: row for key, row in self._rows.items() if row < row_count}
+
+    def _vector_rows(self):
+        size = os.path.getsize(self._vectors_file) if os.path.exists(self._vectors_file) else 0
+        return size // (self._dim * 4)
+
+    def _row_vectors(self, rows):
+        row_count = self._vector_rows()
+        if self._vectors is None or self._vectors.shape[0] < row_count:
+            self._vectors = np.memmap(self._vectors_file, dtype=np.float32, mode="r", shape=(row_count, self._dim))
+        return [self._vectors[row].tolist() for row in rows]
+
+    def _append(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with open(os.path.join(self.cache_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._read_meta()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self._meta_file, "w") as f:
+                    json.dump({"model": self.model_name, "dim": self._dim}, f)
+
+            # Rows past the last key are left over from an interrupted append
+            self._refresh()
+            first_row = max(self._rows.values()) + 1 if self._rows else 0
+            with open(self._vectors_file, "ab") as f:
+                if f.tell() != first_row * self._dim * 4:
+                    f.truncate(first_row * self._dim * 4)
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            # Keys are written after their vectors are durable, so every listed row exists
+            with open(self._keys_file, "a") as f:
+                f.writelines(f"{key} {first_row + i}\n" for i, key in enumerate(keys))
+
+        for i, key in enumerate(keys):
+            self._rows[key] = first_row + i
+
+    def _embed(self, kind, texts, encode):
+        keys = [_text_key(kind, text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+
+            missing = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+            if missing:
+                self._append(list(missing), encode(list(missing.values())))
+
+            return self._row_vectors([self._rows[key] for key in keys])
+
+    def embed_documents(self, texts, encode=None):
+        """Embed documents, encoding only texts not in the cache.
+
+        Args:
+            texts: Texts to embed
+            encode: Optional function used instead of the underlying
+                embeddings to encode cache misses (e.g. a multi-process pool)
+        """
+        if not texts:
+            return []
+        return self._embed("doc", texts, encode or self.underlying_embeddings.embed_documents)
+
+    def _cached_queries(self, texts, encode):
+        keys = [_text_key("query", text) for text in texts]
+        with self._lock:
+            found = {key: self._queries[key] for key in keys if key in self._queries}
+            for key in found:
+                self._queries.move_to_end(key)
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        if missing:
+            found.update(zip(missing, encode(list(missing.values()))))
+            with self._lock:
+                for key in missing:
+                    self._queries[key] = found[key]
+                while len(self._queries) > self.max_cached_queries:
+                    self._queries.popitem(last=False)
+        return [list(found[key]) for key in keys]
+
+    def embed_query(self, text):
+        if not self.cache_queries:
+            return self.underlying_embeddings.embed_query(text)
+        return self._cached_queries([text], lambda texts: [self.underlying_embeddings.embed_query(texts[0])])[0]
+
+    def embed_queries(self, texts):
+        """Embed several queries at once, through the in-memory query cache"""
+        if not self.cache_queries:
+            return [self.underlying_embeddings.embed_query(text) for text in texts]
+        return self._cached_queries(
+            texts, lambda missing: [self.underlying_embeddings.embed_query(text) for text in missing]
+        )
+
+    def __getattr__(self, name):
+        if name == "underlying_embeddings":
+            raise AttributeError(name)
+        return getattr(self.underlying_embeddings, name)
@@ -0,0 +1,139 @@
+from contextlib import contextmanager
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _encoder(embeddings, workers):
+    """Yield a function that embeds a list of texts.
+
+    With more than one worker and a sentence-transformers backed embeddings
+    object, a multi-process pool is started once and shared by every batch;
+    otherwise the embeddings object encodes in-process. An embedding server
+    client that can reach its server keeps encoding through the server; when
+    the server is down the pool encodes with the client's fallback model.
+    """
+    if workers <= 1:
+        yield embeddings.embed_documents
+        return
+
+    # Look through a CachedEmbeddings wrapper so the pool only encodes misses
+    inner = getattr(embeddings, "underlying_embeddings", embeddings)
+    model = inner
+    if hasattr(inner, "fallback") and hasattr(inner, "available"):
+        if inner.available():
+            logger.info("Encoding through the embedding server; not starting %d workers", workers)
+            yield embeddings.embed_documents
+            return
+        model = inner.fallback
+
+    client = getattr(model, "_client", None)
+    if client is None or not hasattr(client, "start_multi_process_pool"):
+        logger.info("%s has no multi-process pool; encoding in-process", type(model).__name__)
+        yield embeddings.embed_documents
+        return
+
+    normalize = (getattr(model, "encode_kwargs", None) or {}).get("normalize_embeddings", False)
+    pool = client.start_multi_process_pool(target_devices=["cpu"] * workers)
+
+    def encode(texts):
+        vectors = client.encode_multi_process(texts, pool)
+        if normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1.0, norms)
+        return vectors.tolist()
+
+    try:
+        if inner is embeddings:
+            yield encode
+        else:
+            yield lambda texts: embeddings.embed_documents(texts, encode=encode)
+    finally:
+        client.stop_multi_process_pool(pool)
+
+
+def _batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_stream(vectorstore, chunks, embeddings, batch_size=64, workers=1, total=None):
+    """Embed (id, document) pairs from an iterable and stream them into Chroma.
+
+    Only one batch of documents and vectors is held at a time, so the input
+    can be a generator over a corpus of any size. Each batch is written to the
+    collection as soon as it is embedded and IDs already present are skipped,
+    which makes an interrupted run resumable.
+
+    Args:
+        vectorstore: LangChain Chroma vectorstore to insert into
+        chunks: Iterable of (stable ID, Document) pairs
+        embeddings: Embeddings object used to encode the documents
+        batch_size: Number of documents embedded and inserted per batch
+        workers: Number of encoding processes (sentence-transformers only)
+        total: Expected number of chunks, for progress reporting only
+
+    Returns:
+        Number of documents embedded and inserted
+    """
+    collection = vectorstore._collection
+    start_time = time.time()
+    done = 0
+    skipped = 0
+
+    with _encoder(embeddings, workers) as encode:
+        for pairs in _batched(chunks, batch_size):
+            batch_ids = [chunk_id for chunk_id, _ in pairs]
+            existing_ids = set(collection.get(ids=batch_ids, include=[])["ids"])
+            batch = [(chunk_id, doc) for chunk_id, doc in pairs if chunk_id not in existing_ids]
+            skipped += len(pairs) - len(batch)
+            if not batch:
+                continue
+
+            texts = [doc.page_content for _, doc in batch]
+            collection.upsert(
+                ids=[chunk_id for chunk_id, _ in batch],
+                embeddings=encode(texts),
+                documents=texts,
+                metadatas=[doc.metadata or None for _, doc in batch],
+            )
+            done += len(batch)
+            elapsed = time.time() - start_time
+            logger.info(
+                "Embedded %d/%s chunks (%.1f chunks/s)",
+                done + skipped, total if total is not None else "?",
+                done / elapsed if elapsed else float("inf"),
+            )
+
+    if skipped:
+        logger.info("Skipped %d chunks already in the collection", skipped)
+    return done
+
+
+def embed_and_insert(vectorstore, docs, ids, embeddings, batch_size=64, workers=1):
+    """Embed documents in bounded batches and stream them into a Chroma collection.
+
+    Args:
+        vectorstore: LangChain Chroma vectorstore to insert into
+        docs: Documents to embed
+        ids: Stable IDs, one per document
+        embeddings: Embeddings object used to encode the documents
+        batch_size: Number of documents embedded and inserted per batch
+        workers: Number of encoding processes (sentence-transformers only)
+
+    Returns:
+        Number of documents embedded and inserted
+    """
+    return insert_stream(
+        vectorstore, zip(ids, docs), embeddings, batch_size=batch_size, workers=workers, total=len(ids)
+    )
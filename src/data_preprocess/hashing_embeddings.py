@@ -0,0 +1,37 @@
+import re
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic feature-hashing embeddings that need no model weights.
+
+    Lowercased words and word bigrams are hashed (crc32) into ``dim`` signed
+    buckets and the vector is L2-normalized, so texts sharing vocabulary get
+    a high cosine similarity. Encoding is a few microseconds per text, which
+    makes it a stand-in for load tests and offline runs, not for retrieval
+    quality.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        words = _WORD.findall(text.lower())
+        features = words + [f"{left} {right}" for left, right in zip(words, words[1:])]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            digest = zlib.crc32(feature.encode("utf-8"))
+            vector[digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
@@ -1,7 +1,13 @@
+import re
 from collections import Counter
-from langchain.schema import Document
+from itertools import groupby
+from langchain_core.documents import Document
 from typing import List
 
+_DIGITS = re.compile(r"\d+")
+# Lowercase roman numerals up to 399, as used for front-matter page numbers
+_ROMAN_PAGE = re.compile(r"^(?=[ivxlc])c{0,3}(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$")
+
 
 def remove_repeating_headers_footers(
     docs: List[Document], min_repeat: int = 2, max_line_len: int = 100
@@ -99,3 +105,82 @@ def clean_chunked_documents(
         List of cleaned Document objects
     """
     return remove_repeating_headers_footers(doc_splits, min_repeat, max_line_len)
+
+
+def _band_key(line):
+    """Fuzzy form of a header/footer line: page numbers and dates vary per page"""
+    normalized = " ".join(_DIGITS.sub("#", line.lower()).split())
+    return "#" if _ROMAN_PAGE.match(normalized) else normalized
+
+
+def _strip_bands(lines, band, headers, footers):
+    """Return (first kept index, end index) of the page body"""
+    start = 0
+    while start < band and (start, _band_key(lines[start])) in headers:
+        start += 1
+    end = len(lines)
+    while end > start and len(lines) - end < band and (len(lines) - end, _band_key(lines[end - 1])) in footers:
+        end -= 1
+    return start, end
+
+
+def clean_page_headers_footers(
+    pages: List[Document],
+    band_lines: int = 3,
+    min_page_fraction: float = 0.3,
+    min_repeat: int = 3,
+    max_line_len: int = 100,
+) -> List[Document]:
+    """
+    Remove running headers and footers from whole PDF pages, before splitting.
+
+    Pages are grouped by their ``source`` metadata. For each PDF, the first and
+    last ``band_lines`` non-blank lines of every page are counted by position
+    and fuzzy text (digits, such as page numbers, are ignored). A band line is
+    a header/footer if it repeats at the same position on at least
+    ``min_page_fraction`` of the file's pages (and ``min_repeat`` pages).
+
+    Args:
+        pages: Page Documents, with pages of the same PDF next to each other
+        band_lines: Number of lines at the top and bottom of a page to inspect
+        min_page_fraction: Fraction of a file's pages a line must appear on
+        min_repeat: Minimum number of pages a line must appear on
+        max_line_len: Ignore longer lines (likely content, not headers/footers)
+
+    Returns:
+        List of page Documents; pages with nothing removed are returned as-is
+    """
+    cleaned_pages = []
+    for _, file_pages in groupby(pages, key=lambda doc: doc.metadata.get("source")):
+        file_pages = list(file_pages)
+        # Bands are found on the non-blank lines; pages are rebuilt from all
+        # of their lines, so paragraph breaks survive
+        all_lines = [doc.page_content.splitlines() for doc in file_pages]
+        line_numbers = [[i for i, line in enumerate(lines) if line.strip()] for lines in all_lines]
+        page_lines = [[lines[i] for i in numbers] for lines, numbers in zip(all_lines, line_numbers)]
+
+        header_counts = Counter()
+        footer_counts = Counter()
+        for lines in page_lines:
+            band = min(band_lines, len(lines) // 2)
+            header_counts.update(
+                {(i, _band_key(line)) for i, line in enumerate(lines[:band]) if len(line) <= max_line_len}
+            )
+            footer_counts.update(
+                {(i, _band_key(line)) for i, line in enumerate(reversed(lines[len(lines) - band :])) if len(line) <= max_line_len}
+            )
+
+        threshold = max(min_repeat, min_page_fraction * len(file_pages))
+        headers = {key for key, count in header_counts.items() if count >= threshold}
+        footers = {key for key, count in footer_counts.items() if count >= threshold}
+
+        for doc, lines, original, numbers in zip(file_pages, page_lines, all_lines, line_numbers):
+            band = min(band_lines, len(lines) // 2)
+            start, end = _strip_bands(lines, band, headers, footers) if headers or footers else (0, len(lines))
+            if start == 0 and end == len(lines):
+                cleaned_pages.append(doc)
+            else:
+                body = original[numbers[start] : numbers[end - 1] + 1] if start < end else []
+                cleaned_pages.append(Document(page_content="\n".join(body), metadata=dict(doc.metadata)))
+
+    return cleaned_pages
@@ -0,0 +1,102 @@
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+def distance_to_similarity(vectorstore, distance):
+    """Converts a Chroma distance into cosine similarity for normalized embeddings."""
+    metadata = getattr(getattr(vectorstore, "_collection", None), "metadata", None) or {}
+    if metadata.get("hnsw:space", "l2") == "l2":
+        # Squared L2 between unit vectors is 2 - 2 * cos
+        return 1.0 - distance / 2.0
+    # Chroma's cosine and ip distances are both 1 - similarity
+    return 1.0 - distance
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """Fuse ranked ID lists: score(id) = sum over lists of 1 / (rrf_k + rank)"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense Chroma search plus sparse BM25 search, fused with reciprocal rank fusion.
+
+    Both searches fetch ``fetch_k`` candidates and the top ``k`` fused chunks
+    are returned. Chunks found only by BM25 are read back from the Chroma
+    collection by ID.
+    """
+
+    vectorstore: Any
+    bm25_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def retrieve_with_scores(self, query, k=None):
+        """Return the fused documents and their dense cosine similarity.
+
+        The score is None for chunks that only the BM25 search found. ``k``
+        overrides the number of fused chunks returned for this call.
+        """
+        query_embedding = self.vectorstore._embedding_function.embed_query(query)
+        return self.retrieve_batch_with_scores([query], [query_embedding], k=k)[0]
+
+    def retrieve_batch_with_scores(self, queries, query_embeddings, k=None):
+        """retrieve_with_scores for many queries with precomputed embeddings.
+
+        The dense searches run as one collection query and chunks found only
+        by BM25 are read back in one call, so a chunk retrieved for several
+        queries is the same Document object in each result.
+
+        Returns:
+            One (documents, similarities) pair per query
+        """
+        k = k or self.k
+        fetch_k = max(self.fetch_k, k)
+        collection = self.vectorstore._collection
+        dense = collection.query(
+            query_embeddings=list(query_embeddings),
+            n_results=fetch_k,
+            include=["documents", "metadatas", "distances"],
+        )
+        docs_by_id = {}
+        similarities = []
+        for ids, texts, metadatas, distances in zip(
+            dense["ids"], dense["documents"], dense["metadatas"], dense["distances"]
+        ):
+            query_similarities = {}
+            for doc_id, text, metadata, distance in zip(ids, texts, metadatas, distances):
+                if doc_id not in docs_by_id:
+                    docs_by_id[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+                query_similarities[doc_id] = distance_to_similarity(self.vectorstore, distance)
+            similarities.append(query_similarities)
+
+        fused = []
+        for query, dense_ids in zip(queries, dense["ids"]):
+            sparse_ids = [doc_id for doc_id, _ in self.bm25_index.search(query, k=fetch_k)]
+            fused.append(reciprocal_rank_fusion([dense_ids, sparse_ids], self.rrf_k)[:k])
+
+        missing = sorted({doc_id for fused_ids in fused for doc_id in fused_ids if doc_id not in docs_by_id})
+        if missing:
+            found = collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                docs_by_id[doc_id] = Document(id=doc_id, page_content=text, metadata=metadata or {})
+
+        results = []
+        for fused_ids, query_similarities in zip(fused, similarities):
+            fused_ids = [doc_id for doc_id in fused_ids if doc_id in docs_by_id]
+            results.append(
+                ([docs_by_id[doc_id] for doc_id in fused_ids], [query_similarities.get(doc_id) for doc_id in fused_ids])
+            )
+        return results
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.retrieve_with_scores(query)[0]
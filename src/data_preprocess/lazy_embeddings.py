@@ -0,0 +1,46 @@
+import logging
+import threading
+import time
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings that construct the real model on first use.
+
+    ``factory`` is called once, on the first embed call or attribute access
+    that needs the model, so startup does not pay for importing and loading
+    sentence-transformers when every query is answered from caches.
+    """
+
+    def __init__(self, factory, name="embeddings"):
+        self._factory = factory
+        self._name = name
+        self._embeddings = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._embeddings is not None
+
+    def _get(self):
+        if self._embeddings is None:
+            with self._load_lock:
+                if self._embeddings is None:
+                    started = time.time()
+                    self._embeddings = self._factory()
+                    logger.info("Loaded %s in %.2fs", self._name, time.time() - started)
+        return self._embeddings
+
+    def embed_documents(self, texts):
+        return self._get().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._get().embed_query(text)
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in ("_factory", "_name", "_embeddings", "_load_lock"):
+            raise AttributeError(name)
+        return getattr(self._get(), name)
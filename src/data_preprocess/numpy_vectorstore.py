@@ -0,0 +1,520 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from data_preprocess.chunk_store import ChunkStore
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ("float32", "float16", "int8")
+
+# Rows scored per matrix product, bounding temporary memory during a scan
+SEARCH_BLOCK_ROWS = 16384
+
+
+def quantize(vectors, quantization):
+    """Unit-normalize rows and store them as ``quantization``.
+
+    Returns the stored matrix and per-row float32 scales: int8 rows are
+    scaled so their largest component maps to 127, float rows have scale 1.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1.0)
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(quantization), np.ones(len(vectors), dtype=np.float32)
+
+
+def _normalized_queries(query_embeddings):
+    queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries / np.where(norms > 0, norms, 1.0)
+
+
+def _top_k(scores, k):
+    """Indexes of the ``k`` highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _matches(metadata, where):
+    """Chroma-style equality filter: {"key": value} or {"key": {"$eq": value}}"""
+    for key, expected in (where or {}).items():
+        if isinstance(expected, dict):
+            if set(expected) != {"$eq"}:
+                raise ValueError(f"Unsupported where clause for {key}: {expected}")
+            expected = expected["$eq"]
+        if metadata.get(key) != expected:
+            return False
+    return True
+
+
+class NumpyCollection:
+    """Chroma collection look-alike over a memory-mapped, optionally quantized matrix.
+
+    Implements the subset of the Chroma collection API the ingestion and
+    retrieval code uses (``count``, ``get``, ``upsert``, ``update``,
+    ``delete`` and ``query``), so ``vectorstore._collection`` works the same
+    for both backends. Rows are stored unit-normalized and distances are
+    cosine distances (``1 - similarity``), as for a Chroma collection with
+    ``hnsw:space`` set to "cosine".
+
+    The index is saved as numbered versions under ``path``: ``vectors.npy``
+    (read with ``mmap_mode="r"``, so processes share the pages), ``index.npz``
+    with IDs, int8 scales and the optional IVF lists, and a ChunkStore with
+    texts and metadata. ``CURRENT`` names the live version and is replaced
+    last, so readers never see a partial write; the version it replaced is
+    kept until the next save, so a reader that has just read ``CURRENT``
+    can still open it. Writes are buffered in
+    memory and saved every ``autosave_rows`` changed rows and on ``flush()``.
+
+    With ``ivf_lists`` > 0 rows are clustered by spherical k-means when the
+    index is saved, and queries scan only the ``ivf_probe`` lists with the
+    closest centroids. Otherwise (and while unsaved writes are pending)
+    every row is scored with blocked matrix products.
+    """
+
+    def __init__(self, path, name="rag-vectors", quantization="float32", ivf_lists=0, ivf_probe=8, autosave_rows=4096):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.path = path
+        self.name = name
+        self.quantization = quantization
+        self.ivf_lists = ivf_lists
+        self.ivf_probe = ivf_probe
+        self.autosave_rows = autosave_rows
+        self.metadata = {"hnsw:space": "cosine"}
+        self._lock = threading.Lock()
+        self._pending_rows = 0
+        self._load()
+
+    # -- persistence ---------------------------------------------------------
+
+    @property
+    def data_file(self):
+        """File replaced on every save, for cache fingerprints"""
+        return os.path.join(self.path, "CURRENT")
+
+    def _load(self):
+        self._ids = []
+        self._vectors = None
+        self._scales = np.zeros(0, dtype=np.float32)
+        self._chunks = None
+        self._texts = None
+        self._metadatas = None
+        self._ivf = None
+        self._row_of = {}
+
+        try:
+            loaded = self._read_version()
+        except Exception as e:
+            logger.warning("Could not open vector index at %s: %s", self.path, e)
+            return
+        if loaded is None:
+            return
+
+        header, ids, scales, ivf, vectors, chunks = loaded
+        if chunks is None or len(chunks) != len(ids) or vectors.shape[0] != len(ids):
+            logger.warning("Vector index at %s is incomplete; starting empty", self.path)
+            return
+        if header["quantization"] != self.quantization:
+            # Requantizing from quantized values loses precision; re-embed instead
+            logger.warning(
+                "Vector index at %s is %s, not %s; starting empty",
+                self.path, header["quantization"], self.quantization,
+            )
+            return
+        self._ids = ids
+        self._vectors = vectors
+        self._scales = scales
+        self._chunks = chunks
+        self._ivf = ivf
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(ids)}
+
+    def _read_version(self):
+        """Arrays of the live version, or None if nothing has been saved yet"""
+        for attempt in range(2):
+            try:
+                with open(self.data_file) as f:
+                    version_dir = os.path.join(self.path, f.read().strip())
+            except FileNotFoundError:
+                return None
+            try:
+                with np.load(os.path.join(version_dir, "index.npz"), allow_pickle=False) as data:
+                    header = json.loads(data["header"].tobytes().decode("utf-8"))
+                    ids = data["ids"].tolist()
+                    scales = data["scales"]
+                    ivf = (data["ivf_centroids"], data["ivf_offsets"], data["ivf_rows"]) if "ivf_rows" in data else None
+                vectors = np.load(os.path.join(version_dir, "vectors.npy"), mmap_mode="r", allow_pickle=False)
+                chunks = ChunkStore.open(os.path.join(version_dir, "chunks"))
+            except FileNotFoundError:
+                # Saves since CURRENT was read removed that version; read it again
+                if attempt:
+                    raise
+                continue
+            return header, ids, scales, ivf, vectors, chunks
+
+    def flush(self):
+        """Save buffered writes as a new version of the index"""
+        with self._lock:
+            if self._texts is not None:
+                self._save()
+
+    def _save(self):
+        started = time.time()
+        os.makedirs(self.path, exist_ok=True)
+        version = f"v{time.time_ns()}"
+        version_dir = os.path.join(self.path, version)
+        os.makedirs(version_dir)
+
+        vectors = self._vectors if self._vectors is not None else np.zeros((0, 0), dtype=self.quantization)
+        self._ivf = self._build_ivf(vectors) if self.ivf_lists else None
+        arrays = {
+            "ids": np.asarray(self._ids, dtype=str),
+            "scales": self._scales,
+            "header": np.frombuffer(
+                json.dumps({"version": 1, "quantization": self.quantization}).encode("utf-8"), dtype=np.uint8
+            ),
+        }
+        if self._ivf is not None:
+            arrays.update(zip(("ivf_centroids", "ivf_offsets", "ivf_rows"), self._ivf))
+        np.save(os.path.join(version_dir, "vectors.npy"), vectors)
+        np.savez(os.path.join(version_dir, "index.npz"), **arrays)
+        ChunkStore.write(
+            os.path.join(version_dir, "chunks"),
+            [Document(page_content=text, metadata=metadata) for text, metadata in zip(self._texts, self._metadatas)],
+        )
+
+        try:
+            with open(self.data_file) as f:
+                previous = f.read().strip()
+        except FileNotFoundError:
+            previous = None
+        tmp_file = self.data_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            f.write(version)
+        os.replace(tmp_file, self.data_file)
+
+        # The replaced version stays for readers that have just read CURRENT;
+        # processes still mapping older versions keep their open files
+        for name in os.listdir(self.path):
+            if name.startswith("v") and name not in (version, previous):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        self._pending_rows = 0
+        logger.info("Saved vector index: %d rows (%s) in %.2fs", len(self._ids), self.quantization, time.time() - started)
+
+    def _writable(self):
+        """Switch from the memory-mapped version to in-memory lists and arrays"""
+        if self._texts is None:
+            rows = range(len(self._ids))
+            self._texts = [self._chunks.text(row) for row in rows] if self._chunks is not None else []
+            self._metadatas = [self._chunks.metadata(row) for row in rows] if self._chunks is not None else []
+            if self._vectors is not None:
+                self._vectors = np.array(self._vectors)
+            self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        # Cluster assignments are rebuilt when the index is saved
+        self._ivf = None
+
+    def _changed(self, rows):
+        self._pending_rows += rows
+        if self._pending_rows >= self.autosave_rows:
+            self._save()
+
+    # -- row access ----------------------------------------------------------
+
+    def _text(self, row):
+        return self._texts[row] if self._texts is not None else self._chunks.text(row)
+
+    def _metadata(self, row):
+        return self._metadatas[row] if self._metadatas is not None else self._chunks.metadata(row)
+
+    def _embedding(self, row):
+        return (self._vectors[row].astype(np.float32) * self._scales[row]).tolist()
+
+    def _rows_result(self, rows, include):
+        return {
+            "ids": [self._ids[row] for row in rows],
+            "documents": [self._text(row) for row in rows] if "documents" in include else None,
+            "metadatas": [self._metadata(row) for row in rows] if "metadatas" in include else None,
+            "embeddings": [self._embedding(row) for row in rows] if "embeddings" in include else None,
+        }
+
+    # -- Chroma collection API -----------------------------------------------
+
+    def count(self):
+        return len(self._ids)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("metadatas", "documents")):
+        if ids is not None:
+            rows = [self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of]
+        else:
+            rows = range(len(self._ids))
+        if where:
+            rows = [row for row in rows if _matches(self._metadata(row), where)]
+        rows = list(rows)[offset or 0 :]
+        if limit is not None:
+            rows = rows[:limit]
+        return self._rows_result(rows, include)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        vectors, scales = quantize(embeddings, self.quantization)
+        documents = documents or [""] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            self._writable()
+            if self._vectors is None or not len(self._ids):
+                self._vectors = np.zeros((0, vectors.shape[1]), dtype=vectors.dtype)
+            new_rows = []
+            for i, chunk_id in enumerate(ids):
+                row = self._row_of.get(chunk_id)
+                if row is None:
+                    new_rows.append(i)
+                    continue
+                self._vectors[row] = vectors[i]
+                self._scales[row] = scales[i]
+                self._texts[row] = documents[i]
+                self._metadatas[row] = dict(metadatas[i] or {})
+            for i in new_rows:
+                self._row_of[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+                self._texts.append(documents[i])
+                self._metadatas.append(dict(metadatas[i] or {}))
+            self._vectors = np.concatenate([self._vectors, vectors[new_rows]])
+            self._scales = np.concatenate([self._scales, scales[new_rows]])
+            self._changed(len(ids))
+
+    add = upsert
+
+    def update(self, ids, metadatas=None, embeddings=None, documents=None):
+        with self._lock:
+            self._writable()
+            for i, chunk_id in enumerate(ids):
+                row = self._row_of[chunk_id]
+                if metadatas is not None:
+                    # Chroma merges updated metadata keys into the stored ones
+                    self._metadatas[row] = {**self._metadatas[row], **(metadatas[i] or {})}
+                if documents is not None:
+                    self._texts[row] = documents[i]
+                if embeddings is not None:
+                    vector, scale = quantize([embeddings[i]], self.quantization)
+                    self._vectors[row] = vector[0]
+                    self._scales[row] = scale[0]
+            self._changed(len(ids))
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            self._writable()
+            doomed = {self._row_of[chunk_id] for chunk_id in ids or [] if chunk_id in self._row_of}
+            if where:
+                doomed.update(row for row in range(len(self._ids)) if _matches(self._metadatas[row], where))
+            if not doomed:
+                return
+            keep = np.array([row not in doomed for row in range(len(self._ids))], dtype=bool)
+            self._ids = [chunk_id for chunk_id, kept in zip(self._ids, keep) if kept]
+            self._texts = [text for text, kept in zip(self._texts, keep) if kept]
+            self._metadatas = [metadata for metadata, kept in zip(self._metadatas, keep) if kept]
+            self._vectors = self._vectors[keep]
+            self._scales = self._scales[keep]
+            self._row_of = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+            self._changed(len(doomed))
+
+    def query(self, query_embeddings, n_results=10, include=("metadatas", "documents", "distances"), where=None):
+        """Top ``n_results`` rows per query embedding, scored as one batch"""
+        if where:
+            raise ValueError("Filtered queries are not supported by the NumPy vector index")
+        rows, similarities = self.search_rows(query_embeddings, n_results)
+        result = {"ids": [], "documents": [], "metadatas": [], "embeddings": [], "distances": []}
+        for query_rows, query_similarities in zip(rows, similarities):
+            found = self._rows_result(query_rows, include)
+            for key in ("ids", "documents", "metadatas", "embeddings"):
+                result[key].append(found[key])
+            result["distances"].append([1.0 - float(s) for s in query_similarities])
+        for key in ("documents", "metadatas", "embeddings"):
+            if key not in include:
+                result[key] = None
+        if "distances" not in include:
+            result["distances"] = None
+        return result
+
+    # -- search --------------------------------------------------------------
+
+    def _scores(self, queries, rows=None):
+        """Cosine similarity of every (query, row) pair, computed block by block"""
+        vectors, scales = self._vectors, self._scales
+        if rows is not None:
+            vectors, scales = vectors[rows], scales[rows]
+        scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[:, start : start + len(block)] = (queries @ block.T) * scales[start : start + len(block)]
+        return scores
+
+    def search_rows(self, query_embeddings, k):
+        """Row numbers and cosine similarities of the ``k`` best rows for each query"""
+        queries = _normalized_queries(query_embeddings)
+        if not len(self._ids) or k <= 0:
+            return [[] for _ in queries], [[] for _ in queries]
+
+        ivf = self._ivf
+        if ivf is None:
+            scores = self._scores(queries)
+            top = [_top_k(query_scores, k) for query_scores in scores]
+            return [t.tolist() for t in top], [query_scores[t].tolist() for query_scores, t in zip(scores, top)]
+
+        centroids, offsets, list_rows = ivf
+        probe = min(self.ivf_probe, len(centroids))
+        all_rows, all_similarities = [], []
+        for query, centroid_scores in zip(queries, queries @ centroids.T):
+            lists = _top_k(centroid_scores, probe)
+            candidates = np.concatenate([list_rows[offsets[i] : offsets[i + 1]] for i in lists])
+            if len(candidates) < k:
+                # Too few rows near this query; scan everything
+                candidates = np.arange(len(self._ids))
+            scores = self._scores(query[None, :], candidates)[0]
+            top = _top_k(scores, k)
+            all_rows.append(candidates[top].tolist())
+            all_similarities.append(scores[top].tolist())
+        return all_rows, all_similarities
+
+    def _build_ivf(self, vectors, iterations=10, sample_per_list=64):
+        """Spherical k-means lists: centroids, per-list offsets and the rows sorted by list"""
+        lists = self.ivf_lists
+        if len(vectors) < lists * 8:
+            return None
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(vectors), min(len(vectors), lists * sample_per_list), replace=False)
+        points = _normalized_queries(vectors[sample].astype(np.float32) * self._scales[sample, None])
+        centroids = points[rng.choice(len(points), lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(points @ centroids.T, axis=1)
+            for i in range(lists):
+                members = points[assignment == i]
+                if len(members):
+                    centroids[i] = members.sum(axis=0)
+            centroids = _normalized_queries(centroids)
+
+        assignment = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            assignment[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        list_rows = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.zeros(lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=lists), out=offsets[1:])
+        return centroids.astype(np.float32), offsets, list_rows
+
+
+class NumpyVectorStore(VectorStore):
+    """LangChain vectorstore over a NumpyCollection.
+
+    A drop-in alternative to the Chroma store for corpora that fit in memory:
+    exact (or IVF) dot-product search over int8/float16/float32 vectors with
+    no database process or SQLite file. It exposes ``_collection`` and
+    ``_embedding_function`` like the Chroma wrapper, so the ingestion,
+    hybrid retrieval and scoring code treat both backends alike.
+    """
+
+    def __init__(self, embedding_function: Embeddings, collection: NumpyCollection):
+        self._embedding_function = embedding_function
+        self._collection = collection
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding_function
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        self._collection.upsert(
+            ids=ids,
+            embeddings=self._embedding_function.embed_documents(texts),
+            documents=texts,
+            metadatas=metadatas,
+        )
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> None:
+        self._collection.delete(ids=ids)
+
+    def get_by_ids(self, ids, /) -> List[Document]:
+        found = self._collection.get(ids=list(ids), include=["documents", "metadatas"])
+        return [
+            Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        ]
+
+    def _query(self, embedding, k, include):
+        result = self._collection.query(query_embeddings=[embedding], n_results=k, include=include)
+        return result, result["ids"][0]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4) -> List[Tuple[Document, float]]:
+        result, ids = self._query(embedding, k, ["documents", "metadatas", "distances"])
+        return [
+            (Document(id=doc_id, page_content=text, metadata=metadata or {}), distance)
+            for doc_id, text, metadata, distance in zip(
+                ids, result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding_function.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def max_marginal_relevance_search(
+        self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5, **kwargs: Any
+    ) -> List[Document]:
+        embedding = self._embedding_function.embed_query(query)
+        result, ids = self._query(embedding, fetch_k, ["documents", "metadatas", "embeddings"])
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding, dtype=np.float32), result["embeddings"][0], lambda_mult=lambda_mult, k=k
+        )
+        return [
+            Document(id=ids[i], page_content=result["documents"][0][i], metadata=result["metadatas"][0][i] or {})
+            for i in selected
+        ]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        collection: Optional[NumpyCollection] = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        if collection is None:
+            raise ValueError("NumpyVectorStore.from_texts needs a collection to write to")
+        vectorstore = cls(embedding, collection)
+        vectorstore.add_texts(texts, metadatas=metadatas, ids=ids)
+        collection.flush()
+        return vectorstore
@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from agents.batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# Largest request accepted from a client, in bytes
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+def parse_address(address):
+    """"host:port" becomes a TCP address, anything else is a Unix socket path"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+def _private_directory(path):
+    """Create ``path`` with mode 0700, refusing one other users can reach"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} must be a directory only its owner can access (mode 0700)")
+
+
+def load_authkey(address, authkey="", create=False):
+    """The shared secret clients and the server authenticate with.
+
+    An explicit ``authkey`` (RAG_EMBEDDING_SERVER_AUTHKEY) always wins. A Unix
+    socket otherwise uses a random key in an ``authkey`` file (mode 0600) next
+    to the socket, which the server writes on first start with ``create``.
+    TCP addresses have no default key.
+
+    Returns:
+        The key as bytes, or None if there is none
+    """
+    if authkey:
+        return authkey.encode("utf-8")
+    address = parse_address(address)
+    if not isinstance(address, str):
+        return None
+    key_file = os.path.join(os.path.dirname(os.path.abspath(address)), "authkey")
+    if create:
+        _private_directory(os.path.dirname(key_file))
+        try:
+            fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+    try:
+        with open(key_file) as f:
+            return f.read().strip().encode("utf-8")
+    except OSError:
+        return None
+
+
+class EmbeddingServer:
+    """Holds one embedding model in memory and serves encode requests over a socket.
+
+    Every client connection gets a thread; texts from requests arriving within
+    ``max_wait_ms`` of each other are encoded in a single model call.
+    Connections are authenticated with ``authkey``, and nothing received is
+    unpickled: requests are JSON objects ``{"method": ..., "texts": [...]}``
+    where method is "embed_documents" or "embed_query" (one text). Replies
+    are a JSON header, ``{"status": "ok", "shape": [rows, dim]}`` followed by
+    the raw float32 vectors, or ``{"status": "error", "message": ...}``.
+    A Unix socket is created with mode 0600 in a 0700 directory.
+    """
+
+    def __init__(self, embeddings, address, authkey, max_batch_size=64, max_wait_ms=5):
+        self.embeddings = embeddings
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self._batcher = MicroBatcher(self._encode_batch, max_batch_size, max_wait_ms)
+
+    def _encode_batch(self, requests):
+        texts = [text for request in requests for text in request]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        results = []
+        offset = 0
+        for request in requests:
+            results.append(vectors[offset : offset + len(request)])
+            offset += len(request)
+        return results
+
+    def _encode(self, request):
+        method, texts = request["method"], request["texts"]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise ValueError("texts must be a list of strings")
+        if method == "embed_query":
+            return np.asarray([self.embeddings.embed_query(text) for text in texts], dtype=np.float32)
+        if method == "embed_documents":
+            return self._batcher(texts) if texts else np.zeros((0, 0), np.float32)
+        raise ValueError(f"Unknown method {method!r}")
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv_bytes(MAX_REQUEST_BYTES)
+                except (EOFError, OSError):
+                    return
+                try:
+                    vectors = self._encode(json.loads(message))
+                except Exception as e:
+                    conn.send_bytes(json.dumps({"status": "error", "message": str(e)}).encode("utf-8"))
+                    continue
+                conn.send_bytes(json.dumps({"status": "ok", "shape": list(vectors.shape)}).encode("utf-8"))
+                conn.send_bytes(vectors.tobytes())
+
+    def serve_forever(self):
+        if isinstance(self.address, str):
+            _private_directory(os.path.dirname(os.path.abspath(self.address)))
+            if os.path.exists(self.address):
+                os.remove(self.address)
+        with Listener(self.address, authkey=self.authkey) as listener:
+            if isinstance(self.address, str):
+                os.chmod(self.address, 0o600)
+            logger.info("Embedding server listening on %s", listener.address)
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+
+class EmbeddingServerClient(Embeddings):
+    """Embeddings that encode through a running EmbeddingServer.
+
+    When the server cannot be reached the ``fallback`` embeddings encode
+    in-process instead, and the server is retried after ``retry_seconds``.
+    ``authkey`` is the configured key; when empty, the key file the server
+    wrote next to its Unix socket is read on connect (see ``load_authkey``).
+    """
+
+    def __init__(self, address, authkey, fallback, retry_seconds=30.0):
+        self.raw_address = address
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.fallback = fallback
+        self.retry_seconds = retry_seconds
+        self._local = threading.local()
+        self._unavailable_until = 0.0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if time.monotonic() < self._unavailable_until:
+                return None
+            authkey = load_authkey(self.raw_address, self.authkey)
+            try:
+                if authkey is None:
+                    raise ConnectionError("No embedding server key")
+                conn = Client(self.address, authkey=authkey)
+            except Exception as e:
+                self._unavailable_until = time.monotonic() + self.retry_seconds
+                return None
+            self._local.conn = conn
+        return conn
+
+    def available(self):
+        """Whether the server can currently be reached."""
+        return self._connection() is not None
+
+    def _request(self, method, texts):
+        """Returns the server's vectors, or None if it should fall back"""
+        conn = self._connection()
+        if conn is None:
+            return None
+        try:
+            conn.send_bytes(json.dumps({"method": method, "texts": texts}).encode("utf-8"))
+            reply = json.loads(conn.recv_bytes())
+            if reply["status"] != "ok":
+                return None
+            vectors = np.frombuffer(conn.recv_bytes(), dtype=np.float32).reshape(reply["shape"])
+        except Exception as e:
+            self._local.conn = None
+            self._unavailable_until = time.monotonic() + self.retry_seconds
+            return None
+        return vectors.tolist()
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        vectors = self._request("embed_documents", list(texts))
+        return self.fallback.embed_documents(texts) if vectors is None else vectors
+
+    def embed_query(self, text):
+        vectors = self._request("embed_query", [text])
+        return self.fallback.embed_query(text) if vectors is None else vectors[0]
+
+
+def main():
+    from config import (
+        EMBEDDING_SERVER_ADDRESS,
+        EMBEDDING_SERVER_AUTHKEY,
+        MICRO_BATCH_MAX_WAIT_MS,
+        load_embedding_model,
+    )
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if not EMBEDDING_SERVER_ADDRESS:
+        raise SystemExit("Set RAG_EMBEDDING_SERVER to the address to listen on")
+    authkey = load_authkey(EMBEDDING_SERVER_ADDRESS, EMBEDDING_SERVER_AUTHKEY, create=True)
+    if authkey is None:
+        raise SystemExit("Set RAG_EMBEDDING_SERVER_AUTHKEY to listen on a TCP address")
+
+    started = time.time()
+    embeddings = load_embedding_model()
+    logger.info("Loaded embedding model in %.2fs", time.time() - started)
+    EmbeddingServer(
+        embeddings,
+        EMBEDDING_SERVER_ADDRESS,
+        authkey,
+        max_wait_ms=MICRO_BATCH_MAX_WAIT_MS,
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
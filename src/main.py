@@ -1,48 +1,192 @@
-from config import get_embeddings, get_llm
+import logging
+import time
+from contextlib import contextmanager
+
+from config import (
+    get_embeddings,
+    get_llm,
+    GRADING_MODE,
+    GRADER_MAX_CONCURRENCY,
+    LLM_MAX_CONCURRENCY,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_TOKENIZER,
+    RETRIEVAL_K,
+    ADAPTIVE_CONFIDENT_K,
+    ADAPTIVE_CONFIDENT_SCORE,
+    ADAPTIVE_MIN_RELEVANT,
+    ADAPTIVE_MAX_RETRIES,
+    ADAPTIVE_STRATEGIES,
+    ADAPTIVE_EXPAND_FACTOR,
+    RERANK_MODE,
+    RERANK_MODEL,
+    RERANK_THRESHOLD,
+    RERANK_TOP_N,
+    RERANK_ACCEPT_THRESHOLD,
+    RERANK_REJECT_THRESHOLD,
+    MICRO_BATCH_MAX_SIZE,
+    MICRO_BATCH_MAX_WAIT_MS,
+    SIMILARITY_ACCEPT_THRESHOLD,
+    SIMILARITY_REJECT_THRESHOLD,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_SECONDS,
+    METRICS_LOG_QUERIES,
+)
 from data_preprocess.document_loader import (
     load_documents,
     split_documents,
     create_vectorstore,
     setup_retriever_tool,
+    open_indexed_vectorstore,
+    get_collection_fingerprint,
 )
-from agents.graders import create_document_grader
-from agents.chains import create_rag_chain
+from agents.graders import create_document_grader, create_batch_document_grader
+from agents.chains import create_rag_chain, create_question_rewriter
+from agents.context import ContextBuilder, create_token_counter
 from agents.nodes import create_workflow_nodes
+from agents.reranker import CrossEncoderReranker
 from agents.graph import create_workflow
+from agents.cache import SemanticAnswerCache, CachedWorkflow
+from agents.concurrency import ConcurrencyLimiter
+from agents.batching import MicroBatchedEmbeddings, micro_batched_grader
+from agents.metrics import instrument_nodes, ProfiledWorkflow
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_PATHS = [
+    "data/documents/NIST.CSWP.29.pdf",
+    "data/documents/NIST.SP.800-53r5.pdf",
+    "data/documents/NIST.SP.800-61r3.pdf",
+    "data/documents/nist.sp.800-61r2.pdf",
+]
+
+
+@contextmanager
+def _phase(timings, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(time.perf_counter() - started, 3)
+        logger.info("Startup phase %s took %.2fs", name, timings[name])
+
+
+def load_vectorstore(embeddings):
+    """Open the up-to-date collection, or load, split and embed the documents"""
+    vectorstore = open_indexed_vectorstore(DOCUMENT_PATHS, embeddings)
+    if vectorstore is None:
+        docs_list = load_documents(DOCUMENT_PATHS)
+        doc_splits = split_documents(docs_list)
+        vectorstore = create_vectorstore(doc_splits, embeddings)
+    return vectorstore
 
 
-def setup_rag_system():
+def setup_rag_system(micro_batching=False, timings=None):
+    """Build the compiled RAG workflow.
+
+    An existing, up-to-date collection is opened directly; documents are only
+    loaded, split and embedded when it is missing or stale. The embedding
+    model itself is loaded on the first query that misses the embedding cache.
+
+    Args:
+        micro_batching: Group query embeddings and per-document grading calls
+            from concurrent requests into shared batches (for the API server).
+            Grading is only micro-batched in the parallel and sequential
+            grading modes; batch mode already grades all of a question's
+            documents in one call per request.
+        timings: Optional dict filled with the duration of each startup phase
+            in seconds
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+
     # Initialize models
-    embeddings = get_embeddings()
-    llm = get_llm()
-
-    # Load and process documents
-    paths = [
-        "data/documents/NIST.CSWP.29.pdf",
-        "data/documents/NIST.SP.800-53r5.pdf",
-        "data/documents/NIST.SP.800-61r3.pdf",
-        "data/documents/nist.sp.800-61r2.pdf",
-    ]
-
-    docs_list = load_documents(paths)
-    doc_splits = split_documents(docs_list)
-    vectorstore = create_vectorstore(doc_splits, embeddings)
-    retriever, retriever_tool = setup_retriever_tool(vectorstore)
+    with _phase(timings, "models"):
+        embeddings = get_embeddings()
+        llm = get_llm()
+        if micro_batching:
+            embeddings = MicroBatchedEmbeddings(embeddings, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS)
+
+    # Open the index, or load and process documents if it is not up to date
+    with _phase(timings, "vectorstore"):
+        vectorstore = load_vectorstore(embeddings)
+
+    with _phase(timings, "retriever"):
+        retriever, retriever_tool = setup_retriever_tool(vectorstore)
 
     # Create graders and chains
-    retrieval_grader = create_document_grader(llm)
-    rag_chain = create_rag_chain(llm)
+    with _phase(timings, "chains"):
+        llm_limiter = ConcurrencyLimiter(LLM_MAX_CONCURRENCY)
+        retrieval_grader = create_document_grader(llm)
+        # The batch grader is not micro-batched: its calls cannot be merged
+        # across questions, so only the per-document grader benefits
+        if micro_batching:
+            retrieval_grader = micro_batched_grader(
+                retrieval_grader,
+                MICRO_BATCH_MAX_SIZE,
+                MICRO_BATCH_MAX_WAIT_MS,
+                GRADER_MAX_CONCURRENCY,
+                limiter=llm_limiter,
+            )
+        batch_grader = create_batch_document_grader(llm)
+        rag_chain = create_rag_chain(llm)
+        context_builder = ContextBuilder(create_token_counter(llm, CONTEXT_TOKENIZER), CONTEXT_MAX_TOKENS)
+        # The cross-encoder itself is loaded on the first question
+        reranker = CrossEncoderReranker(RERANK_MODEL) if RERANK_MODE != "off" else None
 
-    # Create workflow nodes
-    nodes = create_workflow_nodes(retriever, retrieval_grader, rag_chain)
+    with _phase(timings, "workflow"):
+        # Create workflow nodes
+        nodes = create_workflow_nodes(
+            retriever,
+            retrieval_grader,
+            rag_chain,
+            batch_grader=batch_grader,
+            grading_mode=GRADING_MODE,
+            grader_max_concurrency=GRADER_MAX_CONCURRENCY,
+            accept_threshold=SIMILARITY_ACCEPT_THRESHOLD,
+            reject_threshold=SIMILARITY_REJECT_THRESHOLD,
+            llm_limiter=llm_limiter,
+            context_builder=context_builder,
+            retrieval_k=RETRIEVAL_K,
+            confident_k=ADAPTIVE_CONFIDENT_K,
+            confident_score=ADAPTIVE_CONFIDENT_SCORE,
+            min_relevant=ADAPTIVE_MIN_RELEVANT,
+            max_retries=ADAPTIVE_MAX_RETRIES,
+            widen_strategies=ADAPTIVE_STRATEGIES,
+            expand_factor=ADAPTIVE_EXPAND_FACTOR,
+            question_rewriter=create_question_rewriter(llm),
+            reranker=reranker,
+            rerank_mode=RERANK_MODE,
+            rerank_threshold=RERANK_THRESHOLD,
+            rerank_top_n=RERANK_TOP_N,
+            rerank_accept_threshold=RERANK_ACCEPT_THRESHOLD,
+            rerank_reject_threshold=RERANK_REJECT_THRESHOLD,
+        )
 
-    # Create and compile workflow
-    app = create_workflow(nodes)
+        # Create and compile workflow, timing every node
+        app = create_workflow(instrument_nodes(nodes))
 
-    return app
+        # Answer repeated or paraphrased questions without running the graph
+        if ANSWER_CACHE_ENABLED:
+            answer_cache = SemanticAnswerCache(
+                embeddings,
+                similarity_threshold=ANSWER_CACHE_THRESHOLD,
+                max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+                fingerprint_fn=lambda: get_collection_fingerprint(vectorstore),
+            )
+            app = CachedWorkflow(app, answer_cache)
 
+        # Outermost, so cache hits are profiled too
+        app = ProfiledWorkflow(app, log_queries=METRICS_LOG_QUERIES)
+
+    timings["total"] = round(time.perf_counter() - started, 3)
+    logger.info("RAG system ready in %.2fs", timings["total"])
+    return app
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
     app = setup_rag_system()
 
 
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules import each other from src, as the app and scripts do
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(project_root, 'src'))
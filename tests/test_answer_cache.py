@@ -0,0 +1,54 @@
+import time
+
+from agents.cache import SemanticAnswerCache
+from data_preprocess.hashing_embeddings import HashingEmbeddings
+
+
+class _LockCheckingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(64)
+        self.cache = None
+        self.embedded_under_lock = False
+
+    def embed_query(self, text):
+        if self.cache is not None and self.cache._lock.locked():
+            self.embedded_under_lock = True
+        return super().embed_query(text)
+
+
+def _result(answer):
+    return {"generation": answer, "documents": ["doc"]}
+
+
+def test_lookup_embeds_without_holding_the_lock(tmp_path):
+    embeddings = _LockCheckingEmbeddings()
+    cache = SemanticAnswerCache(embeddings, str(tmp_path / "cache.pkl"), similarity_threshold=0.99)
+    embeddings.cache = cache
+    cache.store("What is access control?", _result("AC"))
+
+    assert cache.lookup("what is  access control?")["generation"] == "AC"
+    assert cache.lookup("What is access control")["generation"] == "AC"
+    assert cache.lookup("How are audit logs reviewed?") is None
+    assert not embeddings.embedded_under_lock
+
+
+def test_stores_are_saved_together_in_the_background(tmp_path):
+    path = tmp_path / "cache.pkl"
+    cache = SemanticAnswerCache(HashingEmbeddings(64), str(path), save_delay=0.05)
+    for i in range(5):
+        cache.store(f"question {i}", _result(str(i)))
+    assert not path.exists()
+
+    time.sleep(0.2)
+    reloaded = SemanticAnswerCache(HashingEmbeddings(64), str(path))
+    assert [reloaded.lookup(f"question {i}")["generation"] for i in range(5)] == [str(i) for i in range(5)]
+
+
+def test_flush_writes_pending_entries_immediately(tmp_path):
+    path = tmp_path / "cache.pkl"
+    cache = SemanticAnswerCache(HashingEmbeddings(64), str(path), save_delay=60)
+    cache.store("question", _result("answer"))
+    cache.flush()
+
+    assert SemanticAnswerCache(HashingEmbeddings(64), str(path)).lookup("question")["generation"] == "answer"
+    assert cache._save_timer is None
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from api import create_api
+
+
+class _FakeWorkflow:
+    async def ainvoke(self, inputs):
+        return {"generation": inputs["question"].upper(), "documents": []}
+
+    async def astream(self, inputs, stream_mode=None):
+        for token in inputs["question"].split():
+            yield "custom", {"token": token}
+        yield "values", {"generation": inputs["question"].upper(), "documents": []}
+
+
+def _health(api):
+    return TestClient(api).get("/health").json()
+
+
+def test_stream_returns_tokens_then_result_and_frees_its_slot():
+    api = create_api(_FakeWorkflow(), max_inflight=1, max_queue=0)
+    client = TestClient(api)
+
+    response = client.post("/query/stream", json={"question": "what is xss"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert [line["token"] for line in lines[:-1]] == ["what", "is", "xss"]
+    assert lines[-1]["final"]["answer"] == "WHAT IS XSS"
+    health = _health(api)
+    assert (health["active"], health["waiting"]) == (0, 0)
+
+
+def test_stream_frees_its_slot_when_the_client_disconnects_before_the_body():
+    api = create_api(_FakeWorkflow(), max_inflight=1, max_queue=0)
+    body = json.dumps({"question": "what is xss"}).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.4"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/query/stream",
+        "raw_path": b"/query/stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        # The connection is gone before the response starts
+        raise OSError("client disconnected")
+
+    async def call():
+        try:
+            await api(scope, receive, send)
+        except Exception:
+            pass
+
+    asyncio.run(call())
+    health = _health(api)
+    assert (health["active"], health["waiting"]) == (0, 0)
+
+
+def test_query_is_rejected_when_the_queue_is_full():
+    api = create_api(_FakeWorkflow(), max_inflight=0, max_queue=0)
+    response = TestClient(api).post("/query", json={"question": "what is xss"})
+    assert response.status_code == 503
@@ -0,0 +1,171 @@
+import asyncio
+import csv
+import os
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from agents.batch_qa import BatchQuestionAnswerer, ResultWriter
+from agents.context import ContextBuilder, create_token_counter
+from agents.graders import BatchGradeDocuments, GradeDocuments
+from data_preprocess.embedding_cache import CachedEmbeddings
+from data_preprocess.hashing_embeddings import HashingEmbeddings
+
+
+class _ListWriter:
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+
+def _doc(i):
+    return Document(page_content=f"Chunk {i} about access control", metadata={"source": "a.pdf", "page": i, "chunk_id": f"c:{i}"})
+
+
+def _answerer(**kwargs):
+    async def answer(inputs):
+        return f"answer to {inputs['question']}"
+
+    return BatchQuestionAnswerer(
+        retriever=None,
+        embeddings=None,
+        rag_chain=RunnableLambda(lambda inputs: None, afunc=answer),
+        context_builder=ContextBuilder(create_token_counter(), 2000),
+        **kwargs,
+    )
+
+
+def _run(answerer, rows, retrieved):
+    writer = _ListWriter()
+    asyncio.run(answerer.answer_rows(rows, retrieved, writer))
+    return {row["id"]: row for row in writer.rows}
+
+
+def test_batch_grader_grades_each_question_in_one_call():
+    calls = []
+
+    async def grade_all(inputs):
+        calls.append((inputs["question"], len(inputs["documents"])))
+        # Even-numbered pages are relevant; the last document gets no verdict
+        return BatchGradeDocuments(
+            verdicts=[
+                {"index": i, "binary_score": "yes" if doc.metadata["page"] % 2 == 0 else "no"}
+                for i, doc in enumerate(inputs["documents"][:-1])
+            ]
+        )
+
+    per_document = []
+
+    async def grade_one(inputs):
+        per_document.append(inputs["document"].metadata["page"])
+        return GradeDocuments(binary_score="yes")
+
+    answerer = _answerer(
+        retrieval_grader=RunnableLambda(lambda inputs: None, afunc=grade_one),
+        batch_grader=RunnableLambda(lambda inputs: None, afunc=grade_all),
+    )
+    docs = [_doc(i) for i in range(4)]
+    rows = [{"id": "1", "question": "q1"}, {"id": "2", "question": "q2"}]
+
+    results = _run(answerer, rows, [(docs, [0.5] * 4), (docs[:2], [0.5] * 2)])
+
+    assert sorted(calls) == [("q1", 4), ("q2", 2)]
+    # Documents left without a verdict fall back to the per-document grader
+    assert sorted(per_document) == [1, 3]
+    assert [source["page"] for source in results["1"]["sources"]] == [0, 2, 3]
+    assert [source["page"] for source in results["2"]["sources"]] == [0, 1]
+    assert answerer.stats["grader_calls"] == 4
+
+
+def test_prefiltered_and_repeated_pairs_skip_the_grader():
+    graded = []
+
+    async def grade_one(inputs):
+        graded.append((inputs["question"], inputs["document"].metadata["page"]))
+        return GradeDocuments(binary_score="yes")
+
+    answerer = _answerer(
+        retrieval_grader=RunnableLambda(lambda inputs: None, afunc=grade_one),
+        accept_threshold=0.9,
+        reject_threshold=0.1,
+    )
+    docs = [_doc(i) for i in range(3)]
+    rows = [{"id": "1", "question": "q"}, {"id": "2", "question": "q"}]
+
+    results = _run(answerer, rows, [(docs, [0.95, 0.5, 0.05])] * 2)
+
+    assert graded == [("q", 1)]
+    assert results["1"]["relevant_chunks"] == results["2"]["relevant_chunks"] == 2
+    assert answerer.stats["prefiltered_pairs"] == 4
+    assert answerer.stats["unique_pairs"] == 1
+
+
+def test_questions_are_embedded_as_queries(tmp_path):
+    embeddings = CachedEmbeddings(HashingEmbeddings(16), "hashing", str(tmp_path))
+    answerer = _answerer(retrieval_grader=None)
+    answerer.embeddings = embeddings
+
+    vectors = answerer._embed_questions(["q1", "q2", "q1"])
+
+    assert vectors[0] == vectors[2] == embeddings.embed_query("q1")
+    assert not os.path.exists(os.path.join(embeddings.cache_dir, "keys.txt"))
+
+
+def _answered(row_id):
+    return {"id": row_id, "question": f"q{row_id}", "answer": "a", "sources": [], "retrieved_chunks": 1, "relevant_chunks": 0}
+
+
+def _csv_ids(path):
+    with open(path, newline="") as f:
+        return [row["id"] for row in csv.DictReader(f)]
+
+
+def test_result_writer_resumes_from_the_last_checkpoint(tmp_path):
+    path = str(tmp_path / "answers.csv")
+    writer = ResultWriter(path, ["id", "question"])
+    writer.write(_answered("1"))
+    writer.write(_answered("2"))
+    writer.checkpoint()
+    # Written but never checkpointed, as when a run is interrupted
+    writer.write(_answered("3"))
+    writer.close()
+
+    resumed = ResultWriter(path, ["id", "question"])
+    assert resumed.done == {"1", "2"}
+    resumed.write(_answered("3"))
+    resumed.checkpoint()
+    resumed.close()
+
+    assert _csv_ids(path) == ["1", "2", "3"]
+
+
+def test_result_writer_refuses_a_missing_or_truncated_output(tmp_path):
+    path = str(tmp_path / "answers.jsonl")
+    writer = ResultWriter(path, ["id", "question"])
+    writer.write(_answered("1"))
+    writer.checkpoint()
+    writer.close()
+
+    with open(path, "r+") as f:
+        f.truncate(5)
+    with pytest.raises(ValueError):
+        ResultWriter(path, ["id", "question"])
+
+    os.remove(path)
+    with pytest.raises(ValueError):
+        ResultWriter(path, ["id", "question"])
+    assert not os.path.exists(path)
+
+    restarted = ResultWriter(path, ["id", "question"], restart=True)
+    assert restarted.done == set()
+    restarted.close()
+
+
+def test_result_writer_does_not_overwrite_an_output_without_checkpoint(tmp_path):
+    path = tmp_path / "answers.csv"
+    path.write_text("id,question\n1,q\n")
+    with pytest.raises(FileExistsError):
+        ResultWriter(str(path), ["id", "question"])
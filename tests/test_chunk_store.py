@@ -0,0 +1,83 @@
+import os
+
+from langchain_core.documents import Document
+
+from data_preprocess.chunk_store import ChunkSequence, ChunkStore, column_values, document_texts
+
+
+def _chunks():
+    return [
+        Document(
+            page_content=text,
+            metadata={
+                "source": "data/documents/sp800-53.pdf",
+                "page": page,
+                "chunk_id": f"0f3c2a:400-25-pc:{i}",
+                "content_hash": "0f3c2a",
+                **({"title": "Controls"} if i % 2 else {}),
+                **({"ratio": 0.5} if i == 2 else {}),
+            },
+        )
+        for i, (page, text) in enumerate([(1, "Access control"), (1, "Zugriffskontrolle – ü"), (2, ""), (7, "Audit")])
+    ]
+
+
+def test_round_trip(tmp_path):
+    base = str(tmp_path / "splits" / "file")
+    docs = _chunks()
+    ChunkStore.write(base, docs)
+
+    store = ChunkStore.open(base)
+
+    assert len(store) == len(docs)
+    assert list(store) == docs
+    assert store[-1] == docs[-1]
+    assert store[1:3] == docs[1:3]
+
+
+def test_columns_match_document_metadata(tmp_path):
+    base = str(tmp_path / "file")
+    docs = _chunks()
+    ChunkStore.write(base, docs)
+    store = ChunkStore.open(base)
+
+    for key in ["source", "page", "chunk_id", "title", "ratio", "missing"]:
+        assert store.column(key) == [doc.metadata.get(key) for doc in docs]
+    assert store.texts() == [doc.page_content for doc in docs]
+
+
+def test_empty_store(tmp_path):
+    base = str(tmp_path / "empty")
+    ChunkStore.write(base, [])
+    store = ChunkStore.open(base)
+    assert len(store) == 0
+    assert list(store) == []
+
+
+def test_missing_or_mismatched_store_is_not_opened(tmp_path):
+    base = str(tmp_path / "file")
+    assert ChunkStore.open(base) is None
+
+    ChunkStore.write(base, _chunks())
+    with open(base + ".txt", "ab") as f:
+        f.write(b"torn")
+    assert ChunkStore.open(base) is None
+
+    os.remove(base + ".npz")
+    assert ChunkStore.open(base) is None
+
+
+def test_sequence_concatenates_stores_and_lists(tmp_path):
+    base = str(tmp_path / "file")
+    docs = _chunks()
+    ChunkStore.write(base, docs)
+    extra = [Document(page_content="Incident response", metadata={"page": 3})]
+
+    sequence = ChunkSequence([ChunkStore.open(base), [], extra])
+
+    assert len(sequence) == 5
+    assert list(sequence) == docs + extra
+    assert sequence[4] == extra[0]
+    assert sequence[-2] == docs[-1]
+    assert column_values(sequence, "page") == [1, 1, 2, 7, 3]
+    assert document_texts(sequence) == [doc.page_content for doc in docs + extra]
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+from agents.concurrency import ConcurrencyLimiter
+
+
+class _InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.current -= 1
+
+
+def test_limit_shared_by_threads_and_event_loops():
+    limiter = ConcurrencyLimiter(3)
+    in_flight = _InFlight()
+
+    def sync_call():
+        with limiter, in_flight:
+            time.sleep(0.02)
+
+    async def async_call():
+        async with limiter:
+            with in_flight:
+                await asyncio.sleep(0.02)
+
+    async def many_async_calls():
+        await asyncio.gather(*(async_call() for _ in range(6)))
+
+    # Each thread runs its own event loop, like one asyncio.run per question
+    threads = [threading.Thread(target=sync_call) for _ in range(6)]
+    threads += [threading.Thread(target=asyncio.run, args=(many_async_calls(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert in_flight.peak == 3
+    assert in_flight.current == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = ConcurrencyLimiter(1)
+
+    async def main():
+        async with limiter:
+            waiter = asyncio.ensure_future(limiter.__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+        await asyncio.sleep(0.05)
+        # Both the holder's and the cancelled waiter's slots are free again
+        async with limiter:
+            pass
+        return limiter._semaphore.acquire(blocking=False)
+
+    assert asyncio.run(main())
+
+
+def test_wrap_limits_ainvoke():
+    from langchain_core.runnables import RunnableLambda
+
+    limiter = ConcurrencyLimiter(2)
+    in_flight = _InFlight()
+
+    async def call(value):
+        with in_flight:
+            await asyncio.sleep(0.01)
+        return value * 2
+
+    wrapped = limiter.wrap(RunnableLambda(lambda value: value * 2, afunc=call))
+
+    async def main():
+        return await asyncio.gather(*(wrapped.ainvoke(i) for i in range(8)))
+
+    assert asyncio.run(main()) == [i * 2 for i in range(8)]
+    assert in_flight.peak == 2
+
+
+def test_micro_batched_grader_holds_slots_only_for_grading_calls():
+    from langchain_core.runnables import RunnableLambda
+
+    from agents.batching import micro_batched_grader
+
+    limiter = ConcurrencyLimiter(2)
+    in_flight = _InFlight()
+
+    def grade(inputs):
+        with in_flight:
+            time.sleep(0.01)
+        return inputs["document"]
+
+    batched = micro_batched_grader(RunnableLambda(grade), max_batch_size=8, max_wait_ms=50, max_concurrency=8, limiter=limiter)
+    assert limiter.wrap(batched) is batched
+
+    results = [None] * 6
+
+    def call(i):
+        results[i] = batched.invoke({"question": "q", "document": str(i)})
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [str(i) for i in range(6)]
+    assert in_flight.peak == 2
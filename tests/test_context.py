@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+
+from agents.context import ContextBuilder, create_token_counter
+
+
+class _ModelWithoutTokenizer:
+    custom_get_token_ids = None
+
+    def get_num_tokens(self, text):
+        raise AssertionError("inherited get_num_tokens must not be used")
+
+
+class _ModelWithTokenizer:
+    @staticmethod
+    def custom_get_token_ids(text):
+        return text.split()
+
+
+def test_counter_estimates_with_a_margin_instead_of_the_inherited_tokenizer():
+    count_tokens = create_token_counter(_ModelWithoutTokenizer())
+    assert count_tokens("x" * 400) == 120
+    assert count_tokens("") == 0
+
+
+def test_counter_uses_an_explicitly_configured_tokenizer():
+    assert create_token_counter(_ModelWithTokenizer())("one two three") == 3
+
+
+def test_context_stays_within_the_budget():
+    docs = [Document(page_content="word " * 200, metadata={"source": f"{name}.pdf", "page": 1}) for name in "abc"]
+    builder = ContextBuilder(create_token_counter(), max_tokens=300)
+    context, used, tokens = builder.build(docs, [0.9, 0.8, 0.7])
+    assert tokens <= 300
+    assert used
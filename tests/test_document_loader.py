@@ -0,0 +1,25 @@
+from types import SimpleNamespace
+
+from data_preprocess.document_loader import _pdf_metadata
+
+
+def test_pdf_metadata_is_normalized_like_pypdfloader():
+    reader = SimpleNamespace(
+        metadata={
+            "/Producer": " Word ",
+            "/CreationDate": "D:20120806101118-04'00'",
+            "/ModDate": "yesterday",
+            "/Pages": 3,
+        },
+        pages=[None] * 3,
+    )
+
+    assert _pdf_metadata(reader, "a.pdf") == {
+        "producer": "Word",
+        "creator": "PyPDF",
+        "creationdate": "2012-08-06T10:11:18-04:00",
+        "moddate": "yesterday",
+        "pages": 3,
+        "source": "a.pdf",
+        "total_pages": 3,
+    }
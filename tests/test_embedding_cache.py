@@ -0,0 +1,73 @@
+import os
+
+from data_preprocess.embedding_cache import CachedEmbeddings
+
+
+class _CountingEmbeddings:
+    def __init__(self):
+        self.documents = 0
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        self.documents += len(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return [float(len(text)), 2.0]
+
+
+def test_documents_are_encoded_once_and_shared_through_disk(tmp_path):
+    underlying = _CountingEmbeddings()
+    cache = CachedEmbeddings(underlying, "model", str(tmp_path))
+
+    assert cache.embed_documents(["a", "bb", "a"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    reopened = CachedEmbeddings(_CountingEmbeddings(), "model", str(tmp_path))
+    assert reopened.embed_documents(["bb", "a"]) == [[2.0, 1.0], [1.0, 1.0]]
+    assert underlying.documents == 2
+    assert reopened.underlying_embeddings.documents == 0
+
+
+def test_queries_stay_in_a_bounded_memory_cache(tmp_path):
+    underlying = _CountingEmbeddings()
+    cache = CachedEmbeddings(underlying, "model", str(tmp_path), max_cached_queries=2)
+
+    assert cache.embed_query("x") == [1.0, 2.0]
+    assert cache.embed_queries(["x", "yy", "zzz"]) == [[1.0, 2.0], [2.0, 2.0], [3.0, 2.0]]
+    assert underlying.queries == 3
+
+    # "x" was evicted as the least recently used of three queries
+    cache.embed_query("zzz")
+    assert underlying.queries == 3
+    cache.embed_query("x")
+    assert underlying.queries == 4
+    assert len(cache._queries) == 2
+    assert not os.path.exists(os.path.join(cache.cache_dir, "keys.txt"))
+
+
+def test_torn_append_is_dropped_before_the_next_one(tmp_path):
+    cache = CachedEmbeddings(_CountingEmbeddings(), "model", str(tmp_path))
+    cache.embed_documents(["a", "bb"])
+    vectors_file = os.path.join(cache.cache_dir, "vectors.f32")
+    # A crash mid-append leaves a partial row without a key
+    with open(vectors_file, "ab") as f:
+        f.write(b"\0" * 5)
+
+    reopened = CachedEmbeddings(_CountingEmbeddings(), "model", str(tmp_path))
+    assert reopened.embed_documents(["ccc", "a", "bb"]) == [[3.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+    assert os.path.getsize(vectors_file) == 3 * 2 * 4
+
+
+def test_keys_without_vectors_are_ignored(tmp_path):
+    cache = CachedEmbeddings(_CountingEmbeddings(), "model", str(tmp_path))
+    cache.embed_documents(["a", "bb"])
+    vectors_file = os.path.join(cache.cache_dir, "vectors.f32")
+    with open(vectors_file, "r+b") as f:
+        f.truncate(2 * 4)
+
+    underlying = _CountingEmbeddings()
+    reopened = CachedEmbeddings(underlying, "model", str(tmp_path))
+    assert reopened.embed_documents(["a"]) == [[1.0, 1.0]]
+    assert underlying.documents == 0
+    assert reopened.embed_documents(["bb"]) == [[2.0, 1.0]]
+    assert underlying.documents == 1
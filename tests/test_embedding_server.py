@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from data_preprocess.embedding_pipeline import _encoder
+from data_preprocess.hashing_embeddings import HashingEmbeddings
+from embedding_server import EmbeddingServer, EmbeddingServerClient, load_authkey
+
+
+class _NoFallback:
+    def embed_documents(self, texts):
+        raise AssertionError("fell back to in-process encoding")
+
+    def embed_query(self, text):
+        raise AssertionError("fell back to in-process encoding")
+
+
+@pytest.fixture
+def server_address(tmp_path):
+    address = str(tmp_path / "server" / "server.sock")
+    server = EmbeddingServer(HashingEmbeddings(16), address, load_authkey(address, create=True))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for _ in range(100):
+        if os.path.exists(address):
+            break
+        time.sleep(0.01)
+    return address
+
+
+def test_socket_and_generated_key_are_private(server_address):
+    directory = os.path.dirname(server_address)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert os.stat(server_address).st_mode & 0o777 == 0o600
+    assert os.stat(os.path.join(directory, "authkey")).st_mode & 0o777 == 0o600
+
+
+def test_client_encodes_through_the_server(server_address):
+    client = EmbeddingServerClient(server_address, "", fallback=_NoFallback())
+    local = HashingEmbeddings(16)
+
+    served = client.embed_documents(["access control", "audit"])
+    for vector, expected in zip(served, local.embed_documents(["access control", "audit"])):
+        assert vector == pytest.approx(expected)
+    assert client.embed_query("access control") == pytest.approx(local.embed_query("access control"))
+
+
+def test_client_with_the_wrong_key_falls_back(server_address):
+    client = EmbeddingServerClient(server_address, "wrong", fallback=HashingEmbeddings(16))
+    assert len(client.embed_query("audit")) == 16
+    assert client._unavailable_until > 0
+
+
+def test_tcp_address_has_no_default_key():
+    assert load_authkey("127.0.0.1:9000") is None
+    assert load_authkey("127.0.0.1:9000", "secret") == b"secret"
+
+
+class _PoolClient:
+    def __init__(self):
+        self.encoded = []
+
+    def start_multi_process_pool(self, target_devices):
+        return target_devices
+
+    def encode_multi_process(self, texts, pool):
+        self.encoded.extend(texts)
+        return np.array([[float(len(text)), 0.0] for text in texts], dtype=np.float32)
+
+    def stop_multi_process_pool(self, pool):
+        pass
+
+
+class _PoolModel(_NoFallback):
+    def __init__(self):
+        self._client = _PoolClient()
+
+
+def test_worker_pool_encodes_with_the_fallback_when_the_server_is_down(tmp_path):
+    model = _PoolModel()
+    client = EmbeddingServerClient(str(tmp_path / "missing.sock"), "", fallback=model)
+
+    with _encoder(client, workers=2) as encode:
+        assert encode(["ab", "abc"]) == [[2.0, 0.0], [3.0, 0.0]]
+    assert model._client.encoded == ["ab", "abc"]
+
+
+def test_worker_pool_is_not_started_while_the_server_is_up(server_address):
+    model = _PoolModel()
+    client = EmbeddingServerClient(server_address, "", fallback=model)
+
+    with _encoder(client, workers=2) as encode:
+        assert len(encode(["audit"])[0]) == 16
+    assert model._client.encoded == []
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from agents.graders import (
+    BatchGradeDocuments,
+    GradeDocuments,
+    create_batch_document_grader,
+    create_document_grader,
+)
+from agents.nodes import create_workflow_nodes
+
+
+class _FakeStructuredLLM:
+    """Structured-output LLM that answers from the rendered prompt.
+
+    Batched calls return ``batch_verdicts`` as (index, score) pairs, or raise
+    it if it is an exception. Per-document calls say "yes" for documents
+    about access control.
+    """
+
+    def __init__(self, batch_verdicts=()):
+        self.batch_verdicts = batch_verdicts
+        self.prompts = {"batch": [], "single": []}
+
+    def with_structured_output(self, schema):
+        def call(prompt):
+            text = prompt.to_string()
+            if schema is BatchGradeDocuments:
+                self.prompts["batch"].append(text)
+                if isinstance(self.batch_verdicts, Exception):
+                    raise self.batch_verdicts
+                return BatchGradeDocuments(
+                    verdicts=[{"index": i, "binary_score": score} for i, score in self.batch_verdicts]
+                )
+            self.prompts["single"].append(text)
+            return GradeDocuments(binary_score="yes" if "Access control" in text else "no")
+
+        return RunnableLambda(call)
+
+
+DOCS = [
+    Document(page_content="Access control policy", metadata={"chunk_id": "0"}),
+    Document(page_content="Weather report", metadata={"chunk_id": "1"}),
+    Document(page_content="Access control enforcement", metadata={"chunk_id": "2"}),
+    Document(page_content="Recipe for soup", metadata={"chunk_id": "3"}),
+]
+
+
+def _grade(llm, is_async=False):
+    nodes = create_workflow_nodes(
+        retriever=None,
+        retrieval_grader=create_document_grader(llm),
+        rag_chain=None,
+        batch_grader=create_batch_document_grader(llm),
+        grading_mode="batch",
+    )
+    state = {"question": "What is access control?", "documents": DOCS, "scores": None}
+    if is_async:
+        return asyncio.run(nodes["agrade_documents"](state))
+    return nodes["grade_documents"](state)
+
+
+def test_batch_grader_numbers_the_documents_in_one_prompt():
+    llm = _FakeStructuredLLM([(0, "yes"), (1, "no")])
+
+    result = create_batch_document_grader(llm).invoke({"question": "q", "documents": DOCS[:2]})
+
+    assert [(v.index, v.binary_score) for v in result.verdicts] == [(0, "yes"), (1, "no")]
+    assert len(llm.prompts["batch"]) == 1
+    assert "[0] Access control policy" in llm.prompts["batch"][0]
+    assert "[1] Weather report" in llm.prompts["batch"][0]
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_all_verdicts_present_needs_a_single_call(is_async):
+    llm = _FakeStructuredLLM([(0, "yes"), (1, "no"), (2, "yes"), (3, "no")])
+
+    update = _grade(llm, is_async)
+
+    assert [doc.metadata["chunk_id"] for doc in update["documents"]] == ["0", "2"]
+    assert update["grading_stats"]["grader_calls"] == 1
+    assert llm.prompts["single"] == []
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_missing_and_out_of_range_verdicts_are_graded_one_by_one(is_async):
+    # No verdict for 2 and 3; index 7 does not exist; the later verdict for 1 wins
+    llm = _FakeStructuredLLM([(0, "yes"), (1, "yes"), (7, "yes"), (1, "no")])
+
+    update = _grade(llm, is_async)
+
+    assert [doc.metadata["chunk_id"] for doc in update["documents"]] == ["0", "2"]
+    assert len(llm.prompts["single"]) == 2
+    assert update["grading_stats"]["grader_calls"] == 3
+    assert update["grading_stats"]["llm_graded"] == 4
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_failed_batch_call_falls_back_to_per_document_grading(is_async):
+    llm = _FakeStructuredLLM(ValueError("not valid JSON"))
+
+    update = _grade(llm, is_async)
+
+    assert [doc.metadata["chunk_id"] for doc in update["documents"]] == ["0", "2"]
+    assert len(llm.prompts["batch"]) == 1
+    assert len(llm.prompts["single"]) == 4
+    assert update["grading_stats"]["grader_calls"] == 5
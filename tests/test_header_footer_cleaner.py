@@ -0,0 +1,38 @@
+from langchain_core.documents import Document
+
+from data_preprocess.header_footer_cleaner import _band_key, clean_page_headers_footers
+
+
+TOPICS = ["Access control", "Audit logging", "Incident response", "Risk assessment", "Media protection"]
+
+
+def _page(number, body):
+    content = f"NIST SP 800-53 Rev. 5\n\n{body}\n\nPage {number}"
+    return Document(page_content=content, metadata={"source": "sp800-53.pdf", "page": number})
+
+
+def test_running_header_and_footer_are_removed_and_paragraphs_kept():
+    bodies = [f"{topic} policy.\n\n{topic} procedures are reviewed." for topic in TOPICS]
+    pages = [_page(i, body) for i, body in enumerate(bodies, start=1)]
+
+    cleaned = clean_page_headers_footers(pages)
+
+    assert [doc.page_content for doc in cleaned] == bodies
+    assert cleaned[0].metadata == pages[0].metadata
+    cleaned[0].metadata["chunk_id"] = "x"
+    assert "chunk_id" not in pages[0].metadata
+
+
+def test_pages_without_bands_are_returned_as_is():
+    pages = [
+        Document(page_content=f"{topic}\nControls for {topic.lower()}\nSee the {topic} guide", metadata={"source": "a.pdf"})
+        for topic in TOPICS
+    ]
+    assert clean_page_headers_footers(pages) == pages
+
+
+def test_only_real_roman_numerals_count_as_page_numbers():
+    for numeral in ["i", "iv", "ix", "xiv", "xl", "lxxxviii", "xc", "cxcix"]:
+        assert _band_key(numeral) == "#"
+    for word in ["civil", "ill", "lid", "vix", "iiii", "cc civil"]:
+        assert _band_key(word) != "#"
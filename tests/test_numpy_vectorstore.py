@@ -0,0 +1,96 @@
+import os
+
+import numpy as np
+import pytest
+
+from data_preprocess.numpy_vectorstore import NumpyCollection
+
+
+def _vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def _filled(path, count=40, **kwargs):
+    collection = NumpyCollection(str(path), **kwargs)
+    vectors = _vectors(count)
+    collection.upsert(
+        ids=[f"chunk-{i}" for i in range(count)],
+        embeddings=vectors.tolist(),
+        documents=[f"text {i}" for i in range(count)],
+        metadatas=[{"source": "a.pdf" if i % 2 else "b.pdf", "page": i} for i in range(count)],
+    )
+    return collection, vectors
+
+
+def test_defaults_to_float32(tmp_path):
+    assert NumpyCollection(str(tmp_path)).quantization == "float32"
+
+
+def test_query_finds_each_row_first(tmp_path):
+    collection, vectors = _filled(tmp_path)
+
+    result = collection.query(query_embeddings=vectors[:5].tolist(), n_results=3)
+
+    assert [ids[0] for ids in result["ids"]] == [f"chunk-{i}" for i in range(5)]
+    assert result["documents"][0][0] == "text 0"
+    assert result["metadatas"][0][0] == {"source": "b.pdf", "page": 0}
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+
+
+def test_upsert_update_delete_survive_reopening(tmp_path):
+    collection, vectors = _filled(tmp_path)
+    collection.upsert(ids=["chunk-1"], embeddings=[vectors[2].tolist()], documents=["replaced"], metadatas=[{"page": 99}])
+    collection.update(ids=["chunk-3"], metadatas=[{"title": "Audit"}])
+    collection.delete(ids=["chunk-0"])
+    collection.delete(where={"source": "b.pdf"})
+    collection.flush()
+
+    reopened = NumpyCollection(str(tmp_path))
+
+    assert reopened.count() == 20
+    assert reopened.get(ids=["chunk-0", "chunk-2"])["ids"] == []
+    got = reopened.get(ids=["chunk-1", "chunk-3"], include=["documents", "metadatas", "embeddings"])
+    assert got["documents"] == ["replaced", "text 3"]
+    assert got["metadatas"] == [{"page": 99}, {"source": "a.pdf", "page": 3, "title": "Audit"}]
+    expected = vectors[2] / np.linalg.norm(vectors[2])
+    assert got["embeddings"][0] == pytest.approx(expected.tolist(), abs=1e-6)
+
+
+def test_quantized_index_ranks_like_float32(tmp_path):
+    exact, vectors = _filled(tmp_path / "exact")
+    quantized, _ = _filled(tmp_path / "int8", quantization="int8")
+    queries = _vectors(5, seed=1).tolist()
+
+    assert [ids[0] for ids in quantized.query(query_embeddings=queries, n_results=1)["ids"]] == [
+        ids[0] for ids in exact.query(query_embeddings=queries, n_results=1)["ids"]
+    ]
+
+
+def test_ivf_search_matches_exact_search_when_probing_every_list(tmp_path):
+    exact, _ = _filled(tmp_path / "exact", count=200)
+    ivf, _ = _filled(tmp_path / "ivf", count=200, ivf_lists=4, ivf_probe=4)
+    ivf.flush()
+    queries = _vectors(5, seed=2).tolist()
+
+    assert ivf._ivf is not None
+    assert ivf.query(query_embeddings=queries, n_results=5)["ids"] == exact.query(
+        query_embeddings=queries, n_results=5
+    )["ids"]
+
+
+def test_previous_version_is_kept_for_concurrent_readers(tmp_path):
+    collection, vectors = _filled(tmp_path)
+    collection.flush()
+    with open(collection.data_file) as f:
+        first = f.read().strip()
+
+    collection.upsert(ids=["chunk-new"], embeddings=[vectors[0].tolist()], documents=["new"])
+    collection.flush()
+
+    # A reader that read CURRENT just before the save can still open it
+    assert os.path.isdir(os.path.join(str(tmp_path), first))
+    assert NumpyCollection(str(tmp_path)).count() == 41
+
+    collection.upsert(ids=["chunk-newer"], embeddings=[vectors[1].tolist()], documents=["newer"])
+    collection.flush()
+    assert not os.path.exists(os.path.join(str(tmp_path), first))
@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from agents.graders import GradeDocuments
+from agents.nodes import create_workflow_nodes
+from data_preprocess.hybrid_retriever import distance_to_similarity
+
+
+def _docs(count):
+    return [Document(page_content=f"Chunk {i}", metadata={"chunk_id": str(i)}) for i in range(count)]
+
+
+def _grade(scores, score_source="similarity", retriever=None, count=None, **kwargs):
+    graded = []
+
+    def grade(inputs):
+        graded.append(inputs["document"].metadata["chunk_id"])
+        return GradeDocuments(binary_score="yes")
+
+    nodes = create_workflow_nodes(
+        retriever=retriever,
+        retrieval_grader=RunnableLambda(grade),
+        rag_chain=None,
+        grading_mode="sequential",
+        **kwargs,
+    )
+    documents = _docs(len(scores) if count is None else count)
+    state = {"question": "q", "documents": documents, "scores": scores, "score_source": score_source}
+    update = nodes["grade_documents"](state)
+    return [doc.metadata["chunk_id"] for doc in update["documents"]], graded, update["grading_stats"]
+
+
+def test_scores_in_the_bands_skip_the_grader():
+    kept, graded, stats = _grade([0.9, 0.8, 0.5, 0.2, 0.1, None], accept_threshold=0.8, reject_threshold=0.2)
+
+    # Both thresholds are inclusive; documents without a score are ambiguous
+    assert kept == ["0", "1", "2", "5"]
+    assert graded == ["2", "5"]
+    assert (stats["auto_accepted"], stats["auto_rejected"], stats["llm_graded"]) == (2, 2, 2)
+    assert stats["llm_calls_saved"] == 4
+
+
+def test_disabled_thresholds_grade_everything():
+    kept, graded, stats = _grade([0.99, 0.01])
+
+    assert kept == graded == ["0", "1"]
+    assert stats["llm_calls_saved"] == 0
+
+
+def test_one_sided_and_mismatched_scores():
+    kept, graded, _ = _grade([0.99, 0.01], reject_threshold=0.2)
+    assert (kept, graded) == (["0"], ["0"])
+
+    # Scores that do not line up with the documents are not trusted
+    kept, graded, _ = _grade([0.99], count=2, accept_threshold=0.5)
+    assert kept == graded == ["0", "1"]
+
+
+def test_rerank_scores_use_the_rerank_thresholds():
+    kept, graded, _ = _grade(
+        [0.95, 0.5, 0.01],
+        score_source="rerank",
+        accept_threshold=0.4,
+        reject_threshold=0.4,
+        rerank_accept_threshold=0.9,
+        rerank_reject_threshold=0.05,
+    )
+    assert kept == ["0", "1"]
+    assert graded == ["1"]
+
+
+@pytest.mark.parametrize(
+    "space, distance, similarity",
+    [(None, 0.0, 1.0), ("l2", 0.4, 0.8), ("l2", 2.0, 0.0), ("cosine", 0.25, 0.75), ("ip", 1.5, -0.5)],
+)
+def test_distance_to_similarity(space, distance, similarity):
+    metadata = {"hnsw:space": space} if space else None
+    vectorstore = SimpleNamespace(_collection=SimpleNamespace(metadata=metadata))
+    assert distance_to_similarity(vectorstore, distance) == pytest.approx(similarity)
+
+
+def test_retrieved_l2_distances_feed_the_prefilter_as_similarities():
+    documents = _docs(3)
+    vectorstore = SimpleNamespace(
+        _collection=SimpleNamespace(metadata=None),
+        similarity_search_with_score=lambda question, k: list(zip(documents, [0.2, 1.0, 1.8]))[:k],
+    )
+    retriever = SimpleNamespace(vectorstore=vectorstore, search_type="similarity", search_kwargs={"k": 3})
+    nodes = create_workflow_nodes(retriever=retriever, retrieval_grader=None, rag_chain=None)
+
+    update = nodes["retrieve"]({"question": "q"})
+
+    assert update["scores"] == pytest.approx([0.9, 0.5, 0.1])
+    assert update["score_source"] == "similarity"